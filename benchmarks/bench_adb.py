@@ -0,0 +1,82 @@
+"""对比每条交易启动一次 adb 与复用一个 adb shell 会话的吞吐量
+
+使用 test/fake_adb 模拟 adb，FAKE_ADB_STARTUP 模拟启动 adb 的耗时。
+
+运行：python -m benchmarks.bench_adb
+"""
+
+import asyncio
+import os
+import time
+
+from billing.adb import AdbSession
+from billing.const import TransactionType
+from billing.const import TransactonFlag
+from billing.qianji.qianji import QianjiTransaction
+
+
+FAKE_ADB = os.path.join(
+    os.path.dirname(__file__), os.pardir, "test", "fake_adb", "adb"
+)
+COUNT = 200
+BATCH_SIZE = 20
+# 真机上启动一次 adb 并建立连接通常要上百毫秒
+STARTUP_SECONDS = "0.1"
+
+
+def _transactions() -> list[QianjiTransaction]:
+    return [
+        QianjiTransaction(
+            1700000000 + i,
+            "吃饭",
+            TransactionType.Expense,
+            13.9,
+            "微信",
+            "",
+            TransactonFlag.Empty,
+            f"wechat--麦当劳--麦当劳--[TID:{i}]",
+        )
+        for i in range(COUNT)
+    ]
+
+
+async def per_transaction(transactions: list[QianjiTransaction]) -> None:
+    for t in transactions:
+        process = await asyncio.create_subprocess_exec(
+            FAKE_ADB,
+            "shell",
+            t.dump_to_am_command(),
+            stdout=asyncio.subprocess.DEVNULL,
+        )
+        await process.wait()
+
+
+async def session_batches(transactions: list[QianjiTransaction]) -> None:
+    session = AdbSession([FAKE_ADB, "shell"], pace=0)
+    try:
+        for start in range(0, len(transactions), BATCH_SIZE):
+            batch = transactions[start : start + BATCH_SIZE]
+            await session.send_batch([t.dump_to_am_command() for t in batch])
+    finally:
+        await session.close()
+
+
+def main() -> None:
+    os.environ["FAKE_ADB_STARTUP"] = STARTUP_SECONDS
+    transactions = _transactions()
+
+    begin = time.perf_counter()
+    asyncio.run(per_transaction(transactions))
+    spawn_seconds = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    asyncio.run(session_batches(transactions))
+    session_seconds = time.perf_counter() - begin
+
+    print(f"transactions    {COUNT:>10}")
+    print(f"adb per intent  {COUNT / spawn_seconds:>10.1f} /s")
+    print(f"shell session   {COUNT / session_seconds:>10.1f} /s")
+
+
+if __name__ == "__main__":
+    main()
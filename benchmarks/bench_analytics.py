@@ -0,0 +1,77 @@
+"""对比逐个 QianjiTransaction 累加与 NumPy 分组汇总的耗时
+
+运行：python -m benchmarks.bench_analytics
+"""
+
+import os
+import random
+import tempfile
+import time
+
+from collections import defaultdict
+
+from billing import analytics
+from billing.const import TransactionType
+from billing.const import TransactonFlag
+from billing.const import TranStatus
+from billing.db import check_and_create_database
+from billing.db import insert_transactions
+from billing.db import load_transactions_from_db
+from billing.db import set_db_path
+from billing.exporter import month_key
+from billing.qianji.qianji import QianjiTransaction
+
+
+def loop_pivot(transactions: list[QianjiTransaction]) -> dict:
+    ret: dict = defaultdict(float)
+    for t in transactions:
+        if t.type_ == TransactionType.Expense:
+            ret[(month_key(t.time), t.classify)] += t.dump_to_db()[4]
+    return ret
+
+
+def main() -> None:
+    rng = random.Random(0)
+    # 模拟五年的账单，每年两万条
+    start = 1577808000
+    categories = ["吃饭", "买菜", "打车", "房租", "零食", "工资", "话费"]
+    types = [TransactionType.Expense] * 8 + [TransactionType.Income]
+    transactions = [
+        QianjiTransaction(
+            rng.randrange(start, start + 5 * 365 * 86400),
+            rng.choice(categories),
+            rng.choice(types),
+            rng.randrange(1, 100000) / 100,
+            rng.choice(["微信", "支付宝", "招商银行"]),
+            "",
+            TransactonFlag.Empty,
+            f"wechat--x--x--[TID:{i}]",
+        )
+        for i in range(100000)
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        set_db_path(os.path.join(tmp_dir, "bench.db"))
+        check_and_create_database()
+        insert_transactions(transactions, TranStatus.Raw)
+
+        begin = time.perf_counter()
+        loop_pivot(list(load_transactions_from_db().values()))
+        loop_seconds = time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        columns = analytics.load_columns()
+        load_seconds = time.perf_counter() - begin
+        begin = time.perf_counter()
+        analytics.month_pivot(columns, "classify")
+        analytics.month_pivot(columns, "account")
+        analytics.month_summary(columns)
+        group_seconds = time.perf_counter() - begin
+
+    print(f"rows            {len(transactions):>10}")
+    print(f"loop objects    {loop_seconds * 1e3:>10.1f} ms")
+    print(f"numpy load      {load_seconds * 1e3:>10.1f} ms")
+    print(f"numpy group-bys {group_seconds * 1e3:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""对比 strptime/strftime 与 TimestampCodec 的耗时
+
+运行：python -m benchmarks.bench_time_codec
+"""
+
+import random
+import re
+import timeit
+
+from datetime import datetime
+
+from billing.time_codec import TimestampCodec
+
+
+def strptime_parse(text: str) -> int:
+    pattern = r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$"
+    if not re.match(pattern, text):
+        return 0
+    date_obj = datetime.strptime(text, "%Y-%m-%d %H:%M:%S")
+    return int(date_obj.timestamp())
+
+
+def strftime_format(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp).strftime("%Y/%m/%d %H:%M:%S")
+
+
+def main() -> None:
+    rng = random.Random(0)
+    # 模拟一年的账单：时间集中在少数日期内
+    start = 1672502400
+    timestamps = sorted(
+        rng.randrange(start, start + 365 * 86400) for _ in range(50000)
+    )
+    texts = [strftime_format(ts).replace("/", "-") for ts in timestamps]
+    codec = TimestampCodec("/")
+
+    assert [codec.parse(t) for t in texts] == [
+        strptime_parse(t) for t in texts
+    ]
+    assert [codec.format(ts) for ts in timestamps] == [
+        strftime_format(ts) for ts in timestamps
+    ]
+
+    cases = [
+        ("parse strptime", lambda: [strptime_parse(t) for t in texts]),
+        ("parse codec", lambda: [codec.parse(t) for t in texts]),
+        (
+            "format strftime",
+            lambda: [strftime_format(ts) for ts in timestamps],
+        ),
+        ("format codec", lambda: [codec.format(ts) for ts in timestamps]),
+    ]
+    for name, func in cases:
+        seconds = min(timeit.repeat(func, number=1, repeat=5))
+        print(f"{name:<16}{seconds * 1e9 / len(texts):>10.0f} ns/op")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""对比普通类与 __slots__ + 字符串驻留的 QianjiTransaction 内存占用
+
+运行：python -m benchmarks.bench_transaction_memory
+"""
+
+import gc
+import random
+import re
+import tracemalloc
+
+from typing import Callable
+from typing import Optional
+
+from billing.const import TransactionType
+from billing.const import TransactonFlag
+from billing.qianji.qianji import QianjiTransaction
+
+
+class DictTransaction:
+    """改动前的实现：每个实例都有 __dict__ 和 extra_info 字典"""
+
+    def __init__(
+        self,
+        time: int,
+        classify: str,
+        type_: TransactionType,
+        cost: float,
+        acc_from: str,
+        acc_to: str,
+        flag: TransactonFlag,
+        remark: str = "",
+        extra_info: Optional[dict] = None,
+        tid: Optional[str] = None,
+    ):
+        self._tid = tid if tid else self._get_tid_from_remark(remark)
+        self._time = int(time)
+        self._classify = classify
+        self._type = type_
+        self._cost = round(cost, 2)
+        self._acc_from = acc_from
+        self._acc_to = acc_to
+        self._remark = remark
+        self._flag = flag
+        self._img = ""
+        self.status = 0
+        if extra_info is None:
+            extra_info = {}
+        self._extra_info = extra_info
+
+    def _get_tid_from_remark(self, remark: str) -> str:
+        match = re.search(r"\[TID:(.*?)\]", remark)
+        return match.group(1)  # type: ignore
+
+
+def make_rows(count: int) -> list[list[str]]:
+    """模拟账单中的行，备注各不相同，分类和账户只有少数几种取值"""
+    rng = random.Random(0)
+    categories = ["吃饭", "买菜", "打车", "房租", "零食", "工资", "话费"]
+    accounts = ["微信", "支付宝", "招商银行信用卡", "工商银行"]
+    rows = []
+    for i in range(count):
+        tid = "42000017542023%014d" % i
+        rows.append(
+            [
+                str(1672502400 + i * 60),
+                rng.choice(categories),
+                rng.choice(accounts),
+                f"wechat--麦当劳--麦当劳--[TID:{tid}]",
+            ]
+        )
+    return rows
+
+
+def measure(factory: Callable, rows: list[list[str]]) -> float:
+    """返回每条交易占用的字节数，包括解析出的分类和账户字符串"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    transactions = [
+        factory(
+            int(row[0]),
+            # 重新解码得到与 csv 解析结果一样的新字符串
+            row[1].encode().decode(),
+            TransactionType.Expense,
+            12.5,
+            row[2].encode().decode(),
+            "",
+            TransactonFlag.Empty,
+            row[3],
+        )
+        for row in rows
+    ]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    size = (after - before) / len(transactions)
+    del transactions
+    return size
+
+
+def main() -> None:
+    rows = make_rows(100000)
+    for name, factory in [
+        ("dict + extra_info", DictTransaction),
+        ("slots + intern", QianjiTransaction),
+    ]:
+        print(f"{name:<20}{measure(factory, rows):>10.0f} bytes/transaction")
+
+
+if __name__ == "__main__":
+    main()
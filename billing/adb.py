@@ -0,0 +1,152 @@
+import asyncio
+
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+
+from billing.logger import logger
+
+
+# 每条命令之后输出的结束标记，后面跟命令的退出码
+END_MARKER = "__BILLING_CMD_END__"
+
+
+class CommandResult(NamedTuple):
+    returncode: int
+    output: str
+
+
+class AdbSessionError(ConnectionError):
+    """adb shell 会话断开或超时
+
+    results 是出错之前已经返回结果的命令。unknown 为 True 时，紧接着的
+    下一条命令已经写入会话但没有返回结果，可能已经执行，不能当作失败重发；
+    再往后的命令都没有发送。
+    """
+
+    def __init__(
+        self,
+        message: str,
+        results: Sequence[CommandResult] = (),
+        unknown: bool = False,
+    ) -> None:
+        super().__init__(message)
+        self.results = list(results)
+        self.unknown = unknown
+
+
+def am_start_succeeded(result: CommandResult) -> bool:
+    """am start 找不到 Activity 时退出码仍然是 0，需要检查输出"""
+    if result.returncode != 0:
+        return False
+    return not any(
+        line.startswith("Error") for line in result.output.splitlines()
+    )
+
+
+class AdbSession:
+    """保持一个 adb shell 会话，通过标准输入逐条发送命令
+
+    每条命令后追加 echo 结束标记和退出码，读到标记后才发送下一条；
+    两条命令之间等待 pace 秒，给钱迹留出处理时间。
+    同一时间只有一批命令在会话中执行，会话断开后下一次发送时自动重新连接。
+    """
+
+    def __init__(
+        self,
+        adb_args: Optional[list[str]] = None,
+        pace: float = 0.2,
+        timeout: float = 10.0,
+    ) -> None:
+        self._adb_args = adb_args or ["adb", "shell"]
+        self._pace = pace
+        self._timeout = timeout
+        self._process: Optional[asyncio.subprocess.Process] = None
+        # 一批命令的写入和读取必须连续进行，不能与另一批交错
+        self._lock = asyncio.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    async def _ensure_started(self) -> asyncio.subprocess.Process:
+        if self._process is None or self._process.returncode is not None:
+            logger.debug(" ".join(self._adb_args))
+            self._process = await asyncio.create_subprocess_exec(
+                *self._adb_args,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+            )
+        return self._process
+
+    def _line(self, command: str) -> bytes:
+        return f"{command}; echo {END_MARKER} $?\n".encode("utf-8")
+
+    async def _read_result(
+        self, process: asyncio.subprocess.Process
+    ) -> CommandResult:
+        assert process.stdout is not None
+        output = []
+        while True:
+            line = await asyncio.wait_for(
+                process.stdout.readline(), self._timeout
+            )
+            if not line:
+                raise AdbSessionError("adb shell session closed")
+            text = line.decode("utf-8", "replace").rstrip("\r\n")
+            # 命令的输出没有以换行结尾时，标记会接在同一行后面
+            head, marker, code = text.partition(END_MARKER)
+            if head:
+                output.append(head)
+            if marker:
+                code = code.strip()
+                return CommandResult(
+                    int(code) if code.isdigit() else -1, "\n".join(output)
+                )
+
+    async def send_batch(self, commands: list[str]) -> list[CommandResult]:
+        """依次执行一批命令，返回每条命令的结果
+
+        每条命令返回结果后才发送下一条。会话断开或超时时关闭会话并抛出
+        AdbSessionError，其中标明正在等待结果的命令是否已经写入。
+        """
+        if not commands:
+            return []
+        async with self._lock:
+            return await self._send_locked(commands)
+
+    async def _send_locked(self, commands: list[str]) -> list[CommandResult]:
+        results: list[CommandResult] = []
+        written = False
+        try:
+            process = await self._ensure_started()
+            assert process.stdin is not None
+            for index, command in enumerate(commands):
+                if index and self._pace > 0:
+                    await asyncio.sleep(self._pace)
+                written = True
+                process.stdin.write(self._line(command))
+                await process.stdin.drain()
+                results.append(await self._read_result(process))
+                written = False
+        except (OSError, asyncio.TimeoutError) as e:
+            await self.close()
+            raise AdbSessionError(str(e) or repr(e), results, written) from e
+        for result in results:
+            if not am_start_succeeded(result):
+                logger.error("[adb command failed]%s", result.output)
+        return results
+
+    async def close(self) -> None:
+        process = self._process
+        self._process = None
+        if process is None or process.returncode is not None:
+            return
+        if process.stdin is not None:
+            process.stdin.close()
+        try:
+            await asyncio.wait_for(process.wait(), 1.0)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
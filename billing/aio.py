@@ -0,0 +1,39 @@
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Callable
+from typing import TypeVar
+
+
+T = TypeVar("T")
+
+
+class AsyncIO:
+    """在事件循环之外执行阻塞的数据库和文件操作
+
+    所有数据库读写都提交到同一个专用线程，线程内持有唯一的写连接，
+    写入天然串行；导出、扫描目录、解析账单等文件操作在线程池中执行。
+    """
+
+    def __init__(self, io_workers: int = 4) -> None:
+        self._db_executor = ThreadPoolExecutor(
+            1, thread_name_prefix="billing-db"
+        )
+        self._io_executor = ThreadPoolExecutor(
+            io_workers, thread_name_prefix="billing-io"
+        )
+
+    async def db(self, func: Callable[..., T], *args: Any) -> T:
+        """在数据库线程中执行 func"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._db_executor, func, *args)
+
+    async def io(self, func: Callable[..., T], *args: Any) -> T:
+        """在文件 I/O 线程池中执行 func"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io_executor, func, *args)
+
+    def shutdown(self) -> None:
+        self._io_executor.shutdown()
+        self._db_executor.shutdown()
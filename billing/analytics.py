@@ -0,0 +1,195 @@
+"""基于 NumPy 的收支统计
+
+需要安装可选依赖：pip install billing[analytics]
+"""
+
+from typing import NamedTuple
+from typing import Optional
+
+import numpy as np
+
+from billing.const import TransactionType
+from billing.db import get_connection
+from billing.exporter import month_key
+from billing.exporter import month_range
+
+
+# 交易类型在数组中的编码，与 TransactionType 的定义顺序一致
+TYPE_CODES = {t.value: code for code, t in enumerate(TransactionType)}
+
+
+class TransactionColumns:
+    """按列保存的交易数据，字符串列保存为编码和去重后的名称表"""
+
+    def __init__(
+        self,
+        time: np.ndarray,
+        cost: np.ndarray,
+        type_code: np.ndarray,
+        classify: list[str],
+        acc_from: list[str],
+    ) -> None:
+        self.time = time
+        self.cost = cost
+        self.type_code = type_code
+        self.classify_names, self.classify_code = _encode_strings(classify)
+        self.account_names, self.account_code = _encode_strings(acc_from)
+        self.month_names, self.month_code = _month_codes(time)
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+
+def _encode_strings(values: list[str]) -> tuple[list[str], np.ndarray]:
+    """字符串列编码为整数，名称按字典序排列
+
+    低基数的列用字典编码比 np.unique 对 object 数组排序快得多。
+    """
+    index: dict[str, int] = {}
+    codes = np.fromiter(
+        (index.setdefault(v, len(index)) for v in values),
+        dtype=np.int64,
+        count=len(values),
+    )
+    names = sorted(index)
+    remap = np.empty(len(names), dtype=np.int64)
+    for new_code, name in enumerate(names):
+        remap[index[name]] = new_code
+    return names, remap[codes]
+
+
+def _month_codes(time: np.ndarray) -> tuple[list[str], np.ndarray]:
+    """按本地时间把时间戳分到月份，返回 (YYYY-MM 列表, 每行的月份编码)"""
+    if not len(time):
+        return [], np.zeros(0, dtype=np.int64)
+    year, month = month_key(int(time.min()))
+    last = month_key(int(time.max()))
+    keys = [(year, month)]
+    while keys[-1] != last:
+        year, month = keys[-1]
+        keys.append((year + 1, 1) if month == 12 else (year, month + 1))
+    starts = np.array([month_range(key)[0] for key in keys], dtype=np.int64)
+    codes = np.searchsorted(starts, time, side="right") - 1
+    return ["%04d-%02d" % key for key in keys], codes
+
+
+def load_columns(
+    start: Optional[int] = None, end: Optional[int] = None
+) -> TransactionColumns:
+    """从数据库读取 [start, end) 时间段内统计所需的列"""
+    sql = "SELECT time, classify, type, cost, acc_from FROM transactions"
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append("time >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append("time < ?")
+        params.append(end)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    rows = get_connection().execute(sql, params).fetchall()
+    if rows:
+        times, classify, types, costs, accounts = zip(*rows)
+    else:
+        times, classify, types, costs, accounts = (), (), (), (), ()
+    return TransactionColumns(
+        np.array(times, dtype=np.int64),
+        np.array(costs, dtype=np.float64),
+        np.fromiter(
+            (TYPE_CODES[t] for t in types), dtype=np.int64, count=len(types)
+        ),
+        list(classify),
+        list(accounts),
+    )
+
+
+class Pivot(NamedTuple):
+    """rows × columns 的汇总表"""
+
+    rows: list[str]
+    columns: list[str]
+    values: np.ndarray
+
+
+def _group_sum(
+    month_code: np.ndarray,
+    group_code: np.ndarray,
+    weights: np.ndarray,
+    n_months: int,
+    n_groups: int,
+) -> np.ndarray:
+    flat = month_code * n_groups + group_code
+    sums = np.bincount(flat, weights=weights, minlength=n_months * n_groups)
+    return np.round(sums.reshape(n_months, n_groups), 2)
+
+
+def month_pivot(
+    columns: TransactionColumns,
+    by: str = "classify",
+    type_: TransactionType = TransactionType.Expense,
+) -> Pivot:
+    """某一交易类型按 月份 × 分类 或 月份 × 账户 汇总金额"""
+    if by == "classify":
+        names, codes = columns.classify_names, columns.classify_code
+    elif by == "account":
+        names, codes = columns.account_names, columns.account_code
+    else:
+        raise ValueError(f"unknown group: {by}")
+    mask = columns.type_code == TYPE_CODES[type_.value]
+    values = _group_sum(
+        columns.month_code[mask],
+        codes[mask],
+        columns.cost[mask],
+        len(columns.month_names),
+        len(names),
+    )
+    # 去掉该类型下从未出现过的分类或账户
+    used = np.bincount(codes[mask], minlength=len(names)) > 0
+    return Pivot(
+        columns.month_names,
+        [name for name, keep in zip(names, used) if keep],
+        values[:, used],
+    )
+
+
+SUMMARY_COLUMNS = ["income", "expense", "reimbursement", "net"]
+
+
+def month_summary(columns: TransactionColumns) -> Pivot:
+    """每月收入、支出、报销与净收支
+
+    支出金额在入库时已经扣除了部分退款，报销视为对支出的冲抵，
+    净收支 = 收入 + 报销 - 支出，转账和还款不计入。
+    """
+    order = [
+        TransactionType.Income,
+        TransactionType.Expense,
+        TransactionType.Reimbursement,
+    ]
+    values = _group_sum(
+        columns.month_code,
+        columns.type_code,
+        columns.cost,
+        len(columns.month_names),
+        len(TYPE_CODES),
+    )[:, [TYPE_CODES[t.value] for t in order]]
+    net = values[:, 0] + values[:, 2] - values[:, 1]
+    return Pivot(
+        columns.month_names,
+        SUMMARY_COLUMNS,
+        np.column_stack([values, np.round(net, 2)]),
+    )
+
+
+def format_pivot(title: str, pivot: Pivot, total: bool = True) -> str:
+    lines = [f"[{title}][rows={len(pivot.rows)}]"]
+    lines.append(
+        "\t".join(["month"] + pivot.columns + (["total"] if total else []))
+    )
+    for name, row in zip(pivot.rows, pivot.values):
+        cells = [name] + ["%.2f" % v for v in row]
+        if total:
+            cells.append("%.2f" % row.sum())
+        lines.append("\t".join(cells))
+    return "\n".join(lines)
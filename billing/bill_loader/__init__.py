@@ -1,2 +1,5 @@
+from .registry import LoaderDispatcher  # noqa
+from .registry import register_loader  # noqa
+from .registry import registered_loaders  # noqa
 from .wechat import WeChatBillLoader  # noqa
 from .alipay import AlipayBillLoader  # noqa
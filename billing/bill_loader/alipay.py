@@ -1,6 +1,3 @@
-import datetime
-import re
-
 from collections import defaultdict
 from typing import Optional
 
@@ -8,11 +5,30 @@ from billing.const import TransactionType
 from billing.const import TransactonFlag
 from billing.logger import logger
 from billing.qianji.qianji import QianjiTransaction
+from billing.time_codec import dash_codec
 
 from .base import Loader
+from .registry import register_loader
 
 
+@register_loader
 class AlipayBillLoader(Loader):
+    COLUMNS = (
+        "交易时间",
+        "交易分类",
+        "交易对方",
+        "对方账号",
+        "商品说明",
+        "收/支",
+        "金额",
+        "收/付款方式",
+        "交易状态",
+        "交易订单号",
+        "商家订单号",
+        "备注",
+    )
+    REQUIRED_COLUMNS = frozenset(COLUMNS[:3] + COLUMNS[4:11])
+
     def __init__(
         self,
         account_rules: list[dict],
@@ -21,9 +37,12 @@ class AlipayBillLoader(Loader):
         super(AlipayBillLoader, self).__init__(
             account_rules, classify_rules
         )
-        self._closed_order: dict = {}
+        self._closed_order: set = set()
         self._refund_cost_dict: dict = defaultdict(float)
         self._refund_order_data: dict = {}
+        # 流式解析时暂存的交易，以及已入库、被跳过的订单的商家订单号
+        self._held: list[QianjiTransaction] = []
+        self._known_orders: set = set()
 
     @property
     def name(self) -> str:
@@ -38,13 +57,7 @@ class AlipayBillLoader(Loader):
         return "GBK"
 
     def _parse_trade_time(self, text: str) -> int:
-        pattern = r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$"
-        match = re.match(pattern, text)
-        if not match:
-            return 0
-        date_obj = datetime.datetime.strptime(text, "%Y-%m-%d %H:%M:%S")
-        timestamp = int(date_obj.timestamp())
-        return timestamp
+        return dash_codec.parse(text)
 
     def _parse_type(self, line_data: list[str]) -> TransactionType:
         if line_data[5] == "收入":
@@ -56,7 +69,7 @@ class AlipayBillLoader(Loader):
         return type_
 
     def _parse_cost(self, line_data: list[str]) -> float:
-        cost = float(line_data[6].strip())
+        cost = float(line_data[6])
         return cost
 
     def _get_account_parse_data(self, line_data: list[str]) -> dict:
@@ -82,7 +95,7 @@ class AlipayBillLoader(Loader):
     ) -> Optional[QianjiTransaction]:
         shouzhi = line_data[5]
         trade_status = line_data[8]
-        merchant_order_number = line_data[10].strip()
+        merchant_order_number = line_data[10]
 
         acc_to = ""
         remark_postfix = self.AUTO_CLASSIFY_MARK if classify else ""
@@ -96,11 +109,11 @@ class AlipayBillLoader(Loader):
             TransactonFlag.Empty,
             self._get_remark(line_data) + remark_postfix,
             extra_info={"merchant_order_number": merchant_order_number},
-            tid=line_data[9].strip(),
+            tid=self._get_tid(line_data),
         )
 
         if trade_status == "交易关闭":
-            self._closed_order[merchant_order_number] = transaction
+            self._closed_order.add(merchant_order_number)
 
         # 不计收支一般是余额宝收入和退货退款
         if shouzhi == "不计收支":
@@ -111,23 +124,35 @@ class AlipayBillLoader(Loader):
 
         return transaction
 
+    def _get_tid(self, line_data: list[str]) -> str:
+        return line_data[9]
+
+    def _skip_known_line(self, trade_time: int, line_data: list[str]) -> None:
+        # 已入库的订单不再分类，但仍要登记关闭状态，并在最后消耗掉它的退款，
+        # 否则会误报退款未能识别
+        type_ = self._parse_type(line_data)
+        cost = self._parse_cost(line_data)
+        record = self._parse_trade_record(
+            type_, trade_time, cost, "", "", line_data
+        )
+        if record is not None:
+            self._known_orders.add(record.extra_info["merchant_order_number"])
+
     def _get_remark(self, line_data: list[str]) -> str:
         name = self.name
-        counterparty = line_data[2]
-        merchandise = line_data[4]
-        transaction_id = line_data[9].strip()
+        counterparty = self._remark_field(line_data[2])
+        merchandise = self._remark_field(line_data[4])
+        transaction_id = self._get_tid(line_data)
         ret = f"{name}--{counterparty}--{merchandise}--[TID:{transaction_id}]"
         return ret
 
-    def _post_process(
-        self, transaction_records: list[QianjiTransaction]
-    ) -> list[QianjiTransaction]:
-        for transaction in transaction_records:
-            order_number = transaction.extra_info["merchant_order_number"]
-            if order_number in self._refund_cost_dict:
-                transaction.refund(self._refund_cost_dict[order_number])
-                del self._refund_cost_dict[order_number]
+    def _apply_refund(self, transaction: QianjiTransaction) -> None:
+        order_number = transaction.extra_info["merchant_order_number"]
+        if order_number in self._refund_cost_dict:
+            transaction.refund(self._refund_cost_dict[order_number])
+            del self._refund_cost_dict[order_number]
 
+    def _report_unmatched_refunds(self) -> None:
         for order_number in list(self._refund_cost_dict.keys()):
             if order_number in self._closed_order:
                 del self._refund_cost_dict[order_number]
@@ -139,10 +164,32 @@ class AlipayBillLoader(Loader):
                 % data
             )
 
+    def _post_process(
+        self, transaction_records: list[QianjiTransaction]
+    ) -> list[QianjiTransaction]:
+        for transaction in transaction_records:
+            self._apply_refund(transaction)
+        self._report_unmatched_refunds()
+
         self.clear_cache()
         return list(filter(lambda t: t.is_valid(), transaction_records))
 
+    def _stream_record(
+        self, record: QianjiTransaction
+    ) -> Optional[QianjiTransaction]:
+        # 退款记录可能出现在原订单之前或之后，读完整个文件才能确定每笔订单的
+        # 退款金额，因此交易先暂存，最后统一由 _post_process 对账
+        self._held.append(record)
+        return None
+
+    def _finish_stream(self) -> list[QianjiTransaction]:
+        for order_number in self._known_orders:
+            self._refund_cost_dict.pop(order_number, None)
+        return self._post_process(self._held)
+
     def clear_cache(self) -> None:
-        self._closed_order = {}
+        self._closed_order = set()
         self._refund_cost_dict = defaultdict(float)
         self._refund_order_data = {}
+        self._held = []
+        self._known_orders = set()
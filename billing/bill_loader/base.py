@@ -1,20 +1,116 @@
+import csv
+import io
+import json
+
+from typing import BinaryIO
+from typing import Container
+from typing import Iterable
+from typing import Iterator
 from typing import Optional
 
-from billing.checker import check_rules
+from billing.checker import CachedRuleSet
+from billing.checker import CacheInfo
+from billing.checker import CompiledRuleSet
 from billing.const import TransactionType
+from billing.logger import logger
 from billing.qianji.qianji import QianjiTransaction
 
 
+def stored_rule_data(
+    loaders: Iterable["Loader"], rule_data: Optional[str]
+) -> Optional[tuple["Loader", dict]]:
+    """还原入库时保存的分类规则输入
+
+    旧版本入库的交易没有保存，或生成它的 Loader 不在 loaders 中时返回 None，
+    这些交易的规则输入无法完整还原，不能用来重新分类。
+    """
+    if not rule_data:
+        return None
+    data = json.loads(rule_data)
+    for loader in loaders:
+        if loader.name == data.get("loader"):
+            return loader, data
+    return None
+
+
+class ColumnPlan:
+    """把账单文件中的列按表头重新排列成 Loader 约定的标准列顺序
+
+    标准列顺序即 Loader.COLUMNS，各 Loader 的 line_data[i] 都按此顺序取值，
+    所以厂商调整列顺序、增删无关列都不会影响解析。
+    """
+
+    def __init__(self, indexes: list[int]) -> None:
+        self._indexes = indexes
+        self._identity = indexes == list(range(len(indexes)))
+        self._width = len(indexes)
+
+    @classmethod
+    def identity(cls, width: int) -> "ColumnPlan":
+        return cls(list(range(width)))
+
+    @classmethod
+    def from_header(
+        cls,
+        header: list[str],
+        columns: tuple[str, ...],
+        required: frozenset[str],
+    ) -> Optional["ColumnPlan"]:
+        """根据表头生成列映射，缺少 required 中的列时返回 None"""
+        positions = {name.strip(): i for i, name in enumerate(header)}
+        if not required.issubset(positions):
+            return None
+        # 表头中不存在的非必需列映射到行尾之外，取值时得到空串
+        missing = len(header)
+        return cls([positions.get(name, missing) for name in columns])
+
+    def project(self, row: list[str]) -> list[str]:
+        """按标准列顺序取出并去除首尾空白"""
+        if self._identity and len(row) >= self._width:
+            return [cell.strip() for cell in row[: self._width]]
+        size = len(row)
+        return [row[i].strip() if i < size else "" for i in self._indexes]
+
+
 class Loader:
     AUTO_CLASSIFY_MARK = "[auto]"
+    RULE_CACHE_SIZE = 4096
+    # 标准列顺序（账单表头名），line_data 按此顺序排列
+    COLUMNS: tuple[str, ...] = ()
+    # 解析必需的列，表头中缺少这些列时无法解析
+    REQUIRED_COLUMNS: frozenset[str] = frozenset()
 
     def __init__(
         self,
         account_rules: list[dict],
         classify_rules: list[dict],
     ):
+        self._profile_rules = False
+        self._plan = ColumnPlan.identity(len(self.COLUMNS))
+        self._known_ids: Container[str] = ()
         self._account_rules: list[dict] = account_rules
         self._classify_rules: list[dict] = classify_rules
+        self._account_rule_set = self._build_rule_set(account_rules)
+        self._classify_rule_set = self._build_rule_set(classify_rules)
+
+    def set_rules(
+        self, account_rules: list[dict], classify_rules: list[dict]
+    ) -> None:
+        """替换规则，两份规则都编译成功后才会生效"""
+        account_rule_set = self._build_rule_set(account_rules)
+        classify_rule_set = self._build_rule_set(classify_rules)
+        self._account_rules = account_rules
+        self._classify_rules = classify_rules
+        self._account_rule_set = account_rule_set
+        self._classify_rule_set = classify_rule_set
+
+    @property
+    def account_rules(self) -> list[dict]:
+        return self._account_rules
+
+    @property
+    def classify_rules(self) -> list[dict]:
+        return self._classify_rules
 
     @property
     def name(self) -> str:
@@ -28,6 +124,40 @@ class Loader:
     def encoding(self) -> str:
         return "utf-8"
 
+    def rule_cache_info(self) -> dict[str, CacheInfo]:
+        """账户/分类规则决策缓存的命中情况"""
+        return {
+            "account": self._account_rule_set.cache_info(),
+            "classify": self._classify_rule_set.cache_info(),
+        }
+
+    def enable_rule_profiling(self, enable: bool = True) -> None:
+        """开启规则统计，统计期间不使用决策缓存"""
+        self._profile_rules = enable
+        self._account_rule_set.rule_set.enable_profiling(enable)
+        self._classify_rule_set.rule_set.enable_profiling(enable)
+
+    def rule_sets(self) -> dict[str, CompiledRuleSet]:
+        self._sync_rule_sets()
+        return {
+            "account": self._account_rule_set.rule_set,
+            "classify": self._classify_rule_set.rule_set,
+        }
+
+    def _build_rule_set(self, rules: list[dict]) -> CachedRuleSet:
+        rule_set = CachedRuleSet(rules, self.RULE_CACHE_SIZE)
+        rule_set.rule_set.enable_profiling(self._profile_rules)
+        return rule_set
+
+    def _sync_rule_sets(self) -> None:
+        """规则列表对象被替换后重新编译，旧的决策缓存随之失效"""
+        if self._account_rule_set.rule_list is not self._account_rules:
+            self._account_rule_set = self._build_rule_set(self._account_rules)
+        if self._classify_rule_set.rule_list is not self._classify_rules:
+            self._classify_rule_set = self._build_rule_set(
+                self._classify_rules
+            )
+
     def _parse_trade_time(self, text: str) -> int:
         """将日期字符串转化为时间戳，不合法的返回 0"""
         raise NotImplementedError
@@ -48,7 +178,8 @@ class Loader:
         acc_from_core_data["loader"] = self.name
         acc_from_core_data["is_income"] = type_ == TransactionType.Income
         acc_from_core_data["is_expense"] = type_ == TransactionType.Expense
-        return check_rules(acc_from_core_data, self._account_rules)
+        self._sync_rule_sets()
+        return self._account_rule_set.check(acc_from_core_data)
 
     def _get_account_parse_data(self, line_data: list[str]) -> dict:
         raise NotImplementedError
@@ -58,27 +189,116 @@ class Loader:
     ) -> str:
         """根据给定规则获取交易分类"""
         classify_cor_data = self._get_classify_parse_data(line_data)
+        return self.classify(classify_cor_data, type_)
+
+    def _get_classify_parse_data(self, line_data: list[str]) -> dict:
+        raise NotImplementedError
+
+    def classify(self, classify_cor_data: dict, type_: TransactionType) -> str:
+        """用分类规则检查 _get_classify_parse_data 格式的数据"""
         classify_cor_data["loader"] = self.name
         classify_cor_data["is_income"] = type_ == TransactionType.Income
         classify_cor_data["is_expense"] = type_ == TransactionType.Expense
-        return check_rules(classify_cor_data, self._classify_rules)
+        self._sync_rule_sets()
+        return self._classify_rule_set.check(classify_cor_data)
 
-    def _get_classify_parse_data(self, line_data: list[str]) -> dict:
-        raise NotImplementedError
+    def rule_data(self, line_data: list[str]) -> dict:
+        """入库时随交易保存的分类规则输入，重新分类时原样还原"""
+        data = self._get_classify_parse_data(line_data)
+        data["loader"] = self.name
+        return data
 
     def parse_file_content(self, file_content: str) -> list[QianjiTransaction]:
-        ret = []
-        for line in file_content.splitlines():
-            record = self._parse_line(line)
-            if record:
-                ret.append(record)
+        ret = list(self._iter_records(file_content.splitlines()))
         return self._post_process(ret)
 
+    def iter_transactions(
+        self,
+        binary_stream: BinaryIO,
+        known_ids: Container[str] = (),
+    ) -> Iterator[QianjiTransaction]:
+        """从二进制流中逐行解码、解析交易，不需要先读入整个文件
+
+        每条交易解析后立刻经过 _stream_record 处理再产出，全部读完后
+        再产出 _finish_stream 返回的交易（需要整个文件才能确定的交易）。
+        不会关闭传入的流。
+        交易单号在 known_ids 中的行不做账户和分类匹配，也不会产出。
+        """
+        self.clear_cache()
+        self._known_ids = known_ids
+        text_stream = io.TextIOWrapper(
+            binary_stream, encoding=self.encoding, newline=""
+        )
+        try:
+            for record in self._iter_records(text_stream):
+                ret = self._stream_record(record)
+                if ret:
+                    yield ret
+            yield from self._finish_stream()
+        finally:
+            self._known_ids = ()
+            text_stream.detach()
+
+    def _iter_records(
+        self, lines: Iterable[str]
+    ) -> Iterator[QianjiTransaction]:
+        """用 csv 解析各行（支持带引号、含逗号的字段），遇到表头时重建列映射"""
+        self._plan = ColumnPlan.identity(len(self.COLUMNS))
+        header_name = self.COLUMNS[0] if self.COLUMNS else None
+        header_found = False
+        for row in csv.reader(lines):
+            if not row:
+                continue
+            # 表头每个文件只识别一次，之后的数据行不再检查
+            if not header_found and any(
+                cell.strip() == header_name for cell in row
+            ):
+                self._set_header(row)
+                header_found = True
+                continue
+            record = self._parse_row(row)
+            if record:
+                yield record
+
+    def _set_header(self, header: list[str]) -> None:
+        plan = ColumnPlan.from_header(
+            header, self.COLUMNS, self.REQUIRED_COLUMNS
+        )
+        if plan is None:
+            logger.warning(
+                "[unknown bill header, use default columns][loader=%s]%s",
+                self.name,
+                header,
+            )
+            plan = ColumnPlan.identity(len(self.COLUMNS))
+        self._plan = plan
+
+    def _stream_record(
+        self, record: QianjiTransaction
+    ) -> Optional[QianjiTransaction]:
+        """流式解析时逐条处理交易，返回 None 表示丢弃"""
+        return record
+
+    def _finish_stream(self) -> list[QianjiTransaction]:
+        """流式解析结束后的收尾工作，返回暂存到最后才能产出的交易"""
+        return []
+
+    def clear_cache(self) -> None:
+        """清除解析单个文件过程中积累的状态"""
+
     def _parse_line(self, line: str) -> Optional[QianjiTransaction]:
-        line_data = line.strip().split(",")
+        for row in csv.reader([line.strip()]):
+            return self._parse_row(row)
+        return None
+
+    def _parse_row(self, row: list[str]) -> Optional[QianjiTransaction]:
+        line_data = self._plan.project(row)
         trade_time = self._parse_trade_time(line_data[0])
         if not trade_time:
             return None
+        if self._get_tid(line_data) in self._known_ids:
+            self._skip_known_line(trade_time, line_data)
+            return None
         type_ = self._parse_type(line_data)
         cost = self._parse_cost(line_data)
         acc_from = self._parse_account_from(line_data, type_)
@@ -86,11 +306,25 @@ class Loader:
         record = self._parse_trade_record(
             type_, trade_time, cost, acc_from, classify, line_data
         )
+        if record is not None:
+            record.extra_info["rule_data"] = self.rule_data(line_data)
         return record
 
+    def _get_tid(self, line_data: list[str]) -> str:
+        """根据行数据获取交易单号"""
+        raise NotImplementedError
+
+    def _skip_known_line(self, trade_time: int, line_data: list[str]) -> None:
+        """交易单号已入库的行被跳过时调用，用于维护跨行的状态"""
+
     def _get_remark(self, line_data: list[str]) -> str:
         return self.name
 
+    @staticmethod
+    def _remark_field(text: str) -> str:
+        """备注会以逗号分隔写入 csv，字段中的半角逗号替换为全角逗号"""
+        return text.replace(",", "，")
+
     def _parse_trade_record(
         self,
         type_: TransactionType,
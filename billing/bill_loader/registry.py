@@ -0,0 +1,68 @@
+import os
+import re
+
+from typing import Optional
+from typing import Type
+from typing import TypeVar
+
+from .base import Loader
+
+
+T = TypeVar("T", bound=Type[Loader])
+
+_loader_classes: list[Type[Loader]] = []
+
+
+def register_loader(loader_cls: T) -> T:
+    """注册账单 Loader，新增银行账单只需要在类定义上加这个装饰器"""
+    if loader_cls not in _loader_classes:
+        _loader_classes.append(loader_cls)
+    return loader_cls
+
+
+def registered_loaders() -> list[Type[Loader]]:
+    """按注册顺序返回所有 Loader 类"""
+    return list(_loader_classes)
+
+
+class LoaderDispatcher:
+    """把所有 Loader 的文件名正则预编译成一个，按文件名分派到 Loader
+
+    文件名同时匹配多个 Loader 时，取排在前面的 Loader。
+    """
+
+    def __init__(self, loaders: list[Loader]) -> None:
+        self._loaders: dict[str, Loader] = {}
+        parts = []
+        for index, loader in enumerate(loaders):
+            if not loader.file_regex:
+                continue
+            group = f"loader{index}"
+            self._loaders[group] = loader
+            parts.append(f"(?P<{group}>{loader.file_regex})")
+        self._regex = re.compile("|".join(parts)) if parts else None
+
+    def match(self, file_name: str) -> Optional[Loader]:
+        if self._regex is None:
+            return None
+        match = self._regex.match(file_name)
+        if match is None:
+            return None
+        if match.lastgroup in self._loaders:
+            return self._loaders[match.lastgroup]
+        for group, value in match.groupdict().items():
+            if value is not None:
+                return self._loaders[group]
+        return None
+
+    def scan(self, directory: str) -> list[tuple[Loader, str]]:
+        """扫描一次目录，返回 (Loader, 文件路径) 列表"""
+        ret = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                loader = self.match(entry.name)
+                if loader is not None:
+                    ret.append((loader, entry.path))
+        return ret
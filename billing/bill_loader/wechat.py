@@ -1,4 +1,3 @@
-import datetime
 import re
 
 from typing import Optional
@@ -7,11 +6,29 @@ from billing.const import TransactionType
 from billing.const import TransactonFlag
 from billing.logger import logger
 from billing.qianji.qianji import QianjiTransaction
+from billing.time_codec import dash_codec
 
 from .base import Loader
+from .registry import register_loader
 
 
+@register_loader
 class WeChatBillLoader(Loader):
+    COLUMNS = (
+        "交易时间",
+        "交易类型",
+        "交易对方",
+        "商品",
+        "收/支",
+        "金额(元)",
+        "支付方式",
+        "当前状态",
+        "交易单号",
+        "商户单号",
+        "备注",
+    )
+    REQUIRED_COLUMNS = frozenset(COLUMNS[:9])
+
     @property
     def name(self) -> str:
         return "wechat"
@@ -21,13 +38,7 @@ class WeChatBillLoader(Loader):
         return r"微信支付账单\((\d{8}-\d{8})\)\.csv"
 
     def _parse_trade_time(self, text: str) -> int:
-        pattern = r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$"
-        match = re.match(pattern, text)
-        if not match:
-            return 0
-        date_obj = datetime.datetime.strptime(text, "%Y-%m-%d %H:%M:%S")
-        timestamp = int(date_obj.timestamp())
-        return timestamp
+        return dash_codec.parse(text)
 
     def _parse_type(self, line_data: list[str]) -> TransactionType:
         if line_data[4] == "收入":
@@ -41,7 +52,8 @@ class WeChatBillLoader(Loader):
         return type_
 
     def _parse_cost(self, line_data: list[str]) -> float:
-        cost = float(line_data[5].strip()[1:])
+        # 金额前的符号有半角 ¥ 和全角 ￥ 两种写法
+        cost = float(line_data[5].strip().lstrip("¥￥"))
         return cost
 
     def _get_account_parse_data(self, line_data: list[str]) -> dict:
@@ -111,14 +123,17 @@ class WeChatBillLoader(Loader):
             acc_to,
             TransactonFlag.Empty,
             self._get_remark(line_data) + remark_postfix,
-            tid=line_data[8].strip()
+            tid=self._get_tid(line_data),
         )
         return transaction
 
+    def _get_tid(self, line_data: list[str]) -> str:
+        return line_data[8]
+
     def _get_remark(self, line_data: list[str]) -> str:
         name = self.name
-        counterparty = line_data[2]
-        merchandise = line_data[3][1:-1]
-        transaction_id = line_data[8].strip()
+        counterparty = self._remark_field(line_data[2])
+        merchandise = self._remark_field(line_data[3])
+        transaction_id = self._get_tid(line_data)
         ret = f"{name}--{counterparty}--{merchandise}--[TID:{transaction_id}]"
         return ret
@@ -1,5 +1,10 @@
+import time
+
+from collections import OrderedDict
 from enum import Enum
 from typing import Any
+from typing import NamedTuple
+from typing import Optional
 
 
 class Operator(Enum):
@@ -42,3 +47,438 @@ def check_condition(value: Any, condition: dict) -> bool:
         return True
 
     return False
+
+
+_OP_IN = 0
+_OP_NOT_IN = 1
+_OP_EQUAL = 2
+_OP_IS = 3
+_OP_FALLBACK = 4
+_OP_NEVER = 5
+
+
+class _AhoCorasick:
+    """多模式子串匹配自动机，一次扫描得到文本中出现的全部模式"""
+
+    def __init__(self, patterns: list[str]) -> None:
+        self._goto: list[dict[str, int]] = [{}]
+        self._output: list[list[int]] = [[]]
+        self._always: list[int] = []
+        for pattern_id, pattern in enumerate(patterns):
+            if not pattern:
+                # 空串是任何字符串的子串
+                self._always.append(pattern_id)
+                continue
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(pattern_id)
+
+        # 广度优先构建失败指针，并把失败链上的输出合并到当前状态
+        self._fail: list[int] = [0] * len(self._goto)
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail_next = self._goto[fail].get(char, 0)
+                if fail_next == next_state:
+                    fail_next = 0
+                self._fail[next_state] = fail_next
+                self._output[next_state] = (
+                    self._output[next_state] + self._output[fail_next]
+                )
+
+    def search(self, text: str) -> set[int]:
+        found = set(self._always)
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class RuleProfile(NamedTuple):
+    rule_index: int
+    output_id: str
+    evaluations: int
+    matches: int
+    time_ns: int
+    condition_evaluations: list[int]
+    condition_passes: list[int]
+
+
+class RuleTrace(NamedTuple):
+    rule_index: int
+    output_id: str
+    matched: bool
+    # 第一个不满足的条件下标，匹配成功时为 None
+    failed_condition: Optional[int]
+    reason: str
+
+
+class CompiledRuleSet:
+    """预编译的规则集合，结果与 check_rules 完全一致
+
+    期望值预先转为小写，规则条件按 field_to_check 建立索引，
+    同一字段上的全部 in / not in 条件由一个自动机一次扫描得出结果。
+    """
+
+    def __init__(self, rule_list: list[dict]) -> None:
+        self._rule_list = rule_list
+        patterns: dict[str, dict[str, int]] = {}
+        self._rules: list[tuple[str, tuple]] = []
+        self._field_index: dict[str, list[int]] = {}
+        for rule_index, rule in enumerate(rule_list):
+            compiled = []
+            for condition in rule["conditions"]:
+                field = condition["field_to_check"]
+                op, arg = self._compile_condition(condition, patterns)
+                compiled.append((field, op, arg, condition))
+                rule_indexes = self._field_index.setdefault(field, [])
+                if not rule_indexes or rule_indexes[-1] != rule_index:
+                    rule_indexes.append(rule_index)
+            self._rules.append((rule["output_id"], tuple(compiled)))
+        self._automata: dict[str, _AhoCorasick] = {
+            field: _AhoCorasick(list(field_patterns))
+            for field, field_patterns in patterns.items()
+        }
+        self._profiling = False
+        self._reset_profile()
+
+    @staticmethod
+    def _compile_condition(
+        condition: dict, patterns: dict[str, dict[str, int]]
+    ) -> tuple[int, Any]:
+        operator = condition["operator"]
+        expect_value = condition["expect_value"]
+        if operator in (Operator.Include.value, Operator.NotInclude.value):
+            if not isinstance(expect_value, str):
+                return _OP_FALLBACK, None
+            field_patterns = patterns.setdefault(
+                condition["field_to_check"], {}
+            )
+            pattern = expect_value.lower()
+            pattern_id = field_patterns.setdefault(
+                pattern, len(field_patterns)
+            )
+            if operator == Operator.Include.value:
+                return _OP_IN, pattern_id
+            return _OP_NOT_IN, pattern_id
+        elif operator == Operator.Equal.value:
+            if not isinstance(expect_value, str):
+                return _OP_FALLBACK, None
+            return _OP_EQUAL, expect_value.lower()
+        elif operator == Operator.Is.value:
+            if isinstance(expect_value, str):
+                return _OP_FALLBACK, None
+            return _OP_IS, expect_value
+        return _OP_NEVER, None
+
+    @property
+    def rule_list(self) -> list[dict]:
+        """编译所用的原始规则列表"""
+        return self._rule_list
+
+    @property
+    def field_index(self) -> dict[str, list[int]]:
+        """字段名 -> 引用了该字段的规则下标（按规则顺序）"""
+        return self._field_index
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    @property
+    def profiling(self) -> bool:
+        return self._profiling
+
+    def enable_profiling(self, enable: bool = True) -> None:
+        """开启后每次 check 都会记录逐条规则、逐个条件的计数和耗时"""
+        self._profiling = enable
+
+    def _reset_profile(self) -> None:
+        self._rule_evaluations = [0] * len(self._rules)
+        self._rule_matches = [0] * len(self._rules)
+        self._rule_time_ns = [0] * len(self._rules)
+        self._condition_evaluations = [
+            [0] * len(conditions) for _, conditions in self._rules
+        ]
+        self._condition_passes = [
+            [0] * len(conditions) for _, conditions in self._rules
+        ]
+
+    def reset_profile(self) -> None:
+        self._reset_profile()
+
+    def profile(self) -> list[RuleProfile]:
+        return [
+            RuleProfile(
+                index,
+                output_id,
+                self._rule_evaluations[index],
+                self._rule_matches[index],
+                self._rule_time_ns[index],
+                list(self._condition_evaluations[index]),
+                list(self._condition_passes[index]),
+            )
+            for index, (output_id, _) in enumerate(self._rules)
+        ]
+
+    def check(self, data_dict: dict[str, Any]) -> str:
+        if self._profiling:
+            return self._check_profiled(data_dict)
+
+        lowered: dict[str, str] = {}
+        hits: dict[str, set[int]] = {}
+        for output_id, conditions in self._rules:
+            for field, op, arg, condition in conditions:
+                value = data_dict[field]
+                if op <= _OP_EQUAL and isinstance(value, str):
+                    text = lowered.get(field)
+                    if text is None:
+                        text = lowered[field] = value.lower()
+                    if op == _OP_EQUAL:
+                        if text.strip() != arg:
+                            break
+                        continue
+                    field_hits = hits.get(field)
+                    if field_hits is None:
+                        field_hits = self._automata[field].search(text)
+                        hits[field] = field_hits
+                    if (arg in field_hits) != (op == _OP_IN):
+                        break
+                elif op == _OP_IS:
+                    if value is not arg:
+                        break
+                elif op == _OP_NEVER or not check_condition(value, condition):
+                    break
+            else:
+                return output_id
+
+        return ""
+
+    def _eval_condition(
+        self,
+        compiled: tuple,
+        data_dict: dict[str, Any],
+        lowered: dict[str, str],
+        hits: dict[str, set[int]],
+    ) -> bool:
+        field, op, arg, condition = compiled
+        value = data_dict[field]
+        if op <= _OP_EQUAL and isinstance(value, str):
+            text = lowered.get(field)
+            if text is None:
+                text = lowered[field] = value.lower()
+            if op == _OP_EQUAL:
+                return text.strip() == arg
+            field_hits = hits.get(field)
+            if field_hits is None:
+                field_hits = self._automata[field].search(text)
+                hits[field] = field_hits
+            return (arg in field_hits) == (op == _OP_IN)
+        elif op == _OP_IS:
+            return value is arg
+        elif op == _OP_NEVER:
+            return False
+        return check_condition(value, condition)
+
+    def _check_profiled(self, data_dict: dict[str, Any]) -> str:
+        lowered: dict[str, str] = {}
+        hits: dict[str, set[int]] = {}
+        for index, (output_id, conditions) in enumerate(self._rules):
+            start = time.perf_counter_ns()
+            condition_evaluations = self._condition_evaluations[index]
+            condition_passes = self._condition_passes[index]
+            matched = True
+            for condition_index, compiled in enumerate(conditions):
+                condition_evaluations[condition_index] += 1
+                if not self._eval_condition(
+                    compiled, data_dict, lowered, hits
+                ):
+                    matched = False
+                    break
+                condition_passes[condition_index] += 1
+            self._rule_evaluations[index] += 1
+            self._rule_time_ns[index] += time.perf_counter_ns() - start
+            if matched:
+                self._rule_matches[index] += 1
+                return output_id
+
+        return ""
+
+    def explain(self, data_dict: dict[str, Any]) -> list[RuleTrace]:
+        """按顺序列出尝试过的规则以及每条规则失败的原因"""
+        lowered: dict[str, str] = {}
+        hits: dict[str, set[int]] = {}
+        traces = []
+        for index, (output_id, conditions) in enumerate(self._rules):
+            failed: Optional[int] = None
+            reason = "全部条件满足"
+            for condition_index, compiled in enumerate(conditions):
+                field, _, _, condition = compiled
+                if field not in data_dict:
+                    failed = condition_index
+                    reason = f"缺少字段 {field}"
+                    break
+                if not self._eval_condition(
+                    compiled, data_dict, lowered, hits
+                ):
+                    failed = condition_index
+                    reason = "%s=%r 不满足 %s %r" % (
+                        field,
+                        data_dict[field],
+                        condition["operator"],
+                        condition["expect_value"],
+                    )
+                    break
+            traces.append(
+                RuleTrace(index, output_id, failed is None, failed, reason)
+            )
+            if failed is None:
+                break
+        return traces
+
+
+def _condition_implies(condition: dict, other: dict) -> bool:
+    """condition 成立时 other 是否一定成立（两者检查同一字段）"""
+    if condition["field_to_check"] != other["field_to_check"]:
+        return False
+    operator = condition["operator"]
+    other_operator = other["operator"]
+    expect_value = condition["expect_value"]
+    other_expect_value = other["expect_value"]
+    if not (
+        isinstance(expect_value, str) and isinstance(other_expect_value, str)
+    ):
+        if operator == other_operator == Operator.Is.value:
+            return expect_value is other_expect_value
+        return False
+
+    expect_value = expect_value.lower()
+    other_expect_value = other_expect_value.lower()
+    if other_operator == Operator.Include.value:
+        return operator in (
+            Operator.Include.value,
+            Operator.Equal.value,
+        ) and (other_expect_value in expect_value)
+    elif other_operator == Operator.NotInclude.value:
+        return (
+            operator == Operator.NotInclude.value
+            and expect_value in other_expect_value
+        )
+    elif other_operator == Operator.Equal.value:
+        return (
+            operator == Operator.Equal.value
+            and expect_value == other_expect_value
+        )
+    return False
+
+
+def find_shadowed_rules(rule_list: list[dict]) -> dict[int, int]:
+    """找出被前面规则完全遮蔽、永远不可能生效的规则
+
+    若规则 B 的条件能推出前面规则 A 的全部条件，B 能匹配时 A 一定先匹配。
+    返回 被遮蔽规则下标 -> 遮蔽它的第一条规则下标。
+    """
+    shadowed = {}
+    for index, rule in enumerate(rule_list):
+        conditions = rule["conditions"]
+        for earlier_index in range(index):
+            earlier_conditions = rule_list[earlier_index]["conditions"]
+            if all(
+                any(
+                    _condition_implies(condition, earlier_condition)
+                    for condition in conditions
+                )
+                for earlier_condition in earlier_conditions
+            ):
+                shadowed[index] = earlier_index
+                break
+    return shadowed
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    currsize: int
+    maxsize: int
+
+
+class CachedRuleSet:
+    """在 CompiledRuleSet 之上加一层有界 LRU 决策缓存
+
+    缓存以完整的 data_dict 为键，同一份规则列表编译出的结果是确定的，
+    规则列表变化时应重新构建本对象，旧缓存随之丢弃。
+    """
+
+    def __init__(self, rule_list: list[dict], maxsize: int = 4096) -> None:
+        self._rule_set = CompiledRuleSet(rule_list)
+        self._maxsize = maxsize
+        self._cache: OrderedDict[tuple, str] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def rule_list(self) -> list[dict]:
+        return self._rule_set.rule_list
+
+    @property
+    def rule_set(self) -> CompiledRuleSet:
+        return self._rule_set
+
+    def check(self, data_dict: dict[str, Any]) -> str:
+        if self._rule_set.profiling:
+            # 统计模式下每次都要真正执行规则
+            return self._rule_set.check(data_dict)
+        try:
+            key = tuple(data_dict.items())
+            output_id = self._cache.get(key)
+        except TypeError:
+            # 含有不可哈希的值，直接计算
+            return self._rule_set.check(data_dict)
+
+        if output_id is not None:
+            self._hits += 1
+            self._cache.move_to_end(key)
+            return output_id
+
+        self._misses += 1
+        output_id = self._rule_set.check(data_dict)
+        if self._maxsize > 0:
+            self._cache[key] = output_id
+            if len(self._cache) > self._maxsize:
+                self._cache.popitem(last=False)
+                self._evictions += 1
+        return output_id
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(
+            self._hits,
+            self._misses,
+            self._evictions,
+            len(self._cache),
+            self._maxsize,
+        )
+
+    def cache_clear(self) -> None:
+        self._cache.clear()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
@@ -0,0 +1,292 @@
+import argparse
+import sys
+
+from itertools import chain
+from typing import Optional
+
+from billing.bill_loader import registered_loaders
+from billing.bill_loader.base import Loader
+from billing.const import TransactionType
+from billing.const import TranStatus
+from billing.db import DBNAME
+from billing.db import check_and_create_database
+from billing.db import iter_transaction_chunks
+from billing.db import set_db_path
+from billing.exporter import month_range
+from billing.reclassify import reclassify
+from billing.rule_report import find_loader
+from billing.rule_report import format_rule_report
+from billing.rule_report import profile_bill_file
+from billing.rule_report import profile_transactions
+from billing.rules import load_rules_file
+from billing.search import search_transactions
+from billing.time_codec import slash_codec
+
+
+def build_loaders(args: argparse.Namespace) -> list[Loader]:
+    account_rules = load_rules_file(args.account_rules)
+    classify_rules = load_rules_file(args.classify_rules)
+    return [
+        loader_cls(account_rules, classify_rules)
+        for loader_cls in registered_loaders()
+    ]
+
+
+def rules_report(args: argparse.Namespace) -> int:
+    """统计规则命中情况，列出从未命中和被完全遮蔽的规则"""
+    loaders = build_loaders(args)
+    for loader in loaders:
+        loader.enable_rule_profiling()
+
+    for file_path in args.bill_file:
+        file_loader = find_loader(loaders, file_path)
+        if file_loader is None:
+            print(f"无法识别的账单文件：{file_path}", file=sys.stderr)
+            return 1
+        count = profile_bill_file(file_loader, file_path)
+        print(f"[profile bill file][{file_path}][count={count}]")
+    if args.db:
+        rows = chain.from_iterable(iter_transaction_chunks(list(TranStatus)))
+        count, skipped = profile_transactions(loaders, rows)
+        print(f"[profile database][count={count}][skipped={skipped}]")
+
+    for kind in ("account", "classify"):
+        if kind == "account" and not args.bill_file:
+            # 数据库中没有保存原始的支付方式，账户规则只能通过账单文件统计
+            continue
+        rule_sets = [loader.rule_sets()[kind] for loader in loaders]
+        print(format_rule_report(f"{kind} rules", rule_sets))
+    return 0
+
+
+def run_reclassify(args: argparse.Namespace) -> int:
+    """用当前分类规则重新分类库中的交易"""
+    result = reclassify(
+        load_rules_file(args.classify_rules),
+        include_auto=args.include_auto,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        dry_run=args.dry_run,
+    )
+    print(f"[reclassify]{result}")
+    return 0
+
+
+def parse_month(text: str) -> tuple[int, int]:
+    """解析 YYYY-MM 格式的月份"""
+    try:
+        year, month = (int(part) for part in text.split("-"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid month: {text}")
+    if not 1 <= month <= 12:
+        raise argparse.ArgumentTypeError(f"invalid month: {text}")
+    return year, month
+
+
+def run_analytics(args: argparse.Namespace) -> int:
+    """按月汇总收支，需要安装 numpy"""
+    try:
+        from billing import analytics
+    except ImportError:
+        print("analytics 需要 numpy：pip install numpy", file=sys.stderr)
+        return 1
+    start = month_range(args.start)[0] if args.start else None
+    end = month_range(args.end)[1] if args.end else None
+    columns = analytics.load_columns(start, end)
+    print(
+        analytics.format_pivot(
+            "summary", analytics.month_summary(columns), total=False
+        )
+    )
+    type_ = TransactionType(args.type)
+    pivot = analytics.month_pivot(columns, args.by, type_)
+    print(analytics.format_pivot(f"{type_.value} by {args.by}", pivot))
+    return 0
+
+
+def run_search(args: argparse.Namespace) -> int:
+    """全文搜索库中的交易，可用于预览新规则会命中哪些交易"""
+    hits = search_transactions(
+        " ".join(args.query),
+        start=month_range(args.start)[0] if args.start else None,
+        end=month_range(args.end)[1] if args.end else None,
+        status=TranStatus[args.status] if args.status else None,
+        account=args.account,
+        limit=args.limit,
+    )
+    for hit in hits:
+        print(
+            "\t".join(
+                [
+                    slash_codec.format(hit.time),
+                    TranStatus(hit.status).name,
+                    "%.2f" % hit.cost,
+                    hit.classify,
+                    hit.acc_from,
+                    hit.remark,
+                ]
+            )
+        )
+    print(f"[search][count={len(hits)}]")
+    return 0
+
+
+def add_rule_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--account-rules",
+        required=True,
+        type=str,
+        help="Path to the account rules file.",
+    )
+    add_classify_rule_argument(parser)
+
+
+def add_classify_rule_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--classify-rules",
+        required=True,
+        type=str,
+        help="Path to the category rules file.",
+    )
+
+
+def parse_arguments(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Billing maintenance tools.")
+    parser.add_argument(
+        "--db-path",
+        default=DBNAME,
+        type=str,
+        help="Path to the SQLite database file.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    report = subparsers.add_parser(
+        "rules-report",
+        help="Profile rules over bill files or the database.",
+    )
+    add_rule_arguments(report)
+    report.add_argument(
+        "--bill-file",
+        action="append",
+        default=[],
+        help="Raw WeChat/Alipay bill file, can be given multiple times.",
+    )
+    report.add_argument(
+        "--db",
+        action="store_true",
+        help="Re-run classify rules over transactions in the database.",
+    )
+    report.set_defaults(func=rules_report)
+
+    reclassify_parser = subparsers.add_parser(
+        "reclassify",
+        help="Re-run classify rules over stored transactions.",
+    )
+    add_classify_rule_argument(reclassify_parser)
+    reclassify_parser.add_argument(
+        "--include-auto",
+        action="store_true",
+        help="Also update confirmed transactions still marked [auto].",
+    )
+    reclassify_parser.add_argument(
+        "--chunk-size",
+        default=2000,
+        type=int,
+        help="Rows read from the database per chunk.",
+    )
+    reclassify_parser.add_argument(
+        "--workers",
+        default=None,
+        type=int,
+        help="Worker processes, defaults to the CPU count.",
+    )
+    reclassify_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only report how many rows would change.",
+    )
+    reclassify_parser.set_defaults(func=run_reclassify)
+
+    analytics_parser = subparsers.add_parser(
+        "analytics",
+        help="Monthly totals by category or account, requires numpy.",
+    )
+    analytics_parser.add_argument(
+        "--by",
+        choices=["classify", "account"],
+        default="classify",
+        help="Group the monthly totals by category or by account.",
+    )
+    analytics_parser.add_argument(
+        "--type",
+        choices=[t.value for t in TransactionType],
+        default=TransactionType.Expense.value,
+        help="Transaction type to group.",
+    )
+    analytics_parser.add_argument(
+        "--start",
+        type=parse_month,
+        default=None,
+        help="First month to include, YYYY-MM.",
+    )
+    analytics_parser.add_argument(
+        "--end",
+        type=parse_month,
+        default=None,
+        help="Last month to include, YYYY-MM.",
+    )
+    analytics_parser.set_defaults(func=run_analytics)
+
+    search_parser = subparsers.add_parser(
+        "search",
+        help="Full-text search over remarks, merchants and counterparties.",
+    )
+    search_parser.add_argument(
+        "query",
+        nargs="+",
+        help='Words to match, "quoted phrase" or prefix*.',
+    )
+    search_parser.add_argument(
+        "--start",
+        type=parse_month,
+        default=None,
+        help="First month to include, YYYY-MM.",
+    )
+    search_parser.add_argument(
+        "--end",
+        type=parse_month,
+        default=None,
+        help="Last month to include, YYYY-MM.",
+    )
+    search_parser.add_argument(
+        "--status",
+        choices=[s.name for s in TranStatus],
+        default=None,
+        help="Only transactions in this status.",
+    )
+    search_parser.add_argument(
+        "--account",
+        default=None,
+        help="Only transactions paid from this account.",
+    )
+    search_parser.add_argument(
+        "--limit",
+        default=50,
+        type=int,
+        help="Maximum number of results.",
+    )
+    search_parser.set_defaults(func=run_search)
+
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_arguments(argv)
+    set_db_path(args.db_path)
+    # 守护进程还没有升级过的数据库缺少新的表和列，先执行迁移
+    check_and_create_database()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
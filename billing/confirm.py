@@ -0,0 +1,176 @@
+"""逐行导入用户确认后的 unconfirmed.csv
+
+文件按 CSV 规则逐行解析，不合法的行写入拒绝文件，不影响其余行入库；
+合法的交易按固定大小分块写入数据库，内存占用与文件大小无关。
+
+确认时把每行与库中当前的交易比较，内容没有变化的行只更新状态，
+只有新增和被修改的行才整行写入。
+"""
+
+import csv
+import hashlib
+
+from typing import Callable
+from typing import Iterator
+from typing import NamedTuple
+from typing import Optional
+from typing import TextIO
+
+from billing.const import HEADER
+from billing.const import TransactionType
+from billing.const import TransactonFlag
+from billing.const import TranStatus
+from billing.db import confirm_unchanged
+from billing.db import count_pending_export
+from billing.db import insert_transactions
+from billing.db import last_export_time
+from billing.db import load_transactions_by_id
+from billing.logger import logger
+from billing.qianji.qianji import TID_REGEX
+from billing.qianji.qianji import QianjiTransaction
+from billing.time_codec import slash_codec
+
+
+# 每次写入数据库的交易数
+CONFIRM_CHUNK_SIZE = 1000
+# 时间,分类,类型,金额,账户1,账户2,备注,账单标记,账单图片
+FIELD_COUNT = len(HEADER.split(","))
+REJECT_HEADER = ["行号", "错误"] + HEADER.split(",")
+
+
+class RejectedRow(NamedTuple):
+    line_num: int
+    error: str
+    row: list[str]
+
+
+class ConfirmResult(NamedTuple):
+    # 库中没有的交易
+    added: int
+    # 与库中内容不同的交易
+    changed: int
+    # 与库中内容相同，只更新状态的交易
+    unchanged: int
+    # 与本文件一同导出、但文件中没有的交易
+    missing: int
+    rejected: int
+
+
+def content_hash(transaction: QianjiTransaction) -> str:
+    """交易在 unconfirmed.csv 中一行内容的摘要"""
+    content = "\x1f".join(transaction.dump_fields())
+    return hashlib.blake2b(content.encode(), digest_size=8).hexdigest()
+
+
+def parse_confirmed_row(row: list[str]) -> QianjiTransaction:
+    """解析一行确认后的交易，不合法时抛出 ValueError
+
+    备注中的逗号在旧版本导出的文件里没有加引号，多出来的列都并入备注。
+    """
+    if len(row) < FIELD_COUNT - 1:
+        raise ValueError(f"expected {FIELD_COUNT} fields, got {len(row)}")
+    if len(row) > FIELD_COUNT:
+        row = row[:6] + [",".join(row[6 : len(row) - 2])] + row[-2:]
+    ts = slash_codec.parse(row[0])
+    if not ts:
+        raise ValueError(f"invalid time: {row[0]}")
+    remark = row[6]
+    if not TID_REGEX.search(remark):
+        raise ValueError(f"missing TID in remark: {remark}")
+    return QianjiTransaction(
+        ts,
+        row[1],
+        TransactionType(row[2]),
+        float(row[3]),
+        row[4],
+        row[5],
+        TransactonFlag(row[7]),
+        remark,
+    )
+
+
+def iter_confirmed(
+    stream: TextIO, rejected: list[RejectedRow]
+) -> Iterator[QianjiTransaction]:
+    """逐行解析确认文件，不合法的行追加到 rejected"""
+    reader = csv.reader(stream)
+    next(reader, None)
+    for row in reader:
+        if not any(row):
+            continue
+        try:
+            yield parse_confirmed_row(row)
+        except ValueError as e:
+            rejected.append(RejectedRow(reader.line_num, str(e), row))
+
+
+def write_rejected(path: str, rejected: list[RejectedRow]) -> None:
+    """拒绝的行连同行号和原因写入 path，可以修正后重新确认"""
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(REJECT_HEADER)
+        for line_num, error, row in rejected:
+            writer.writerow([line_num, error] + row)
+
+
+def import_confirmed_file(
+    path: str,
+    reject_path: str,
+    on_chunk: Optional[Callable[[list[QianjiTransaction]], None]] = None,
+    chunk_size: int = CONFIRM_CHUNK_SIZE,
+) -> ConfirmResult:
+    """导入一个确认文件，交易入库并放入发件箱
+
+    每块中有整行写入的交易时用这些交易调用 on_chunk，只更新状态的交易
+    导出内容不变，不会传给 on_chunk。有拒绝的行时写入 reject_path。
+    """
+    rejected: list[RejectedRow] = []
+    added = changed = unchanged = 0
+    # 文件中交易第一次导出时间的最大值，之前导出的交易都应该在这个文件中
+    exported_before: Optional[int] = None
+
+    def flush(chunk: list[QianjiTransaction]) -> None:
+        nonlocal added, changed, unchanged, exported_before
+        ids = [t.id for t in chunk]
+        stored = load_transactions_by_id(ids)
+        exported = last_export_time(ids)
+        if exported is not None:
+            exported_before = max(exported, exported_before or 0)
+        modified = []
+        same = []
+        for t in chunk:
+            if t.id not in stored:
+                added += 1
+                modified.append(t)
+            elif content_hash(stored[t.id]) == content_hash(t):
+                same.append(t.id)
+            else:
+                changed += 1
+                modified.append(t)
+        unchanged += len(same)
+        if modified:
+            insert_transactions(modified, TranStatus.Classified, outbox=True)
+            if on_chunk is not None:
+                on_chunk(modified)
+        if same:
+            confirm_unchanged(same, TranStatus.Classified)
+
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        chunk: list[QianjiTransaction] = []
+        for transaction in iter_confirmed(f, rejected):
+            chunk.append(transaction)
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+
+    if rejected:
+        write_rejected(reject_path, rejected)
+        logger.error(
+            "[confirm rejected][count=%s]%s", len(rejected), reject_path
+        )
+    missing = 0
+    if exported_before is not None:
+        missing = count_pending_export(exported_before)
+    return ConfirmResult(added, changed, unchanged, missing, len(rejected))
@@ -5,6 +5,9 @@ from typing import TypeVar
 
 HEADER = "时间,分类,类型,金额,账户1,账户2,备注,账单标记,账单图片"
 
+# 写入钱迹时默认使用的账本
+DEFAULT_BOOK_NAME = "日常账本"
+
 
 T = TypeVar("T", bound="Enum")
 
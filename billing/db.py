@@ -1,93 +1,496 @@
+import json
 import os
 import sqlite3
+import threading
+import time
 
+from typing import Iterable
+from typing import Iterator
+from typing import KeysView
 from typing import Optional
 
 from billing.const import TranStatus
+from billing.fts import write_index
+from billing.migrations import migrate
+from billing.qianji.batch import TransactionBatch
 from billing.qianji.qianji import QianjiTransaction
 
 
 DBNAME = "mydatabase.db"
 
+# 连接建立后执行的 PRAGMA，WAL 下读写互不阻塞，NORMAL 同步只在检查点时 fsync
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA temp_store = MEMORY",
+)
 
-def create_database() -> None:
-    conn = sqlite3.connect(DBNAME)
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        CREATE TABLE transactions (
-            id TEXT PRIMARY KEY,
-            time INTEGER NOT NULL,
-            classify TEXT NOT NULL,
-            type TEXT NOT NULL,
-            cost REAL NOT NULL,
-            acc_from TEXT NOT NULL,
-            acc_to TEXT,
-            remark TEXT,
-            flag TEXT,
-            pic TEXT,
-            status INTEGER
-        );
+INSERT_TRANSACTION_SQL = """
+INSERT INTO transactions
+    (id, time, classify, type, cost, acc_from, acc_to, remark, flag, status)
+VALUES
+    (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    time = EXCLUDED.time,
+    classify = EXCLUDED.classify,
+    type = EXCLUDED.type,
+    cost = EXCLUDED.cost,
+    acc_from = EXCLUDED.acc_from,
+    acc_to = EXCLUDED.acc_to,
+    remark = EXCLUDED.remark,
+    flag = EXCLUDED.flag,
+    status = EXCLUDED.status
+"""
+
+# load_batch 查询的列，与 TransactionBatch.from_db_rows 的顺序一致
+BATCH_COLUMNS = (
+    "id, time, classify, type, cost, acc_from, acc_to, remark, flag, status"
+)
+
+# existing_ids 每条语句最多带的参数个数，低于 SQLite 的默认上限
+ID_BATCH_SIZE = 500
+
+_db_path = DBNAME
+_local = threading.local()
+
+
+class TransactionCache:
+    """进程内的交易缓存，首次使用时整表读取一次，之后随写入同步更新
+
+    本连接的写入通过 reload 同步；其他连接（例如另一个进程中的 reclassify）
+    提交写入后 PRAGMA data_version 会变化，下次读取时整表重新加载。
+    缓存只能在持有数据库连接的那个线程中使用。
     """
-    )
-    conn.commit()
-    conn.close()
+
+    def __init__(self) -> None:
+        self._transactions: Optional[dict[str, QianjiTransaction]] = None
+        # 按时间倒序排好的交易，写入后失效
+        self._ordered: Optional[list[QianjiTransaction]] = None
+        self._data_version = -1
+
+    def _ensure_loaded(self) -> dict[str, QianjiTransaction]:
+        conn = get_connection()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._transactions is None or version != self._data_version:
+            self._transactions = _select_transactions()
+            self._ordered = list(self._transactions.values())
+            self._data_version = version
+        return self._transactions
+
+    def ids(self) -> KeysView[str]:
+        return self._ensure_loaded().keys()
+
+    def __contains__(self, tid: object) -> bool:
+        return tid in self._ensure_loaded()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._ensure_loaded())
+
+    def __len__(self) -> int:
+        return len(self._ensure_loaded())
+
+    def snapshot(
+        self, status: Optional[TranStatus] = None
+    ) -> dict[str, QianjiTransaction]:
+        """按时间倒序的交易，返回的交易对象与缓存共用，调用方只能读取"""
+        transactions = self._ensure_loaded()
+        if self._ordered is None:
+            self._ordered = sorted(
+                transactions.values(), key=lambda t: t.time, reverse=True
+            )
+        return {
+            t.id: t
+            for t in self._ordered
+            if status is None or t.status == status.value
+        }
+
+    def reload(self, ids: list[str]) -> None:
+        """从数据库重新读取 ids 对应的行"""
+        if self._transactions is None or not ids:
+            return
+        self._transactions.update(_select_transactions(ids))
+        self._ordered = None
+
+
+_cache: Optional[TransactionCache] = None
+
+
+def enable_transaction_cache() -> TransactionCache:
+    """打开写穿缓存，之后 load_transactions_from_db 不再整表查询"""
+    global _cache
+    if _cache is None:
+        _cache = TransactionCache()
+    return _cache
+
+
+def get_transaction_cache() -> Optional[TransactionCache]:
+    return _cache
+
+
+def known_transaction_ids() -> frozenset[str]:
+    """缓存中全部交易单号的快照，未开启缓存时为空"""
+    if _cache is None:
+        return frozenset()
+    return frozenset(_cache.ids())
+
+
+def disable_transaction_cache() -> None:
+    global _cache
+    _cache = None
+
+
+def set_db_path(path: str) -> None:
+    """设置数据库文件路径，之后的调用会使用新路径上的连接"""
+    global _db_path
+    close_connection()
+    _db_path = path
+    if _cache is not None:
+        disable_transaction_cache()
+        enable_transaction_cache()
+
+
+def get_db_path() -> str:
+    return _db_path
+
+
+def get_connection() -> sqlite3.Connection:
+    """返回当前线程的长连接
+
+    连接按 (进程, 数据库绝对路径) 复用，fork 出的子进程或路径变化后会重新连接。
+    """
+    key = (os.getpid(), os.path.abspath(_db_path))
+    conn: Optional[sqlite3.Connection] = getattr(_local, "conn", None)
+    if conn is not None and _local.key == key:
+        return conn
+    if conn is not None and _local.key[0] == key[0]:
+        conn.close()
+    conn = sqlite3.connect(key[1])
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    _local.conn = conn
+    _local.key = key
+    return conn
+
+
+def close_connection() -> None:
+    """关闭当前线程持有的连接"""
+    conn: Optional[sqlite3.Connection] = getattr(_local, "conn", None)
+    if conn is not None and _local.key[0] == os.getpid():
+        conn.close()
+    _local.conn = None
 
 
 def check_and_create_database() -> None:
     # 检查数据库文件是否存在
-    if not os.path.exists(DBNAME):
-        create_database()
+    if not os.path.exists(_db_path):
         print("数据库已创建")
     else:
         print("数据库已存在，无需再次创建")
+    migrate(get_connection())
+
+
+ENQUEUE_OUTBOX_SQL = """
+INSERT INTO adb_outbox (id, attempts, last_error, next_retry, created_at)
+VALUES (?, 0, NULL, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    attempts = 0,
+    last_error = NULL,
+    next_retry = EXCLUDED.next_retry
+"""
 
 
 def insert_transactions(
-    all_transactions: list[QianjiTransaction], status: TranStatus
+    all_transactions: list[QianjiTransaction],
+    status: TranStatus,
+    outbox: bool = False,
 ) -> None:
-    sql = """
-    INSERT INTO transactions
-        (id, time, classify, type, cost, acc_from, acc_to, remark, flag, status)
-    VALUES
-        (%s, %s)
-    ON CONFLICT(id) DO UPDATE SET
-        status = EXCLUDED.status,
-        cost = EXCLUDED.cost,
-        classify = EXCLUDED.classify,
-        remark = EXCLUDED.remark
+    """在一个事务中批量写入交易，已存在的交易用新的内容和状态整行覆盖
+
+    确认时用户可以修改 unconfirmed.csv 中的每一列，发件箱按库中的交易发送，
+    因此不能只更新部分列。
+
+    解析账单得到的交易同时保存分类规则的原始输入。
+    outbox 为 True 时在同一个事务中把交易加入待写入钱迹的发件箱。
     """
-    conn = sqlite3.connect(DBNAME)
-    cursor = conn.cursor()
-    for transaction in all_transactions:
-        cursor.execute(sql % (transaction.dump_to_db(), status.value))
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            INSERT_TRANSACTION_SQL,
+            [t.dump_to_db() + (status.value,) for t in all_transactions],
+        )
+        if outbox:
+            now = int(time.time())
+            conn.executemany(
+                ENQUEUE_OUTBOX_SQL,
+                [(t.id, now, now) for t in all_transactions],
+            )
+        conn.executemany(
+            "UPDATE transactions SET rule_data = ? WHERE id = ?",
+            [
+                (json.dumps(t.rule_data, ensure_ascii=False), t.id)
+                for t in all_transactions
+                if t.rule_data is not None
+            ],
+        )
+        _index_transactions(conn, [t.id for t in all_transactions])
+    refresh_transaction_cache([t.id for t in all_transactions])
 
 
-def load_transactions_from_db(
+def confirm_unchanged(ids: list[str], status: TranStatus) -> None:
+    """只更新状态并加入发件箱，用于确认时内容没有变化的交易"""
+    conn = get_connection()
+    now = int(time.time())
+    with conn:
+        conn.executemany(
+            "UPDATE transactions SET status = ? WHERE id = ?",
+            [(status.value, tid) for tid in ids],
+        )
+        conn.executemany(ENQUEUE_OUTBOX_SQL, [(tid, now, now) for tid in ids])
+    refresh_transaction_cache(ids)
+
+
+def record_exported(ids: Iterable[str], now: Optional[int] = None) -> None:
+    """记录交易第一次导出到 unconfirmed.csv 的时间"""
+    now = int(time.time()) if now is None else now
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "UPDATE transactions SET exported_at = COALESCE(exported_at, ?) "
+            "WHERE id = ?",
+            [(now, tid) for tid in ids],
+        )
+
+
+def last_export_time(ids: Iterable[str]) -> Optional[int]:
+    """ids 中的交易第一次导出时间的最大值，都没有导出过时为 None"""
+    conn = get_connection()
+    ret: Optional[int] = None
+    for batch in _batched(list(ids), ID_BATCH_SIZE):
+        placeholders = ", ".join("?" for _ in batch)
+        value = conn.execute(
+            "SELECT MAX(exported_at) FROM transactions "
+            f"WHERE id IN ({placeholders})",
+            batch,
+        ).fetchone()[0]
+        if value is not None and (ret is None or value > ret):
+            ret = value
+    return ret
+
+
+def count_pending_export(exported_before: int) -> int:
+    """exported_before 之前（含）导出、还没有确认的交易数"""
+    return (
+        get_connection()
+        .execute(
+            "SELECT COUNT(*) FROM transactions "
+            "WHERE status = ? AND exported_at <= ?",
+            (TranStatus.Raw.value, exported_before),
+        )
+        .fetchone()[0]
+    )
+
+
+def load_batch(
+    start: Optional[int] = None,
+    end: Optional[int] = None,
     status: Optional[TranStatus] = None,
+) -> TransactionBatch:
+    """按时间倒序读取 [start, end) 内的交易，不创建 QianjiTransaction"""
+    sql = f"SELECT {BATCH_COLUMNS} FROM transactions"
+    conditions = []
+    params: list = []
+    if start is not None:
+        conditions.append("time >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append("time < ?")
+        params.append(end)
+    if status is not None:
+        conditions.append("status = ?")
+        params.append(status.value)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY time DESC"
+    return TransactionBatch.from_db_rows(get_connection().execute(sql, params))
+
+
+def refresh_transaction_cache(ids: list[str]) -> None:
+    """其他模块直接修改 transactions 表后，用它同步交易缓存"""
+    if _cache is not None:
+        _cache.reload(ids)
+
+
+def _select_transactions(
+    ids: Optional[list[str]] = None,
 ) -> dict[str, QianjiTransaction]:
-    if status:
-        where = "where status = %s" % status.value
+    """读取交易，ids 为 None 时读取整张表"""
+    conn = get_connection()
+    if ids is None:
+        rows: Iterable = conn.execute(
+            "SELECT * FROM transactions ORDER BY time DESC"
+        )
     else:
-        where = ""
-    sql = f"""
-    SELECT * FROM transactions {where} ORDER BY time DESC
+        rows = []
+        for batch in _batched(ids, ID_BATCH_SIZE):
+            placeholders = ", ".join("?" for _ in batch)
+            rows.extend(
+                conn.execute(
+                    f"SELECT * FROM transactions WHERE id IN ({placeholders})",
+                    batch,
+                )
+            )
+    ret = {}
+    for row in rows:
+        transaction = QianjiTransaction.load_from_db(row)
+        ret[transaction.id] = transaction
+    return ret
+
+
+def load_transactions_by_id(ids: list[str]) -> dict[str, QianjiTransaction]:
+    """按单号读取库中当前的交易，不存在的单号不在结果中"""
+    return _select_transactions(ids)
+
+
+def load_transactions_from_db(
+    status: Optional[TranStatus] = None,
+) -> dict[str, QianjiTransaction]:
+    """按时间倒序读取交易
+
+    开启缓存时直接从缓存返回，交易对象与缓存共用，调用方只能读取。
     """
-    conn = sqlite3.connect(DBNAME)
-    cursor = conn.cursor()
-    cursor.execute(sql)
-    # 获取所有行
-    rows = cursor.fetchall()
+    if _cache is not None:
+        return _cache.snapshot(status)
+    if status is None:
+        return _select_transactions()
 
     ret = {}
-    # 打印结果
-    for row in rows:
+    for row in get_connection().execute(
+        "SELECT * FROM transactions WHERE status = ? ORDER BY time DESC",
+        (status.value,),
+    ):
         transaction = QianjiTransaction.load_from_db(row)
         ret[transaction.id] = transaction
+    return ret
+
+
+def _batched(items: list[str], size: int) -> Iterator[list[str]]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
 
-    # 关闭游标和连接
-    cursor.close()
-    conn.close()
+def _index_transactions(conn: sqlite3.Connection, ids: list[str]) -> None:
+    """按库中当前的内容重建这些交易的全文索引，在写入交易的事务中调用"""
+    for chunk in _batched(ids, ID_BATCH_SIZE):
+        placeholders = ",".join("?" * len(chunk))
+        write_index(
+            conn,
+            conn.execute(
+                f"SELECT id, classify, acc_from, remark FROM transactions "
+                f"WHERE id IN ({placeholders})",
+                chunk,
+            ).fetchall(),
+        )
+
+
+def existing_ids(ids: Iterable[str]) -> set[str]:
+    """返回 ids 中已经在库中的交易单号，按批走主键索引查询"""
+    ids = list(ids)
+    if _cache is not None:
+        known = _cache.ids()
+        return {tid for tid in ids if tid in known}
+    conn = get_connection()
+    ret: set[str] = set()
+    for batch in _batched(ids, ID_BATCH_SIZE):
+        placeholders = ", ".join("?" for _ in batch)
+        ret.update(
+            row[0]
+            for row in conn.execute(
+                f"SELECT id FROM transactions WHERE id IN ({placeholders})",
+                batch,
+            )
+        )
     return ret
+
+
+def iter_transaction_chunks(
+    statuses: list[TranStatus], chunk_size: int = 2000
+) -> Iterator[list[tuple]]:
+    """按 id 分页读取指定状态的交易，每次只在内存中保留一页
+
+    每页都是独立的查询，两页之间可以安全地写回数据库。
+    返回的行格式为 (id, classify, type, remark, status, rule_data)。
+    """
+    placeholders = ", ".join("?" for _ in statuses)
+    sql = f"""
+    SELECT id, classify, type, remark, status, rule_data FROM transactions
+    WHERE status IN ({placeholders}) AND id > ?
+    ORDER BY id LIMIT ?
+    """
+    last_id = ""
+    while True:
+        rows = (
+            get_connection()
+            .execute(sql, [s.value for s in statuses] + [last_id, chunk_size])
+            .fetchall()
+        )
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def update_classify(updates: list[tuple[str, str, str]]) -> None:
+    """批量更新分类，updates 中每项为 (classify, remark, id)"""
+    if not updates:
+        return
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "UPDATE transactions SET classify = ?, remark = ? WHERE id = ?",
+            updates,
+        )
+        _index_transactions(conn, [tid for _, _, tid in updates])
+    refresh_transaction_cache([tid for _, _, tid in updates])
+
+
+def is_bill_file_ingested(digest: str) -> bool:
+    row = (
+        get_connection()
+        .execute("SELECT 1 FROM bill_files WHERE digest = ?", (digest,))
+        .fetchone()
+    )
+    return row is not None
+
+
+def record_bill_file(
+    digest: str,
+    file_path: str,
+    loader_name: str,
+    transactions: list[QianjiTransaction],
+) -> None:
+    """记录一个已入库的账单文件，以及它产生的交易单号和时间范围"""
+    tids = sorted(t.id for t in transactions)
+    times = [t.time for t in transactions]
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO bill_files
+                (digest, file_name, loader, size, tid_count, first_tid,
+                 last_tid, min_time, max_time, ingested_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                digest,
+                os.path.basename(file_path),
+                loader_name,
+                os.path.getsize(file_path),
+                len(tids),
+                tids[0] if tids else None,
+                tids[-1] if tids else None,
+                min(times) if times else None,
+                max(times) if times else None,
+                int(time.time()),
+            ),
+        )
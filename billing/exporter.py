@@ -0,0 +1,186 @@
+import codecs
+import os
+import re
+import threading
+import time
+
+from datetime import datetime
+from typing import Callable
+from typing import Iterable
+from typing import Optional
+
+from billing.const import HEADER
+from billing.db import load_batch
+from billing.file_utils import ensure_dir_exist
+from billing.logger import logger
+from billing.qianji.batch import TransactionBatch
+from billing.qianji.qianji import QianjiTransaction
+
+
+PARTITION_REGEX = re.compile(r"^\d{4}-\d{2}\.csv$")
+LINE_SEP = "\r\n"
+
+
+def month_key(timestamp: int) -> tuple[int, int]:
+    local = time.localtime(timestamp)
+    return local.tm_year, local.tm_mon
+
+
+def month_range(key: tuple[int, int]) -> tuple[int, int]:
+    """本地时间下某月的 [起始, 结束) 时间戳"""
+    year, month = key
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    start = datetime(year, month, 1).timestamp()
+    end = datetime(next_year, next_month, 1).timestamp()
+    return int(start), int(end)
+
+
+def _write_atomic(path: str, content: bytes) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _encode(lines: list[str]) -> bytes:
+    return codecs.BOM_UTF8 + bytes(LINE_SEP.join(lines), encoding="utf-8")
+
+
+class OutputExporter:
+    """按月分区导出交易，只重写有变化的月份
+
+    每个月写成 output_dir/YYYY-MM.csv，combined 为 True 时再把所有分区
+    按时间倒序拼接成 output.csv。标记为脏之后要等 debounce 秒内没有新的
+    变化才会导出，持续有变化时最多推迟 max_delay 秒。
+
+    mark_dirty 和 flush 可以在不同线程中调用，flush 只在持锁时取走脏月份，
+    写文件时不会阻塞 mark_dirty。
+    """
+
+    COMBINED_NAME = "output.csv"
+
+    def __init__(
+        self,
+        output_dir: str,
+        combined: bool = True,
+        debounce: float = 1.0,
+        max_delay: float = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._output_dir = output_dir
+        self._combined = combined
+        self._debounce = debounce
+        self._max_delay = max_delay
+        self._clock = clock
+        self._dirty_months: set[tuple[int, int]] = set()
+        self._all_dirty = False
+        # 第一次和最近一次标记为脏的时间
+        self._first_dirty: Optional[float] = None
+        self._last_dirty = 0.0
+        # _lock 保护上面的脏状态，_flush_lock 保证同一时间只有一个导出
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    @property
+    def dirty(self) -> bool:
+        return self._all_dirty or bool(self._dirty_months)
+
+    def _touch(self) -> None:
+        now = self._clock()
+        if self._first_dirty is None:
+            self._first_dirty = now
+        self._last_dirty = now
+
+    def mark_dirty(self, transactions: Iterable[QianjiTransaction]) -> None:
+        months = {month_key(t.time) for t in transactions}
+        if months:
+            with self._lock:
+                self._dirty_months |= months
+                self._touch()
+
+    def mark_all_dirty(self) -> None:
+        with self._lock:
+            self._all_dirty = True
+            self._touch()
+
+    def due(self) -> bool:
+        if not self.dirty or self._first_dirty is None:
+            return False
+        now = self._clock()
+        return (
+            now - self._last_dirty >= self._debounce
+            or now - self._first_dirty >= self._max_delay
+        )
+
+    def flush(self, force: bool = False) -> int:
+        """到期时导出有变化的月份，返回重写的分区数"""
+        with self._flush_lock:
+            with self._lock:
+                if not (self.due() or (force and self.dirty)):
+                    return 0
+                all_dirty = self._all_dirty
+                months = sorted(self._dirty_months)
+                self._dirty_months.clear()
+                self._all_dirty = False
+                self._first_dirty = None
+
+            ensure_dir_exist(self._output_dir)
+            if all_dirty:
+                count = self._export_all()
+            else:
+                for key in months:
+                    self._export_month(key)
+                count = len(months)
+            if self._combined:
+                self._write_combined()
+        logger.debug("[export output][partitions=%s]", count)
+        return count
+
+    def partition_path(self, key: tuple[int, int]) -> str:
+        return os.path.join(self._output_dir, "%04d-%02d.csv" % key)
+
+    def _partition_keys(self) -> list[tuple[int, int]]:
+        keys = []
+        for file_name in os.listdir(self._output_dir):
+            if PARTITION_REGEX.match(file_name):
+                keys.append((int(file_name[:4]), int(file_name[5:7])))
+        return keys
+
+    def _write_partition(
+        self, key: tuple[int, int], batch: TransactionBatch
+    ) -> None:
+        path = self.partition_path(key)
+        if not len(batch):
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        _write_atomic(path, _encode([HEADER] + batch.dump_lines()))
+
+    def _export_month(self, key: tuple[int, int]) -> None:
+        start, end = month_range(key)
+        self._write_partition(key, load_batch(start, end))
+
+    def _export_all(self) -> int:
+        # 直接查询数据库而不是读取交易缓存，导出可能运行在其他线程
+        batch = load_batch()
+        by_month: dict[tuple[int, int], list[int]] = {}
+        for index, timestamp in enumerate(batch.times):
+            by_month.setdefault(month_key(timestamp), []).append(index)
+        for key in self._partition_keys():
+            by_month.setdefault(key, [])
+        for key, indexes in by_month.items():
+            self._write_partition(key, batch.take(indexes))
+        return len(by_month)
+
+    def _write_combined(self) -> None:
+        """按月份倒序拼接各分区文件，不再访问数据库"""
+        header = _encode([HEADER])
+        parts = [header]
+        for key in sorted(self._partition_keys(), reverse=True):
+            with open(self.partition_path(key), "rb") as f:
+                body = f.read()[len(header) :]
+            parts.append(body)
+        _write_atomic(
+            os.path.join(self._output_dir, self.COMBINED_NAME),
+            b"".join(parts),
+        )
@@ -1,5 +1,7 @@
 import datetime
+import hashlib
 import os
+import shutil
 import traceback
 
 from typing import Callable
@@ -17,6 +19,15 @@ def ensure_dir_exist(path: str) -> None:
             raise
 
 
+def file_digest(file_path: str, chunk_size: int = 1 << 16) -> str:
+    """按块读取文件，返回内容的 sha256"""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
 def scan_and_move(
     source_dir: str,
     destination_dir: str,
@@ -55,3 +66,39 @@ def scan_and_move(
         print(datetime.datetime.now().strftime("%Y/%m/%d, %H:%M:%S"))
         traceback.print_exc()
         return {}
+
+
+def move_file(
+    file_path: str, destination_dir: str, prefix: str = "", postfix: str = ""
+) -> str:
+    """把文件移动到 destination_dir，文件名加上前后缀，返回新路径"""
+    base_name, ext = os.path.splitext(os.path.basename(file_path))
+    destination_path = os.path.join(
+        destination_dir, f"{prefix}{base_name}{postfix}{ext}"
+    )
+    shutil.move(file_path, destination_path)
+    return destination_path
+
+
+def scan_and_move_files(
+    source_dir: str,
+    destination_dir: str,
+    file_filter: Callable = is_target_file,
+    prefix: str = "",
+    postfix: str = "",
+) -> list[str]:
+    """与 scan_and_move 相同，但不把文件读入内存，只返回移动后的路径"""
+    try:
+        moved = []
+        for file_name in filter(file_filter, os.listdir(source_dir)):
+            file_path = os.path.join(source_dir, file_name)
+            if not os.path.isfile(file_path):
+                continue
+            moved.append(
+                move_file(file_path, destination_dir, prefix, postfix)
+            )
+        return moved
+    except Exception:
+        print(datetime.datetime.now().strftime("%Y/%m/%d, %H:%M:%S"))
+        traceback.print_exc()
+        return []
@@ -0,0 +1,98 @@
+import re
+import sqlite3
+
+from typing import Iterable
+
+
+# 中日韩文字没有空格分词，逐字切开后交给 unicode61 分词器，
+# 短语查询 "盒 马" 即相当于子串匹配
+_CJK_REGEX = re.compile(
+    r"([぀-ヿ㐀-䶿一-鿿豈-﫿"
+    r"\U00020000-\U0002ffff])"
+)
+
+
+def fts_tokens(text: object) -> str:
+    """把文本转换为写入全文索引的形式"""
+    if not text:
+        return ""
+    return _CJK_REGEX.sub(r" \1 ", str(text))
+
+
+def fts_remark_part(remark: object, index: int) -> str:
+    """取出 name--counterparty--merchandise--[TID:...] 格式备注中的一段"""
+    if not remark:
+        return ""
+    parts = str(remark).split("--")
+    if len(parts) < 4 or not 0 <= index < len(parts):
+        return ""
+    return fts_tokens(parts[index])
+
+
+# transactions_fts 的列，counterparty 和 merchandise 取自备注
+FTS_COLUMNS = "counterparty, merchandise, remark, classify, acc_from"
+
+# 全文索引的行号取自 transactions_fts_docs.docid，按交易单号查找，
+# 不依赖 transactions 的隐式 rowid（VACUUM 可能重新编号）
+_ADD_DOC_SQL = (
+    "INSERT INTO transactions_fts_docs (id) VALUES (?) "
+    "ON CONFLICT(id) DO NOTHING"
+)
+_DELETE_FTS_SQL = (
+    "DELETE FROM transactions_fts WHERE rowid = "
+    "(SELECT docid FROM transactions_fts_docs WHERE id = ?)"
+)
+_INSERT_FTS_SQL = (
+    f"INSERT INTO transactions_fts (rowid, {FTS_COLUMNS}) "
+    f"SELECT docid, ?, ?, ?, ?, ? FROM transactions_fts_docs WHERE id = ?"
+)
+
+
+def fts_values(
+    classify: str, acc_from: str, remark: str
+) -> tuple[str, str, str, str, str]:
+    """一笔交易写入 transactions_fts 各列的文本，顺序与 FTS_COLUMNS 一致"""
+    return (
+        fts_remark_part(remark, 1),
+        fts_remark_part(remark, 2),
+        fts_tokens(remark),
+        fts_tokens(classify),
+        fts_tokens(acc_from),
+    )
+
+
+def write_index(
+    conn: sqlite3.Connection, rows: Iterable[tuple[str, str, str, str]]
+) -> None:
+    """重建一批交易的全文索引，rows 中每项为 (id, classify, acc_from, remark)
+
+    分词在 Python 中完成，调用方负责开启事务。
+    """
+    rows = list(rows)
+    ids = [(row[0],) for row in rows]
+    conn.executemany(_ADD_DOC_SQL, ids)
+    conn.executemany(_DELETE_FTS_SQL, ids)
+    conn.executemany(
+        _INSERT_FTS_SQL,
+        [fts_values(*row[1:]) + (row[0],) for row in rows],
+    )
+
+
+def build_match(query: str) -> str:
+    """把用户输入转换为 FTS5 MATCH 表达式
+
+    空格分隔的词之间为 AND 关系；用双引号包住的部分作为整体短语匹配；
+    以 * 结尾的词做前缀匹配。中文按字切分，因此"盒马"会匹配"广州盒马"。
+    """
+    terms = []
+    for match in re.finditer(r'"([^"]*)"|(\S+)', query):
+        phrase, word = match.groups()
+        text = phrase if phrase is not None else word
+        prefix = phrase is None and text.endswith("*")
+        text = text.rstrip("*") if prefix else text
+        tokens = fts_tokens(text).split()
+        if not tokens:
+            continue
+        term = '"' + " ".join(tokens).replace('"', '""') + '"'
+        terms.append(term + " *" if prefix else term)
+    return " AND ".join(terms)
@@ -0,0 +1,114 @@
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Collection
+from typing import Optional
+from typing import Type
+
+from billing.bill_loader.base import Loader
+from billing.logger import logger
+from billing.qianji.qianji import QianjiTransaction
+
+
+# 工作进程中按 Loader 名称保存的实例，每个文件开始解析时都会清空其状态
+_worker_loaders: dict[str, Loader] = {}
+_worker_known_ids: Collection[str] = frozenset()
+
+
+def _init_worker(
+    loader_classes: list[Type[Loader]],
+    account_rules: list[dict],
+    classify_rules: list[dict],
+    known_ids: frozenset[str],
+) -> None:
+    global _worker_loaders, _worker_known_ids
+    loaders = [cls(account_rules, classify_rules) for cls in loader_classes]
+    _worker_loaders = {loader.name: loader for loader in loaders}
+    _worker_known_ids = known_ids
+
+
+def parse_bill_file(
+    loader: Loader, file_path: str, known_ids: Collection[str] = ()
+) -> list[QianjiTransaction]:
+    """解析一个账单文件，只返回有效的新交易
+
+    交易单号在 known_ids 中的行会在匹配账户和分类规则之前被跳过。
+    """
+    with open(file_path, "rb") as f:
+        ret = [
+            t for t in loader.iter_transactions(f, known_ids) if t.is_valid()
+        ]
+    logger.debug(
+        "[parse bill file][%s][count=%s][rule cache=%s]",
+        file_path,
+        len(ret),
+        loader.rule_cache_info(),
+    )
+    return ret
+
+
+def _parse_in_worker(
+    loader_name: str, file_path: str
+) -> list[QianjiTransaction]:
+    return parse_bill_file(
+        _worker_loaders[loader_name], file_path, _worker_known_ids
+    )
+
+
+def parse_bill_files_separately(
+    jobs: list[tuple[Loader, str]],
+    known_ids: Collection[str],
+    workers: Optional[int] = None,
+) -> list[list[QianjiTransaction]]:
+    """解析多个账单文件，按 jobs 的顺序返回每个文件中的新交易
+
+    多个文件时在进程池中并行解析，每个工作进程为每种 Loader 持有独立实例，
+    规则取自 jobs 中 Loader 当前使用的规则。
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(jobs) <= 1:
+        return [
+            parse_bill_file(loader, path, known_ids) for loader, path in jobs
+        ]
+
+    first_loader = jobs[0][0]
+    loader_classes = list({type(loader): None for loader, _ in jobs})
+    with ProcessPoolExecutor(
+        min(workers, len(jobs)),
+        initializer=_init_worker,
+        initargs=(
+            loader_classes,
+            first_loader.account_rules,
+            first_loader.classify_rules,
+            frozenset(known_ids),
+        ),
+    ) as executor:
+        return list(
+            executor.map(
+                _parse_in_worker,
+                [loader.name for loader, _ in jobs],
+                [path for _, path in jobs],
+            )
+        )
+
+
+def merge_transactions(
+    results: list[list[QianjiTransaction]],
+) -> dict[str, QianjiTransaction]:
+    """按交易单号合并，同一交易出现在多个文件中时以靠后的文件为准"""
+    new_transactions: dict[str, QianjiTransaction] = {}
+    for transactions in results:
+        for transaction in transactions:
+            new_transactions[transaction.id] = transaction
+    return new_transactions
+
+
+def parse_bill_files(
+    jobs: list[tuple[Loader, str]],
+    known_ids: Collection[str],
+    workers: Optional[int] = None,
+) -> dict[str, QianjiTransaction]:
+    """解析多个账单文件，按交易单号合并，并去掉 known_ids 中已有的交易"""
+    return merge_transactions(
+        parse_bill_files_separately(jobs, known_ids, workers)
+    )
@@ -1,6 +1,6 @@
 import logging
 
-from typing import Tuple
+from typing import Any
 
 
 class Logger:
@@ -21,20 +21,20 @@ class Logger:
     def set_level(self, level: int = logging.DEBUG) -> None:
         logging.getLogger().setLevel(level)
 
-    def debug(self, text: str, *args: Tuple) -> None:
+    def debug(self, text: str, *args: Any) -> None:
         text = "    \t" + text % args
         logging.debug(text)
 
-    def info(self, text: str, *args: Tuple) -> None:
+    def info(self, text: str, *args: Any) -> None:
         logging.info(text % args)
 
-    def warning(self, text: str, *args: Tuple) -> None:
+    def warning(self, text: str, *args: Any) -> None:
         logging.warning(text % args)
 
-    def error(self, text: str, *args: Tuple) -> None:
+    def error(self, text: str, *args: Any) -> None:
         logging.error(text % args)
 
-    def show(self, text: str, *args: Tuple) -> None:
+    def show(self, text: str, *args: Any) -> None:
         logging.info(text % args)
 
 
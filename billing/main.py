@@ -1,130 +1,166 @@
 import argparse
 import asyncio
-import codecs
-import json
+import csv
 import os
-import re
-import subprocess
 import time
 
 from functools import partial
-from typing import Type  # noqa: F401
+from typing import Optional
 
 from ytzlib.tick_helper import ticker
 
-from billing.bill_loader import AlipayBillLoader
-from billing.bill_loader import WeChatBillLoader
+from billing.adb import AdbSession
+from billing.aio import AsyncIO
+from billing.bill_loader import registered_loaders
 from billing.bill_loader.base import Loader
+from billing.confirm import import_confirmed_file
+from billing.const import DEFAULT_BOOK_NAME
 from billing.const import HEADER
 from billing.const import TranStatus
+from billing.db import DBNAME
 from billing.db import check_and_create_database
+from billing.db import enable_transaction_cache
+from billing.db import existing_ids
 from billing.db import insert_transactions
+from billing.db import is_bill_file_ingested
+from billing.db import known_transaction_ids
 from billing.db import load_transactions_from_db
+from billing.db import record_bill_file
+from billing.db import record_exported
+from billing.db import set_db_path
+from billing.exporter import OutputExporter
 from billing.file_utils import ensure_dir_exist
-from billing.file_utils import scan_and_move
+from billing.file_utils import file_digest
+from billing.file_utils import move_file
+from billing.file_utils import scan_and_move_files
+from billing.ingest import merge_transactions
+from billing.ingest import parse_bill_files_separately
 from billing.logger import logger
+from billing.outbox import fetch_due
+from billing.outbox import mark_failed
+from billing.outbox import mark_sent
+from billing.outbox import mark_unknown
 from billing.qianji.qianji import QianjiTransaction
+from billing.rules import RuleSetManager
+from billing.sinks import AdbIntentSink
+from billing.sinks import OutputSink
+from billing.sinks import QianjiCsvSink
 
 
-def dump_db(output_dir: str) -> None:
-    all_transactions = load_transactions_from_db()
-    output = [t.dump() for t in all_transactions.values()]
-    output.insert(0, HEADER)
-    ensure_dir_exist(output_dir)
-    with open(os.path.join(output_dir, "output.csv"), "wb") as f:
-        b = bytes("\r\n".join(output), encoding="utf-8")
-        f.write(codecs.BOM_UTF8 + b)
+# 默认每轮从发件箱取出的交易数，写入 CSV 时一次可以取出很多
+OUTBOX_BATCH_SIZE = 20
+CSV_BATCH_SIZE = 5000
 
 
-def load_rules_file(file_path: str) -> list:
-    all_rules: list = []
-    with open(file_path, "r", encoding="utf-8") as fp:
-        try:
-            all_rules = json.load(fp)
-        except Exception:
-            pass
-    seen = set()
-    unique_rules = []
-    for rule in all_rules:
-        rule_dump = json.dumps(rule)
-        if rule_dump not in seen:
-            seen.add(rule_dump)
-            unique_rules.append(rule)
-    unique_rules.sort(key=lambda rule: rule.get("order", 99))
-    return unique_rules
-
-
-def load_from_raw_bill(args: "BillingArgs", event: asyncio.Event) -> None:
-    """从微信支付宝账单数据读取新产生的交易，写入数据库"""
-    all_transactions = load_transactions_from_db()
-    dump_db(args.output_path)
+def archive_raw_bills(
+    args: "BillingArgs", rule_manager: RuleSetManager
+) -> list[tuple[Loader, str, str]]:
+    """把新出现的账单移动到归档目录，返回 (Loader, 归档路径, 内容摘要)"""
     raw_data_path = os.path.join(args.work_dir, "!raw_bill")
     ensure_dir_exist(raw_data_path)
     dump_path = os.path.join(args.work_dir, "archived", "raw_bills")
     ensure_dir_exist(dump_path)
 
-    account_rules_list: list = load_rules_file(args.account_rules)
-    classify_rules_list: list = load_rules_file(args.classify_rules)
-    loaders = [
-        WeChatBillLoader,
-        AlipayBillLoader,
-    ]  # type: list[Type[Loader]]
-    new_transactions: dict[str, QianjiTransaction] = {}
-    for loader_cls in loaders:
-        loader: Loader = loader_cls(account_rules_list, classify_rules_list)
-
-        def file_name_validator(
-            file_name: str, regex_pattern: str = loader.file_regex
-        ) -> bool:
-            regex = re.compile(regex_pattern)
-            return regex.match(file_name) is not None
-
-        file_contents = scan_and_move(
-            raw_data_path, dump_path, file_name_validator
-        )
-        for csv_file_contents in file_contents.values():
-            transactions = loader.parse_file_content(
-                csv_file_contents.decode(loader.encoding)
-            )
-            for transaction in transactions:
-                tid = transaction.id
-                if transaction.is_valid() and tid not in all_transactions:
-                    new_transactions[tid] = transaction
+    rule_manager.refresh()
+    archived = []
+    for loader, file_path in rule_manager.dispatcher.scan(raw_data_path):
+        try:
+            archived_path = move_file(file_path, dump_path)
+            digest = file_digest(archived_path)
+        except OSError as e:
+            logger.error("[move raw bill failed][%s]%s", file_path, e)
+            continue
+        archived.append((loader, archived_path, digest))
+    return archived
+
+
+def record_bill_files(
+    jobs: list[tuple[Loader, str]],
+    digests: list[str],
+    results: list[list[QianjiTransaction]],
+) -> None:
+    for (loader, path), digest, transactions in zip(jobs, digests, results):
+        record_bill_file(digest, path, loader.name, transactions)
+
+
+async def load_from_raw_bill(
+    args: "BillingArgs",
+    aio: AsyncIO,
+    rule_manager: RuleSetManager,
+    exporter: OutputExporter,
+    event: asyncio.Event,
+) -> None:
+    """从微信支付宝账单数据读取新产生的交易，写入数据库
+
+    没有新账单文件时只扫描一次目录，不访问数据库。
+    """
+    archived = await aio.io(archive_raw_bills, args, rule_manager)
+    if not archived:
+        return
+
+    jobs: list[tuple[Loader, str]] = []
+    digests: list[str] = []
+    for loader, path, digest in archived:
+        # 内容完全相同的账单已经入过库，直接跳过
+        if digest in digests or await aio.db(is_bill_file_ingested, digest):
+            logger.show("[skip ingested raw bill][%s]", path)
+            continue
+        jobs.append((loader, path))
+        digests.append(digest)
+    if not jobs:
+        return
+
+    # 开启缓存时可以在匹配规则之前跳过已入库的交易，否则只在解析后去重
+    known_ids = await aio.db(known_transaction_ids)
+    results = await aio.io(
+        parse_bill_files_separately, jobs, known_ids, args.workers
+    )
+    new_transactions = merge_transactions(results)
+    for tid in await aio.db(existing_ids, new_transactions):
+        del new_transactions[tid]
     if new_transactions:
         logger.show(
             "[load transactions from wechat and alipay][new count=%s]",
             len(new_transactions)
         )
+        await aio.db(
+            insert_transactions,
+            list(new_transactions.values()),
+            TranStatus.Raw,
+        )
         event.set()
-        insert_transactions(list(new_transactions.values()), TranStatus.Raw)
-        dump_db(args.output_path)
-        all_transactions.update(new_transactions)
+        exporter.mark_dirty(new_transactions.values())
+    await aio.db(record_bill_files, jobs, digests, results)
+
+
+def write_unconfirmed(
+    dump_path: str, unconfirmed_t: dict[str, QianjiTransaction]
+) -> None:
+    """写出待确认交易"""
+    # 按 CSV 规则写出，备注中含逗号时会加引号
+    with open(dump_path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(HEADER.split(","))
+        writer.writerows(t.dump_fields() for t in unconfirmed_t.values())
 
 
 async def output_confirmed_data(
-    args: "BillingArgs", event: asyncio.Event
+    args: "BillingArgs", aio: AsyncIO, event: asyncio.Event
 ) -> None:
     """将未分类交易输出到文件，等待用户确认"""
     dump_path = os.path.join(args.work_dir, "unconfirmed.csv")
     await event.wait()
-    unconfirmed_t = load_transactions_from_db(TranStatus.Raw)
-    if unconfirmed_t:
-        output = [t.dump() for t in unconfirmed_t.values()]
-        output.insert(0, HEADER)
-        with open(dump_path, "wb") as f:
-            b = bytes("\n".join(output), encoding="utf-8")
-            f.write(codecs.BOM_UTF8 + b)
-            logger.show(
-                "[write unconfirmed transactions][count=%s]",
-                len(unconfirmed_t)
-            )
     event.clear()
+    unconfirmed_t = await aio.db(load_transactions_from_db, TranStatus.Raw)
+    if unconfirmed_t:
+        await aio.io(write_unconfirmed, dump_path, unconfirmed_t)
+        await aio.db(record_exported, list(unconfirmed_t))
+        logger.show(
+            "[write unconfirmed transactions][count=%s]", len(unconfirmed_t)
+        )
 
 
-async def handle_confirmed_data(
-    args: "BillingArgs", queue: asyncio.Queue
-) -> None:
-    """将已确认的数据入库"""
+def collect_confirmed_files(args: "BillingArgs") -> list[str]:
     input_path = os.path.join(args.work_dir, "confirmed")
     ensure_dir_exist(input_path)
     dump_path = os.path.join(args.work_dir, "archived", "confirmed")
@@ -134,53 +170,121 @@ async def handle_confirmed_data(
         return file_name == "unconfirmed.csv"
 
     postfix = "-" + str(int(time.time()))
-    contents = scan_and_move(
+    return scan_and_move_files(
         input_path, dump_path, file_name_validator, postfix=postfix
     )
-    for _, content in contents.items():
-        confirmed = QianjiTransaction.load_from_file_content(
-            content.decode("utf-8")
+
+
+async def handle_confirmed_data(
+    args: "BillingArgs", aio: AsyncIO, exporter: OutputExporter
+) -> None:
+    """将已确认的数据分块入库，并在同一个事务中放入发件箱等待写入钱迹
+
+    不合法的行写入 rejected 目录下的同名文件，不影响其他行。
+    """
+    paths = await aio.io(collect_confirmed_files, args)
+    reject_dir = os.path.join(args.work_dir, "rejected")
+    for path in paths:
+        ensure_dir_exist(reject_dir)
+        reject_path = os.path.join(reject_dir, os.path.basename(path))
+        result = await aio.db(
+            import_confirmed_file, path, reject_path, exporter.mark_dirty
+        )
+        logger.show(
+            "[transactions confirmed][added=%s][changed=%s][unchanged=%s]"
+            "[missing=%s][rejected=%s]",
+            *result,
         )
-        if confirmed:
-            insert_transactions(
-                list(confirmed.values()), TranStatus.Classified
-            )
-            dump_db(args.output_path)
-            logger.show("[transactions confirmed][count=%s]", len(confirmed))
-            for t in confirmed.values():
-                await queue.put(t)
-
-
-async def finial_adb_output(args: "BillingArgs", queue: asyncio.Queue) -> None:
-    transaction: QianjiTransaction = await queue.get()
-    adb_cmd = transaction.dump_to_adb_command()
-    insert_transactions(
-        [
-            transaction,
-        ],
-        TranStatus.Written,
-    )
-    dump_db(args.output_path)
-    logger.debug(adb_cmd)
-    subprocess.run(adb_cmd, shell=True)
+
+
+def create_sink(args: "BillingArgs", aio: AsyncIO) -> OutputSink:
+    if args.sink == "csv":
+        return QianjiCsvSink(
+            aio,
+            os.path.join(args.work_dir, "qianji_import"),
+            args.book_name,
+            args.csv_batch_size,
+        )
+    return AdbIntentSink(
+        AdbSession(pace=args.adb_pace), args.book_name, args.adb_batch_size
+    )
+
+
+async def deliver_outbox(
+    aio: AsyncIO, exporter: OutputExporter, sink: OutputSink
+) -> None:
+    """把发件箱中到期的一批交易交给 sink 写入钱迹
+
+    成功的交易标记为已写入，失败的按退避时间推迟，结果未知的不再自动重试。
+    """
+    items = await aio.db(fetch_due, sink.batch_size)
+    if not items:
+        return
+    result = await sink.send([item.transaction for item in items])
+    for transaction, error in result.failed:
+        await aio.db(mark_failed, transaction.id, error)
+    for transaction, error in result.unknown:
+        await aio.db(mark_unknown, transaction.id, error)
+    if result.sent:
+        await aio.db(mark_sent, [t.id for t in result.sent])
+        exporter.mark_dirty(result.sent)
+    logger.show(
+        "[output transactions][sent=%s][failed=%s][unknown=%s]",
+        len(result.sent),
+        len(result.failed),
+        len(result.unknown),
+    )
+
+
+async def export_output(aio: AsyncIO, exporter: OutputExporter) -> None:
+    if exporter.due():
+        await aio.io(exporter.flush)
+
+
+def init_database(args: "BillingArgs") -> None:
+    set_db_path(args.db_path)
+    check_and_create_database()
+    if args.transaction_cache:
+        enable_transaction_cache()
 
 
 async def main() -> None:
     args = parse_arguments()
     ensure_dir_exist(args.work_dir)
     logger.init(os.path.join(args.work_dir, "log.txt"))
-    check_and_create_database()
+    aio = AsyncIO()
+    # 数据库连接和交易缓存都只在数据库线程中使用
+    await aio.db(init_database, args)
+    exporter = OutputExporter(args.output_path, args.combined_output)
+    exporter.mark_all_dirty()
+    await aio.io(exporter.flush, True)
+    rule_manager = RuleSetManager(
+        args.account_rules, args.classify_rules, registered_loaders()
+    )
     unconfirmed_transaction_event = asyncio.Event()
-    func = partial(load_from_raw_bill, args, unconfirmed_transaction_event)
+    func = partial(
+        load_from_raw_bill,
+        args,
+        aio,
+        rule_manager,
+        exporter,
+        unconfirmed_transaction_event,
+    )
     ticker.repeat_call(func, 3.0)
-    func = partial(output_confirmed_data, args, unconfirmed_transaction_event)  # type: ignore
+    func = partial(output_confirmed_data, args, aio, unconfirmed_transaction_event)  # type: ignore
     ticker.repeat_call(func, 1.0)
-    uninsert_transaction_list: asyncio.Queue = asyncio.Queue()
-    func = partial(handle_confirmed_data, args, uninsert_transaction_list)  # type: ignore
+    func = partial(handle_confirmed_data, args, aio, exporter)  # type: ignore
     ticker.repeat_call(func, 3.0)
-    func = partial(finial_adb_output, args, uninsert_transaction_list)  # type: ignore
+    sink = create_sink(args, aio)
+    func = partial(deliver_outbox, aio, exporter, sink)  # type: ignore
     ticker.repeat_call(func, 4.0)
-    await asyncio.gather(ticker.start())
+    func = partial(export_output, aio, exporter)  # type: ignore
+    ticker.repeat_call(func, 1.0)
+    try:
+        await asyncio.gather(ticker.start())
+    finally:
+        await sink.close()
+        aio.shutdown()
 
 
 class BillingArgs(argparse.Namespace):
@@ -189,6 +293,15 @@ class BillingArgs(argparse.Namespace):
         self.classify_rules: str = ""
         self.work_dir: str = ""
         self.output_path: str = "output"
+        self.workers: Optional[int] = None
+        self.db_path: str = DBNAME
+        self.transaction_cache: bool = True
+        self.combined_output: bool = True
+        self.adb_batch_size: int = OUTBOX_BATCH_SIZE
+        self.adb_pace: float = 0.2
+        self.sink: str = "adb"
+        self.book_name: str = DEFAULT_BOOK_NAME
+        self.csv_batch_size: int = CSV_BATCH_SIZE
 
 
 def parse_arguments() -> BillingArgs:
@@ -217,6 +330,62 @@ def parse_arguments() -> BillingArgs:
         type=str,
         help="Path to the output CSV file.",
     )
+    parser.add_argument(
+        "--workers",
+        default=None,
+        type=int,
+        help="Processes used to parse raw bills, defaults to the CPU count.",
+    )
+    parser.add_argument(
+        "--db-path",
+        default=DBNAME,
+        type=str,
+        help="Path to the SQLite database file.",
+    )
+    parser.add_argument(
+        "--no-combined-output",
+        dest="combined_output",
+        action="store_false",
+        help="Only write monthly YYYY-MM.csv files, skip output.csv.",
+    )
+    parser.add_argument(
+        "--no-transaction-cache",
+        dest="transaction_cache",
+        action="store_false",
+        help="Query the database on every read instead of caching "
+        "transactions in memory.",
+    )
+    parser.add_argument(
+        "--adb-batch-size",
+        default=OUTBOX_BATCH_SIZE,
+        type=int,
+        help="Transactions sent to Qianji through adb per round.",
+    )
+    parser.add_argument(
+        "--adb-pace",
+        default=0.2,
+        type=float,
+        help="Seconds to wait on the device between two intents.",
+    )
+    parser.add_argument(
+        "--sink",
+        default="adb",
+        choices=["adb", "csv"],
+        help="Deliver confirmed transactions through adb intents, or write "
+        "them to work_dir/qianji_import as Qianji import CSV files.",
+    )
+    parser.add_argument(
+        "--book-name",
+        default=DEFAULT_BOOK_NAME,
+        type=str,
+        help="Qianji book the transactions are written to.",
+    )
+    parser.add_argument(
+        "--csv-batch-size",
+        default=CSV_BATCH_SIZE,
+        type=int,
+        help="Transactions per import file with --sink csv.",
+    )
     args = parser.parse_args(namespace=BillingArgs())
     args.account_rules
     return args
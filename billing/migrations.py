@@ -0,0 +1,192 @@
+import sqlite3
+
+from typing import Callable
+from typing import NamedTuple
+
+from billing.fts import FTS_COLUMNS
+from billing.fts import write_index
+from billing.logger import logger
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+
+
+def add_column(
+    conn: sqlite3.Connection, table: str, column: str, definition: str
+) -> None:
+    """列不存在时才添加，便于在已有数据库上重复执行"""
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _create_transactions(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            id TEXT PRIMARY KEY,
+            time INTEGER NOT NULL,
+            classify TEXT NOT NULL,
+            type TEXT NOT NULL,
+            cost REAL NOT NULL,
+            acc_from TEXT NOT NULL,
+            acc_to TEXT,
+            remark TEXT,
+            flag TEXT,
+            pic TEXT,
+            status INTEGER
+        );
+    """
+    )
+
+
+def _create_bill_files(conn: sqlite3.Connection) -> None:
+    # 已入库的原始账单文件，按内容摘要去重
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS bill_files (
+            digest TEXT PRIMARY KEY,
+            file_name TEXT NOT NULL,
+            loader TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            tid_count INTEGER NOT NULL,
+            first_tid TEXT,
+            last_tid TEXT,
+            min_time INTEGER,
+            max_time INTEGER,
+            ingested_at INTEGER NOT NULL
+        );
+    """
+    )
+
+
+def _create_hot_indexes(conn: sqlite3.Connection) -> None:
+    # 按状态筛选并按时间倒序输出，一个 (status, time) 索引即可覆盖过滤和排序，
+    # 单列的 status 索引因此不再需要；按月导出只按 time 做范围查询
+    conn.execute("DROP INDEX IF EXISTS idx_transactions_status")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_transactions_status_time "
+        "ON transactions (status, time)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_transactions_time "
+        "ON transactions (time)"
+    )
+
+
+def _create_fts(conn: sqlite3.Connection) -> None:
+    # 备注、商户和交易对方的全文索引，写入的是 fts_tokens 切分后的文本。
+    # 分词在 Python 中完成，由 db.py 在写入交易的事务中同步；行号取自
+    # transactions_fts_docs.docid，不依赖 transactions 的隐式 rowid。
+    # 删除交易不需要分词，由触发器同步，其他连接删除时也不会出错
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS transactions_fts_docs (
+            docid INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE
+        );
+    """
+    )
+    conn.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts "
+        f"USING fts5({FTS_COLUMNS})"
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS transactions_fts_delete
+        AFTER DELETE ON transactions BEGIN
+            DELETE FROM transactions_fts WHERE rowid = (
+                SELECT docid FROM transactions_fts_docs WHERE id = old.id
+            );
+            DELETE FROM transactions_fts_docs WHERE id = old.id;
+        END
+    """
+    )
+    write_index(
+        conn,
+        conn.execute(
+            "SELECT id, classify, acc_from, remark FROM transactions"
+        ).fetchall(),
+    )
+
+
+def _create_adb_outbox(conn: sqlite3.Connection) -> None:
+    # 已确认、等待写入钱迹的交易，发送成功后删除，失败时推迟 next_retry
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS adb_outbox (
+            id TEXT PRIMARY KEY REFERENCES transactions (id),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            next_retry INTEGER NOT NULL,
+            created_at INTEGER NOT NULL
+        );
+    """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_adb_outbox_next_retry "
+        "ON adb_outbox (next_retry)"
+    )
+
+
+def _add_exported_at(conn: sqlite3.Connection) -> None:
+    # 交易第一次导出到 unconfirmed.csv 的时间，确认时据此判断一个文件
+    # 导出时包含哪些交易
+    add_column(conn, "transactions", "exported_at", "INTEGER")
+
+
+def _add_rule_data(conn: sqlite3.Connection) -> None:
+    # 解析账单时分类规则使用的原始字段（JSON），重新分类时原样交给规则
+    add_column(conn, "transactions", "rule_data", "TEXT")
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "create transactions table", _create_transactions),
+    Migration(2, "create bill_files table", _create_bill_files),
+    Migration(3, "index transactions by status and time", _create_hot_indexes),
+    Migration(4, "full-text index over remarks", _create_fts),
+    Migration(5, "create adb_outbox table", _create_adb_outbox),
+    Migration(6, "record export time of transactions", _add_exported_at),
+    Migration(7, "keep raw rule inputs of transactions", _add_rule_data),
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(
+    conn: sqlite3.Connection, migrations: list[Migration] = MIGRATIONS
+) -> int:
+    """依次执行尚未执行的迁移，返回执行后的版本号
+
+    版本号记录在 PRAGMA user_version 中，每个迁移和版本号的更新在同一个事务里
+    提交，中途失败时数据库停留在上一个版本。
+    """
+    current = schema_version(conn)
+    latest = migrations[-1].version if migrations else 0
+    if current > latest:
+        raise RuntimeError(
+            f"database schema version {current} is newer than {latest}"
+        )
+    for migration in migrations:
+        if migration.version <= current:
+            continue
+        conn.execute("BEGIN")
+        try:
+            migration.apply(conn)
+            conn.execute(f"PRAGMA user_version = {migration.version}")
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+        current = migration.version
+        logger.show(
+            "[database migrated][version=%s]%s",
+            migration.version,
+            migration.description,
+        )
+    return current
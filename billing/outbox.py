@@ -0,0 +1,126 @@
+import time
+
+from typing import NamedTuple
+from typing import Optional
+
+from billing.const import TranStatus
+from billing.db import get_connection
+from billing.db import refresh_transaction_cache
+from billing.logger import logger
+from billing.qianji.qianji import QianjiTransaction
+
+
+# 第 n 次失败后等待 BASE_BACKOFF * 2^(n-1) 秒再重试，最长 MAX_BACKOFF 秒
+BASE_BACKOFF = 5
+MAX_BACKOFF = 3600
+# 取出的交易在 CLAIM_LEASE 秒内不会被再次取出，进程在发送中途退出时，
+# 租约过期后自动重新发送
+CLAIM_LEASE = 600
+# 发送结果未知的交易推迟到这个时间，相当于不再自动重试
+NEVER_RETRY = 1 << 62
+
+
+class OutboxItem(NamedTuple):
+    transaction: QianjiTransaction
+    attempts: int
+
+
+def fetch_due(limit: int = 20, now: Optional[int] = None) -> list[OutboxItem]:
+    """取出一批到期的交易，并在同一条语句中把它们的 next_retry 推迟一个租约
+
+    只扫描 next_retry 索引上已经到期的部分，重启后直接从发件箱继续。
+    前一轮还没有发送完时，下一轮不会取到相同的交易；发送后应调用
+    mark_sent 或 mark_failed 结束租约。
+    """
+    now = int(time.time()) if now is None else now
+    conn = get_connection()
+    with conn:
+        claimed = conn.execute(
+            """
+            UPDATE adb_outbox SET next_retry = ?
+            WHERE id IN (
+                SELECT id FROM adb_outbox
+                WHERE next_retry <= ?
+                ORDER BY next_retry, created_at
+                LIMIT ?
+            )
+            RETURNING id
+            """,
+            (now + CLAIM_LEASE, now, limit),
+        ).fetchall()
+    if not claimed:
+        return []
+    placeholders = ",".join("?" * len(claimed))
+    rows = conn.execute(
+        f"""
+        SELECT o.attempts, t.* FROM adb_outbox AS o
+        JOIN transactions AS t ON t.id = o.id
+        WHERE o.id IN ({placeholders})
+        ORDER BY o.created_at, o.id
+        """,
+        [row[0] for row in claimed],
+    )
+    return [
+        OutboxItem(QianjiTransaction.load_from_db(row[1:]), row[0])
+        for row in rows
+    ]
+
+
+def mark_sent(ids: list[str]) -> None:
+    """发送成功：交易标记为已写入，并从发件箱删除"""
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "UPDATE transactions SET status = ? WHERE id = ?",
+            [(TranStatus.Written.value, tid) for tid in ids],
+        )
+        conn.executemany(
+            "DELETE FROM adb_outbox WHERE id = ?", [(tid,) for tid in ids]
+        )
+    refresh_transaction_cache(ids)
+
+
+def mark_failed(tid: str, error: str, now: Optional[int] = None) -> None:
+    """发送失败：记录错误，按指数退避推迟下一次重试"""
+    now = int(time.time()) if now is None else now
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            """
+            UPDATE adb_outbox SET
+                attempts = attempts + 1,
+                last_error = ?,
+                next_retry = ? + min(?, ? * (1 << min(attempts, 30)))
+            WHERE id = ?
+            """,
+            (error, now, MAX_BACKOFF, BASE_BACKOFF, tid),
+        )
+    logger.warning("[adb write failed, retry later][%s]%s", tid, error)
+
+
+def mark_unknown(tid: str, error: str) -> None:
+    """发送结果未知：钱迹中可能已经记账，不再自动重试，等待人工核对
+
+    核对后需要补发的交易重新确认一次即可回到发件箱。
+    """
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            """
+            UPDATE adb_outbox SET
+                attempts = attempts + 1,
+                last_error = ?,
+                next_retry = ?
+            WHERE id = ?
+            """,
+            (f"unknown: {error}", NEVER_RETRY, tid),
+        )
+    logger.error("[adb write unknown, check in qianji][%s]%s", tid, error)
+
+
+def pending_count() -> int:
+    return (
+        get_connection()
+        .execute("SELECT COUNT(*) FROM adb_outbox")
+        .fetchone()[0]
+    )
@@ -0,0 +1,127 @@
+from array import array
+from typing import Iterable
+from typing import Sequence
+
+from billing.const import TransactionType
+from billing.const import TransactonFlag
+from billing.qianji.qianji import QianjiTransaction
+from billing.time_codec import slash_codec
+
+
+TRANSACTION_TYPES = list(TransactionType)
+TRANSACTION_FLAGS = list(TransactonFlag)
+_TYPE_VALUE_CODES = {t.value: code for code, t in enumerate(TRANSACTION_TYPES)}
+_FLAG_VALUE_CODES = {f.value: code for code, f in enumerate(TRANSACTION_FLAGS)}
+
+
+def to_cents(cost: float) -> int:
+    """先与 QianjiTransaction 一样 round(cost, 2) 再换算成分
+
+    直接 round(cost * 100) 在 130.965 这类金额上会与 round(cost, 2)
+    舍入到不同的方向。
+    """
+    return round(round(cost, 2) * 100)
+
+
+def format_cents(cents: int) -> str:
+    """与 QianjiTransaction.dump 中 str(round(cost, 2)) 的输出一致"""
+    return str(cents / 100)
+
+
+class TransactionBatch:
+    """按列保存的一批从库中读出的交易，供导出 CSV 使用
+
+    时间和金额（单位：分）保存在 int64 的 array 中，类型、标记和状态保存为
+    小整数编码，字符串列是普通列表。按月分组和生成 CSV 行都按列进行，
+    不为每行创建 QianjiTransaction。
+    """
+
+    __slots__ = (
+        "tids",
+        "times",
+        "classify",
+        "type_codes",
+        "costs",
+        "acc_from",
+        "acc_to",
+        "remarks",
+        "flag_codes",
+        "statuses",
+    )
+
+    def __init__(self) -> None:
+        self.tids: list[str] = []
+        self.times = array("q")
+        self.classify: list[str] = []
+        self.type_codes = array("b")
+        self.costs = array("q")
+        self.acc_from: list[str] = []
+        self.acc_to: list[str] = []
+        self.remarks: list[str] = []
+        self.flag_codes = array("b")
+        self.statuses = array("b")
+
+    def __len__(self) -> int:
+        return len(self.tids)
+
+    @classmethod
+    def from_db_rows(cls, rows: Iterable[Sequence]) -> "TransactionBatch":
+        """从 db.BATCH_COLUMNS 顺序的查询结果构建"""
+        batch = cls()
+        for row in rows:
+            batch.tids.append(row[0])
+            batch.times.append(row[1])
+            batch.classify.append(row[2])
+            batch.type_codes.append(_TYPE_VALUE_CODES[row[3]])
+            batch.costs.append(to_cents(row[4]))
+            batch.acc_from.append(row[5])
+            batch.acc_to.append(row[6] or "")
+            batch.remarks.append(row[7] or "")
+            batch.flag_codes.append(_FLAG_VALUE_CODES[row[8] or ""])
+            batch.statuses.append(row[9] or 0)
+        return batch
+
+    def take(self, indexes: Sequence[int]) -> "TransactionBatch":
+        """按下标顺序取出若干行"""
+        batch = TransactionBatch()
+        for name in self.__slots__:
+            column = getattr(self, name)
+            values = [column[i] for i in indexes]
+            if isinstance(column, array):
+                setattr(batch, name, array(column.typecode, values))
+            else:
+                setattr(batch, name, values)
+        return batch
+
+    def dump_lines(self) -> list[str]:
+        """导出为钱迹 CSV 的行，与逐条调用 QianjiTransaction.dump 一致"""
+        types = [t.value for t in TRANSACTION_TYPES]
+        flags = [f.value for f in TRANSACTION_FLAGS]
+        fmt = slash_codec.format
+        img = QianjiTransaction._img
+        columns = zip(
+            self.times,
+            self.classify,
+            self.type_codes,
+            self.costs,
+            self.acc_from,
+            self.acc_to,
+            self.remarks,
+            self.flag_codes,
+        )
+        return [
+            ",".join(
+                (
+                    fmt(time),
+                    kind,
+                    types[code],
+                    format_cents(cents),
+                    src,
+                    dst,
+                    remark,
+                    flags[flag],
+                    img,
+                )
+            )
+            for time, kind, code, cents, src, dst, remark, flag in columns
+        ]
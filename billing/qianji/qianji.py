@@ -1,14 +1,39 @@
 import re
+import shlex
+import sys
 
-from datetime import datetime
 from typing import Optional
-from typing import Type
 
+from billing.const import DEFAULT_BOOK_NAME
 from billing.const import TransactionType
 from billing.const import TransactonFlag
+from billing.time_codec import dash_codec
+from billing.time_codec import slash_codec
+
+
+# 备注中的交易单号，例如 wechat--麦当劳--麦当劳--[TID:4200001754...]
+TID_REGEX = re.compile(r"\[TID:(.*?)\]")
 
 
 class QianjiTransaction:
+    # 不使用 __dict__，大量交易常驻内存时每条可以省下一百多字节
+    __slots__ = (
+        "_tid",
+        "_time",
+        "_classify",
+        "_type",
+        "_cost",
+        "_acc_from",
+        "_acc_to",
+        "_remark",
+        "_flag",
+        "_extra_info",
+        "status",
+    )
+
+    # 账单图片，目前总是为空
+    _img = ""
+
     def __init__(
         self,
         time: int,
@@ -27,26 +52,23 @@ class QianjiTransaction:
         self._time: int = int(time)
         # 所属种类此处如果有二级分类，填写二级分类，如果没有二级分类，
         # 则填写一级分类，分类如果不填写，则默认为 其它
-        self._classify: str = classify
+        # 分类和账户的取值很少，驻留后所有交易共用同一个字符串对象
+        self._classify: str = sys.intern(classify)
         # 账单类型
         self._type: TransactionType = type_
         # 账单对应金额
         self._cost: float = round(cost, 2)
         # 收入或支出关联的账户，或者是转账账单的转出账户
-        self._acc_from: str = acc_from
+        self._acc_from: str = sys.intern(acc_from)
         # 只对转账账单生效
-        self._acc_to: str = acc_to
+        self._acc_to: str = sys.intern(acc_to)
         # 备注
         self._remark: str = remark
         # 标记
         self._flag: TransactonFlag = flag
-        # ？
-        self._img = ""
         self.status = 0
-
-        if extra_info is None:
-            extra_info = {}
-        self._extra_info = extra_info
+        # 大多数交易没有额外信息，用到时才创建字典
+        self._extra_info: Optional[dict] = extra_info
 
     @property
     def id(self) -> str:
@@ -58,12 +80,29 @@ class QianjiTransaction:
 
     @property
     def extra_info(self) -> dict:
+        if self._extra_info is None:
+            self._extra_info = {}
         return self._extra_info
 
+    @property
+    def rule_data(self) -> Optional[dict]:
+        """解析账单时分类规则使用的原始字段，从数据库读出的交易没有"""
+        if not self._extra_info:
+            return None
+        return self._extra_info.get("rule_data")
+
     @property
     def classify(self) -> str:
         return self._classify
 
+    @property
+    def type_(self) -> TransactionType:
+        return self._type
+
+    @property
+    def remark(self) -> str:
+        return self._remark
+
     def refund(self, refund: float) -> None:
         self._cost = round(self._cost - refund, 2)
 
@@ -73,34 +112,39 @@ class QianjiTransaction:
 
         return True
 
-    def dump_to_db(self) -> str:
-        ret = (
-            f'"{self.id}", {self.time}, "{self._classify}", '
-            f'"{self._type.value}", {self._cost}, "{self._acc_from}", '
-            f'"{self._acc_to}", "{self._remark}", '
-            f'"{self._flag.value}"'
+    def dump_to_db(self) -> tuple:
+        """按 transactions 表的列顺序输出，供参数化语句使用"""
+        return (
+            self.id,
+            self.time,
+            self._classify,
+            self._type.value,
+            self._cost,
+            self._acc_from,
+            self._acc_to,
+            self._remark,
+            self._flag.value,
         )
-        return ret
+
+    def dump_fields(self) -> list[str]:
+        """钱迹 CSV 一行中的各列，与 HEADER 对应"""
+        return [
+            slash_codec.format(self._time),
+            self._classify,
+            self._type.value,
+            str(round(self._cost, 2)),
+            self._acc_from,
+            self._acc_to,
+            self._remark,
+            self._flag.value,
+            self._img,
+        ]
 
     def dump(self) -> str:
-        return ",".join(
-            [
-                datetime.fromtimestamp(self._time).strftime(
-                    "%Y/%m/%d %H:%M:%S"
-                ),
-                self._classify,
-                self._type.value,
-                str(round(self._cost, 2)),
-                self._acc_from,
-                self._acc_to,
-                self._remark,
-                self._flag.value,
-                self._img,
-            ]
-        )
+        return ",".join(self.dump_fields())
 
-    def dump_to_api(self) -> str:
-        time = datetime.fromtimestamp(self._time).strftime("%Y-%m-%d %H:%M:%S")
+    def dump_to_api(self, book_name: str = DEFAULT_BOOK_NAME) -> str:
+        time = dash_codec.format(self._time)
         cost = str(round(self._cost, 2))
         if self._type == TransactionType.Expense:
             type_ = 0
@@ -113,45 +157,17 @@ class QianjiTransaction:
         text = (
             f"qianji://publicapi/addbill?&type={type_}&money={cost}&"
             f"time={time}&remark={self._remark}&catename={self.classify}"
-            f"&accountname={self._acc_from}&bookname=日常账本"
+            f"&accountname={self._acc_from}&bookname={book_name}"
         )
         if self._type == TransactionType.Transfer:
             text += f"&accountname2={self._acc_to}"
         return text
 
-    def dump_to_adb_command(self) -> str:
-        text = self.dump_to_api()
-        cmd = (
-            "adb shell am start -a android.intent.action.VIEW " f'"""{text}"""'
+    def dump_to_am_command(self, book_name: str = DEFAULT_BOOK_NAME) -> str:
+        """在手机的 shell 中执行的 am start 命令"""
+        return "am start -a android.intent.action.VIEW " + shlex.quote(
+            self.dump_to_api(book_name)
         )
-        return cmd
-
-    @classmethod
-    def load_from_file_content(
-        cls: Type["QianjiTransaction"], file_content: str
-    ) -> dict[str, "QianjiTransaction"]:
-        ret = {}
-        for line in file_content.splitlines()[1:]:
-            line_data = line.split(",")
-            datetime_obj = datetime.strptime(line_data[0], "%Y/%m/%d %H:%M:%S")
-            ts = int(datetime.timestamp(datetime_obj))
-            flag = (
-                TransactonFlag(line_data[7])
-                if line_data[7]
-                else TransactonFlag.Empty
-            )
-            t = QianjiTransaction(
-                ts,
-                line_data[1],
-                TransactionType(line_data[2]),
-                float(line_data[3]),
-                line_data[4],
-                line_data[5],
-                flag,
-                line_data[6],
-            )
-            ret[t.id] = t
-        return ret
 
     @classmethod
     def load_from_db(cls, row: list) -> "QianjiTransaction":
@@ -166,11 +182,11 @@ class QianjiTransaction:
             row[7],
             tid=row[0],
         )
-        t.status = row[-1]
+        # 第 9 列是 pic，status 之后可能还有迁移新增的列
+        t.status = row[10]
         return t
 
     def _get_tid_from_remark(self, remark: str) -> str:
-        pattern = r"\[TID:(.*?)\]"
-        match = re.search(pattern, remark)
+        match = TID_REGEX.search(remark)
         tid = match.group(1)  # type: ignore
         return tid
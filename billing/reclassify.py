@@ -0,0 +1,142 @@
+import os
+
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from typing import Optional
+
+from billing.bill_loader import registered_loaders
+from billing.bill_loader.base import Loader
+from billing.bill_loader.base import stored_rule_data
+from billing.const import TransactionType
+from billing.const import TranStatus
+from billing.db import iter_transaction_chunks
+from billing.db import update_classify
+
+
+# 每个工作进程各自持有一份编译好的规则
+_worker_loaders: list[Loader] = []
+
+
+def _init_worker(classify_rules: list[dict]) -> None:
+    global _worker_loaders
+    _worker_loaders = [
+        loader_cls([], classify_rules) for loader_cls in registered_loaders()
+    ]
+
+
+def reclassify_rows(
+    loaders: list[Loader], rows: list[tuple]
+) -> tuple[int, int, int, list[tuple[str, str, str]]]:
+    """重新分类一页数据
+
+    返回 (参与分类的行数, 跳过的行数, 分类改变的行数,
+    需要写回的 (classify, remark, id) 列表)，写回的行中还包括只有 [auto]
+    标记变化的行。
+    没有保存分类规则输入的交易无法完整还原，跳过并保持不变。
+    已确认的交易只会被更新为新的非空分类，不会被清空。
+    """
+    mark = Loader.AUTO_CLASSIFY_MARK
+    checked = 0
+    skipped = 0
+    changed = 0
+    updates = []
+    for tid, classify, type_, remark, status, rule_data in rows:
+        stored = stored_rule_data(loaders, rule_data)
+        if stored is None:
+            skipped += 1
+            continue
+        loader, data = stored
+        checked += 1
+        new_classify = loader.classify(data, TransactionType(type_))
+        if status != TranStatus.Raw.value and not new_classify:
+            continue
+        base_remark = remark[: -len(mark)] if remark.endswith(mark) else remark
+        new_remark = base_remark + (mark if new_classify else "")
+        if new_classify != classify:
+            changed += 1
+        if new_classify != classify or new_remark != remark:
+            updates.append((new_classify, new_remark, tid))
+    return checked, skipped, changed, updates
+
+
+def _reclassify_chunk(rows: list[tuple]) -> tuple[int, int, int, list]:
+    return reclassify_rows(_worker_loaders, rows)
+
+
+class ReclassifyResult:
+    def __init__(self) -> None:
+        self.scanned = 0
+        self.checked = 0
+        self.skipped = 0
+        # 分类改变的交易
+        self.changed = 0
+        # 分类不变、只有备注中 [auto] 标记变化的交易
+        self.remarked = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"[scanned={self.scanned}][checked={self.checked}]"
+            f"[skipped={self.skipped}][changed={self.changed}]"
+            f"[remarked={self.remarked}]"
+        )
+
+
+def reclassify(
+    classify_rules: list[dict],
+    include_auto: bool = False,
+    chunk_size: int = 2000,
+    workers: Optional[int] = None,
+    dry_run: bool = False,
+) -> ReclassifyResult:
+    """用当前规则重新分类库中尚未确认的交易
+
+    include_auto 为 True 时，同时处理已确认但分类仍带有 [auto] 标记的交易。
+    数据按页读取、按页写回，同一时间最多只有 2 * workers 页在内存中。
+    """
+    statuses = [TranStatus.Raw]
+    if include_auto:
+        statuses.append(TranStatus.Classified)
+    result = ReclassifyResult()
+
+    def collect(
+        checked: int, skipped: int, changed: int, updates: list
+    ) -> None:
+        result.checked += checked
+        result.skipped += skipped
+        result.changed += changed
+        result.remarked += len(updates) - changed
+        if not dry_run:
+            update_classify(updates)
+
+    def filter_rows(rows: list[tuple]) -> list[tuple]:
+        result.scanned += len(rows)
+        mark = Loader.AUTO_CLASSIFY_MARK
+        return [
+            row
+            for row in rows
+            if row[4] == TranStatus.Raw.value or row[3].endswith(mark)
+        ]
+
+    chunks = iter_transaction_chunks(statuses, chunk_size)
+    if workers == 1:
+        _init_worker(classify_rules)
+        for rows in chunks:
+            collect(*_reclassify_chunk(filter_rows(rows)))
+        return result
+
+    max_pending = 2 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(classify_rules,)
+    ) as executor:
+        pending: set[Future] = set()
+        for rows in chunks:
+            pending.add(executor.submit(_reclassify_chunk, filter_rows(rows)))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(*future.result())
+        for future in pending:
+            collect(*future.result())
+    return result
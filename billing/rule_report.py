@@ -0,0 +1,90 @@
+import os
+
+from typing import Iterable
+from typing import Optional
+
+from billing.bill_loader.base import Loader
+from billing.bill_loader.base import stored_rule_data
+from billing.bill_loader.registry import LoaderDispatcher
+from billing.checker import CompiledRuleSet
+from billing.checker import find_shadowed_rules
+from billing.const import TransactionType
+
+
+def find_loader(loaders: list[Loader], file_path: str) -> Optional[Loader]:
+    return LoaderDispatcher(loaders).match(os.path.basename(file_path))
+
+
+def profile_bill_file(loader: Loader, file_path: str) -> int:
+    """用 loader 解析一个账单文件，返回生成的交易数"""
+    with open(file_path, "rb") as f:
+        return sum(1 for _ in loader.iter_transactions(f))
+
+
+def profile_transactions(
+    loaders: list[Loader], rows: Iterable[tuple]
+) -> tuple[int, int]:
+    """用入库时保存的规则输入重新跑一遍分类规则
+
+    rows 为 iter_transaction_chunks 格式的行。没有保存规则输入的交易无法
+    完整还原，不参与统计，以免依赖原始字段的规则被误报为从未命中。
+    返回 (参与统计的交易数, 跳过的交易数)。
+    """
+    count = 0
+    skipped = 0
+    for _, _, type_, _, _, rule_data in rows:
+        stored = stored_rule_data(loaders, rule_data)
+        if stored is None:
+            skipped += 1
+            continue
+        loader, data = stored
+        loader.classify(data, TransactionType(type_))
+        count += 1
+    return count, skipped
+
+
+def merge_profiles(rule_sets: list[CompiledRuleSet]) -> list[list[int]]:
+    """合并多个 Loader 上同一份规则的统计：[检查次数, 命中次数, 耗时ns]"""
+    merged = [[0, 0, 0] for _ in range(len(rule_sets[0]))]
+    for rule_set in rule_sets:
+        for profile in rule_set.profile():
+            stats = merged[profile.rule_index]
+            stats[0] += profile.evaluations
+            stats[1] += profile.matches
+            stats[2] += profile.time_ns
+    return merged
+
+
+def format_rule_report(title: str, rule_sets: list[CompiledRuleSet]) -> str:
+    rule_list = rule_sets[0].rule_list
+    merged = merge_profiles(rule_sets)
+    shadowed = find_shadowed_rules(rule_list)
+    lines = [f"[{title}][rules={len(rule_list)}]"]
+    lines.append("index\torder\toutput_id\tevaluated\tmatched\ttime_ms")
+    for index, (rule, stats) in enumerate(zip(rule_list, merged)):
+        lines.append(
+            "%s\t%s\t%s\t%s\t%s\t%.3f"
+            % (
+                index,
+                rule.get("order", 99),
+                rule["output_id"],
+                stats[0],
+                stats[1],
+                stats[2] / 1e6,
+            )
+        )
+
+    never_matched = [
+        index for index, stats in enumerate(merged) if stats[1] == 0
+    ]
+    lines.append(f"[never matched][count={len(never_matched)}]")
+    for index in never_matched:
+        lines.append(f"  #{index} {rule_list[index]['output_id']}")
+
+    lines.append(f"[shadowed][count={len(shadowed)}]")
+    for index, by_index in shadowed.items():
+        lines.append(
+            f"  #{index} {rule_list[index]['output_id']} "
+            f"<- #{by_index} {rule_list[by_index]['output_id']}"
+        )
+    return "\n".join(lines)
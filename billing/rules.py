@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+
+from typing import Optional
+from typing import Type
+
+from billing.bill_loader.base import Loader
+from billing.bill_loader.registry import LoaderDispatcher
+from billing.checker import CompiledRuleSet
+from billing.logger import logger
+
+
+def normalize_rules(all_rules: list) -> list:
+    """去除重复规则并按 order 排序"""
+    seen = set()
+    unique_rules = []
+    for rule in all_rules:
+        rule_dump = json.dumps(rule)
+        if rule_dump not in seen:
+            seen.add(rule_dump)
+            unique_rules.append(rule)
+    unique_rules.sort(key=lambda rule: rule.get("order", 99))
+    return unique_rules
+
+
+def load_rules_file(file_path: str) -> list:
+    all_rules: list = []
+    with open(file_path, "r", encoding="utf-8") as fp:
+        try:
+            all_rules = json.load(fp)
+        except Exception:
+            pass
+    return normalize_rules(all_rules)
+
+
+class RuleFile:
+    """单个规则文件，只有内容真正变化时才重新解析"""
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._stat: Optional[tuple[int, int]] = None
+        self._digest = ""
+        self._rules: list = []
+        # 文件不存在时只记录一次错误，重新出现后复位
+        self._missing = False
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def rules(self) -> list:
+        return self._rules
+
+    def refresh(self) -> bool:
+        """检查文件是否变化，规则被替换时返回 True
+
+        解析或编译失败时保留旧规则，等待文件下次变化后再尝试。
+        """
+        try:
+            st = os.stat(self._path)
+            stat_key = (st.st_mtime_ns, st.st_size)
+            if stat_key == self._stat:
+                return False
+            # stat 之后文件仍可能被删除或不可读，同样保留旧规则
+            with open(self._path, "rb") as fp:
+                content = fp.read()
+        except OSError as e:
+            if not self._missing:
+                logger.error("[rule file missing][path=%s]%s", self._path, e)
+                self._missing = True
+            self._stat = None
+            return False
+        self._missing = False
+        self._stat = stat_key
+        digest = hashlib.sha1(content).hexdigest()
+        if digest == self._digest:
+            return False
+
+        try:
+            rules = normalize_rules(json.loads(content.decode("utf-8")))
+            # 提前编译一次，格式错误的规则在这里就会被发现
+            CompiledRuleSet(rules)
+        except Exception as e:
+            logger.error(
+                "[rule file invalid, keep previous rules][path=%s]%r",
+                self._path,
+                e,
+            )
+            return False
+        self._digest = digest
+        self._rules = rules
+        return True
+
+    def load(self) -> None:
+        """启动时的首次加载，文件不存在时抛出 FileNotFoundError"""
+        self.refresh()
+        if self._missing:
+            raise FileNotFoundError(f"rule file not found: {self._path}")
+
+
+class RuleSetManager:
+    """管理账户/分类规则文件，并让 Loader 实例在多次 tick 之间复用"""
+
+    def __init__(
+        self,
+        account_rules_path: str,
+        classify_rules_path: str,
+        loader_classes: list[Type[Loader]],
+    ) -> None:
+        self._account_file = RuleFile(account_rules_path)
+        self._classify_file = RuleFile(classify_rules_path)
+        self._account_file.load()
+        self._classify_file.load()
+        self._loaders: list[Loader] = [
+            loader_cls(self.account_rules, self.classify_rules)
+            for loader_cls in loader_classes
+        ]
+        self._dispatcher = LoaderDispatcher(self._loaders)
+
+    @property
+    def account_rules(self) -> list:
+        return self._account_file.rules
+
+    @property
+    def classify_rules(self) -> list:
+        return self._classify_file.rules
+
+    @property
+    def loaders(self) -> list[Loader]:
+        return self._loaders
+
+    @property
+    def dispatcher(self) -> LoaderDispatcher:
+        return self._dispatcher
+
+    def refresh(self) -> bool:
+        """重新检查规则文件，有变化时把新规则换入所有 Loader"""
+        account_changed = self._account_file.refresh()
+        classify_changed = self._classify_file.refresh()
+        if not (account_changed or classify_changed):
+            return False
+        for loader in self._loaders:
+            loader.set_rules(self.account_rules, self.classify_rules)
+        logger.show(
+            "[rules reloaded][account=%s][classify=%s]",
+            len(self.account_rules),
+            len(self.classify_rules),
+        )
+        return True
@@ -0,0 +1,66 @@
+from typing import NamedTuple
+from typing import Optional
+
+from billing.const import TranStatus
+from billing.db import get_connection
+from billing.fts import build_match
+
+
+# bm25 的列权重，顺序与 transactions_fts 的列一致：
+# counterparty, merchandise, remark, classify, acc_from
+COLUMN_WEIGHTS = (4.0, 2.0, 1.0, 1.0, 1.0)
+
+
+class SearchHit(NamedTuple):
+    id: str
+    time: int
+    classify: str
+    type_: str
+    cost: float
+    acc_from: str
+    remark: str
+    status: int
+    rank: float
+
+
+def search_transactions(
+    query: str,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    status: Optional[TranStatus] = None,
+    account: Optional[str] = None,
+    limit: int = 50,
+) -> list[SearchHit]:
+    """全文搜索交易，按相关度排序，相关度相同时较新的交易在前
+
+    query 的语法见 billing.fts.build_match，start/end 为 [start, end)
+    的时间戳范围，account 按支出账户精确过滤。
+    """
+    match = build_match(query)
+    if not match:
+        return []
+    weights = ", ".join(str(w) for w in COLUMN_WEIGHTS)
+    sql = f"""
+    SELECT t.id, t.time, t.classify, t.type, t.cost, t.acc_from, t.remark,
+           t.status, bm25(transactions_fts, {weights}) AS rank
+    FROM transactions_fts
+    JOIN transactions_fts_docs AS d ON d.docid = transactions_fts.rowid
+    JOIN transactions AS t ON t.id = d.id
+    WHERE transactions_fts MATCH ?
+    """
+    params: list = [match]
+    if start is not None:
+        sql += " AND t.time >= ?"
+        params.append(start)
+    if end is not None:
+        sql += " AND t.time < ?"
+        params.append(end)
+    if status is not None:
+        sql += " AND t.status = ?"
+        params.append(status.value)
+    if account is not None:
+        sql += " AND t.acc_from = ?"
+        params.append(account)
+    sql += " ORDER BY rank, t.time DESC LIMIT ?"
+    params.append(limit)
+    return [SearchHit(*row) for row in get_connection().execute(sql, params)]
@@ -0,0 +1,134 @@
+"""把确认后的交易写入钱迹的输出方式
+
+AdbIntentSink 通过 adb 逐条发送 intent，QianjiCsvSink 把一批交易一次性
+写成钱迹可以导入的 CSV，适合补录大量历史账单。
+"""
+
+import csv
+import os
+import time
+
+from abc import ABC
+from abc import abstractmethod
+from typing import NamedTuple
+
+from billing.adb import AdbSession
+from billing.adb import AdbSessionError
+from billing.adb import am_start_succeeded
+from billing.aio import AsyncIO
+from billing.const import DEFAULT_BOOK_NAME
+from billing.const import HEADER
+from billing.file_utils import ensure_dir_exist
+from billing.qianji.qianji import QianjiTransaction
+
+
+class SendResult(NamedTuple):
+    sent: list[QianjiTransaction]
+    # (交易, 错误信息)，确定没有写入钱迹，可以重发
+    failed: list[tuple[QianjiTransaction, str]]
+    # (交易, 错误信息)，已经发出但没有收到结果，可能已经写入钱迹
+    unknown: list[tuple[QianjiTransaction, str]]
+
+
+class OutputSink(ABC):
+    """输出方式的基类，send 返回成功、失败和结果未知的交易
+
+    batch_size 是每轮从发件箱取出、一次交给 send 的交易数。
+    """
+
+    def __init__(self, book_name: str, batch_size: int) -> None:
+        self.book_name = book_name
+        self.batch_size = batch_size
+
+    @abstractmethod
+    async def send(self, transactions: list[QianjiTransaction]) -> SendResult:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class AdbIntentSink(OutputSink):
+    """每条交易通过 adb shell 会话发送一个钱迹的 addbill intent"""
+
+    def __init__(
+        self,
+        session: AdbSession,
+        book_name: str = DEFAULT_BOOK_NAME,
+        batch_size: int = 20,
+    ) -> None:
+        super().__init__(book_name, batch_size)
+        self._session = session
+
+    async def send(self, transactions: list[QianjiTransaction]) -> SendResult:
+        try:
+            results = await self._session.send_batch(
+                [t.dump_to_am_command(self.book_name) for t in transactions]
+            )
+            session_error = ""
+            unknown = False
+        except AdbSessionError as e:
+            results = e.results
+            session_error = str(e)
+            unknown = e.unknown
+        ret = SendResult([], [], [])
+        for index, transaction in enumerate(transactions):
+            if index == len(results) and unknown:
+                ret.unknown.append((transaction, session_error))
+            elif index >= len(results):
+                ret.failed.append((transaction, session_error))
+            elif am_start_succeeded(results[index]):
+                ret.sent.append(transaction)
+            else:
+                ret.failed.append((transaction, results[index].output))
+        return ret
+
+    async def close(self) -> None:
+        await self._session.close()
+
+
+def write_import_csv(path: str, transactions: list[QianjiTransaction]) -> None:
+    """按 HEADER 的格式写出钱迹导入文件"""
+    ensure_dir_exist(os.path.dirname(path))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f, lineterminator="\r\n")
+        writer.writerow(HEADER.split(","))
+        writer.writerows(t.dump_fields() for t in transactions)
+    os.replace(tmp_path, path)
+
+
+class QianjiCsvSink(OutputSink):
+    """每批交易写成 output_dir 下的一个钱迹导入文件
+
+    文件名带有账本名，写出即视为发送成功，需要在钱迹中手动导入到该账本。
+    """
+
+    def __init__(
+        self,
+        aio: AsyncIO,
+        output_dir: str,
+        book_name: str = DEFAULT_BOOK_NAME,
+        batch_size: int = 5000,
+    ) -> None:
+        super().__init__(book_name, batch_size)
+        self._aio = aio
+        self._output_dir = output_dir
+        self._sequence = 0
+
+    def next_path(self) -> str:
+        self._sequence += 1
+        file_name = "%s-%s-%03d.csv" % (
+            self.book_name,
+            time.strftime("%Y%m%d%H%M%S"),
+            self._sequence,
+        )
+        return os.path.join(self._output_dir, file_name)
+
+    async def send(self, transactions: list[QianjiTransaction]) -> SendResult:
+        path = self.next_path()
+        try:
+            await self._aio.io(write_import_csv, path, transactions)
+        except OSError as e:
+            return SendResult([], [(t, repr(e)) for t in transactions], [])
+        return SendResult(transactions, [], [])
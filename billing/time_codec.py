@@ -0,0 +1,128 @@
+import time
+
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+from typing import Optional
+
+
+class TimestampCodec:
+    """定长时间字符串与本地时间戳之间的转换
+
+    支持 YYYY-MM-DD HH:MM:SS 和 YYYY/MM/DD HH:MM:SS，按位置切片取数字，
+    每天零点的时间戳会被缓存，结果与 strptime/strftime 的本地时间完全一致。
+    当天存在夏令时切换时不使用缓存，退回 datetime 计算。
+    """
+
+    MAX_CACHED_DAYS = 4096
+
+    def __init__(self, date_sep: str = "/") -> None:
+        self._date_sep = date_sep
+        # (年, 月, 日) -> 当天零点时间戳，当天不是 86400 秒时为 None
+        self._midnights: dict[tuple[int, int, int], Optional[int]] = {}
+        # 日期字符串 -> 当天零点，-1 表示日期不合法
+        self._dates: dict[str, Optional[int]] = {}
+        # UTC 日序号 -> (本地当天起点, 本地当天终点, 日期前缀)
+        self._days: dict[int, tuple[int, int, str]] = {}
+
+    def _midnight(self, year: int, month: int, day: int) -> Optional[int]:
+        key = (year, month, day)
+        if key in self._midnights:
+            return self._midnights[key]
+        day_date = date(year, month, day)
+        start = int(datetime(year, month, day).timestamp())
+        next_day = day_date + timedelta(days=1)
+        end = int(
+            datetime(next_day.year, next_day.month, next_day.day).timestamp()
+        )
+        midnight = start if end - start == 86400 else None
+        if len(self._midnights) >= self.MAX_CACHED_DAYS:
+            self._midnights.clear()
+        self._midnights[key] = midnight
+        return midnight
+
+    def _date_midnight(self, date_text: str) -> Optional[int]:
+        """YYYY-MM-DD 或 YYYY/MM/DD 对应的零点，不合法时返回 -1"""
+        if date_text in self._dates:
+            return self._dates[date_text]
+        midnight: Optional[int] = -1
+        digits = date_text[0:4] + date_text[5:7] + date_text[8:10]
+        if (
+            len(date_text) == 10
+            and date_text[4] in "-/"
+            and date_text[7] == date_text[4]
+            and digits.isascii()
+            and digits.isdigit()
+        ):
+            try:
+                midnight = self._midnight(
+                    int(digits[0:4]), int(digits[4:6]), int(digits[6:8])
+                )
+            except ValueError:
+                midnight = -1
+        if len(self._dates) >= self.MAX_CACHED_DAYS:
+            self._dates.clear()
+        self._dates[date_text] = midnight
+        return midnight
+
+    def parse(self, text: str) -> int:
+        """解析时间字符串，格式不合法时返回 0"""
+        if len(text) != 19 or text[10] != " ":
+            return 0
+        midnight = self._date_midnight(text[:10])
+        if midnight == -1:
+            return 0
+        hour_text = text[11:13]
+        minute_text = text[14:16]
+        second_text = text[17:19]
+        digits = hour_text + minute_text + second_text
+        if (
+            text[13] != ":"
+            or text[16] != ":"
+            or not digits.isascii()
+            or not digits.isdigit()
+        ):
+            return 0
+        hour = int(hour_text)
+        minute = int(minute_text)
+        second = int(second_text)
+        if hour > 23 or minute > 59 or second > 59:
+            return 0
+        if midnight is None:
+            dt = datetime.strptime(text.replace("/", "-"), "%Y-%m-%d %H:%M:%S")
+            return int(dt.timestamp())
+        return midnight + hour * 3600 + minute * 60 + second
+
+    def format(self, timestamp: int) -> str:
+        day_key = timestamp // 86400
+        cached = self._days.get(day_key)
+        if cached is None or not (cached[0] <= timestamp < cached[1]):
+            cached = self._fill_day(timestamp)
+            if cached is None:
+                sep = self._date_sep
+                return datetime.fromtimestamp(timestamp).strftime(
+                    f"%Y{sep}%m{sep}%d %H:%M:%S"
+                )
+            if len(self._days) >= self.MAX_CACHED_DAYS:
+                self._days.clear()
+            self._days[day_key] = cached
+        start, _, prefix = cached
+        hour, rest = divmod(timestamp - start, 3600)
+        minute, second = divmod(rest, 60)
+        return f"{prefix}{hour:02d}:{minute:02d}:{second:02d}"
+
+    def _fill_day(self, timestamp: int) -> Optional[tuple[int, int, str]]:
+        local = time.localtime(timestamp)
+        midnight = self._midnight(local.tm_year, local.tm_mon, local.tm_mday)
+        if midnight is None:
+            return None
+        sep = self._date_sep
+        prefix = (
+            f"{local.tm_year:04d}{sep}{local.tm_mon:02d}{sep}"
+            f"{local.tm_mday:02d} "
+        )
+        return midnight, midnight + 86400, prefix
+
+
+slash_codec = TimestampCodec("/")
+dash_codec = TimestampCodec("-")
@@ -1,6 +1,74 @@
+import sqlite3
+
+from datetime import datetime
+from typing import Optional
+from typing import Union
+
 import pytest
 
-from billing.main import load_rules_file
+from billing.const import TransactionType
+from billing.const import TransactonFlag
+from billing.db import check_and_create_database
+from billing.db import disable_transaction_cache
+from billing.db import get_db_path
+from billing.db import set_db_path
+from billing.qianji.qianji import QianjiTransaction
+from billing.rules import load_rules_file
+
+
+def make_transaction(
+    tid: str,
+    when: Union[int, str] = 1700000000,
+    classify: str = "吃饭",
+    type_: TransactionType = TransactionType.Expense,
+    cost: float = 10.0,
+    account: str = "微信",
+    remark: str = "wechat--麦当劳--商品",
+    flag: TransactonFlag = TransactonFlag.Empty,
+    extra_info: Optional[dict] = None,
+) -> QianjiTransaction:
+    """测试用的交易，when 可以是时间戳或 ISO 格式的本地时间"""
+    if isinstance(when, str):
+        when = int(datetime.fromisoformat(when).timestamp())
+    return QianjiTransaction(
+        when,
+        classify,
+        type_,
+        cost,
+        account,
+        "",
+        flag,
+        f"{remark}--[TID:{tid}]",
+        extra_info=extra_info,
+    )
+
+
+def create_legacy_database(path: str, remark: str) -> None:
+    """只有最初 transactions 表、尚未迁移的旧数据库，带一条 TID 为 1 的交易"""
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE transactions (id TEXT PRIMARY KEY, time INTEGER, "
+        "classify TEXT, type TEXT, cost REAL, acc_from TEXT, acc_to TEXT, "
+        "remark TEXT, flag TEXT, pic TEXT, status INTEGER)"
+    )
+    conn.execute(
+        "INSERT INTO transactions VALUES ('1', 1700000000, '', '支出', 1.0, "
+        "'微信', '', ?, '', '', 0)",
+        (f"{remark}--[TID:1]",),
+    )
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def database(tmp_path):
+    """tmp_path 下新建并迁移的数据库，结束后关闭交易缓存并恢复原路径"""
+    old_path = get_db_path()
+    set_db_path(str(tmp_path / "billing.db"))
+    check_and_create_database()
+    yield
+    disable_transaction_cache()
+    set_db_path(old_path)
 
 
 @pytest.fixture(scope="session")
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import shlex
+
+import pytest
+
+from billing.adb import AdbSession
+from billing.adb import AdbSessionError
+from billing.adb import CommandResult
+from billing.adb import am_start_succeeded
+from billing.const import TransactionType
+from billing.const import TransactonFlag
+from billing.qianji.qianji import QianjiTransaction
+
+
+FAKE_ADB = os.path.join(os.path.dirname(__file__), "fake_adb", "adb")
+
+
+def _transaction(tid, remark="麦当劳"):
+    return QianjiTransaction(
+        1700000000,
+        "吃饭",
+        TransactionType.Expense,
+        13.9,
+        "微信",
+        "",
+        TransactonFlag.Empty,
+        f"wechat--{remark}--[TID:{tid}]",
+    )
+
+
+def test_send_batch(tmp_path, monkeypatch) -> None:
+    log = tmp_path / "am.log"
+    monkeypatch.setenv("FAKE_AM_LOG", str(log))
+    monkeypatch.setenv("FAKE_AM_FAIL", "TID:2")
+    transactions = [_transaction(str(i), "a b&c'd") for i in range(1, 4)]
+
+    async def run():
+        session = AdbSession([FAKE_ADB, "shell"], pace=0.01)
+        try:
+            first = await session.send_batch(
+                [t.dump_to_am_command() for t in transactions]
+            )
+            process = session._process
+            second = await session.send_batch(
+                [transactions[0].dump_to_am_command()]
+            )
+            assert session._process is process
+        finally:
+            await session.close()
+        assert not session.connected
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert [am_start_succeeded(r) for r in first] == [True, False, True]
+    assert "Error: Activity not started" in first[1].output
+    assert am_start_succeeded(second[0])
+    urls = log.read_text(encoding="utf-8").splitlines()
+    assert urls == [transactions[i].dump_to_api() for i in (0, 2, 0)]
+
+
+def test_session_closed() -> None:
+    async def run():
+        session = AdbSession([FAKE_ADB, "shell", "exit", "1"])
+        with pytest.raises(AdbSessionError) as e:
+            await session.send_batch(["true", "true"])
+        assert e.value.results == []
+        # 第一条命令已经写入，无法确定是否执行过
+        assert e.value.unknown
+        assert not session.connected
+
+    asyncio.run(run())
+
+
+def test_session_timeout() -> None:
+    async def run():
+        session = AdbSession([FAKE_ADB, "shell"], pace=0, timeout=0.3)
+        with pytest.raises(AdbSessionError) as e:
+            await session.send_batch(["echo ok", "sleep 1", "echo late"])
+        assert [r.output for r in e.value.results] == ["ok"]
+        assert e.value.unknown
+        # 超时后关闭会话，下一次发送重新连接
+        results = await session.send_batch(["echo again"])
+        await session.close()
+        return results
+
+    assert asyncio.run(run())[0].output == "again"
+
+
+def test_concurrent_batches() -> None:
+    async def run():
+        session = AdbSession([FAKE_ADB, "shell"], pace=0)
+        try:
+            return await asyncio.gather(
+                session.send_batch([f"echo a{i}" for i in range(5)]),
+                session.send_batch([f"echo b{i}" for i in range(5)]),
+            )
+        finally:
+            await session.close()
+
+    first, second = asyncio.run(run())
+    assert [r.output for r in first] == [f"a{i}" for i in range(5)]
+    assert [r.output for r in second] == [f"b{i}" for i in range(5)]
+
+
+def test_am_start_succeeded() -> None:
+    assert am_start_succeeded(CommandResult(0, "Starting: Intent { }"))
+    assert not am_start_succeeded(CommandResult(1, ""))
+    assert not am_start_succeeded(
+        CommandResult(0, "Starting: Intent { }\nError type 3")
+    )
+
+
+def test_dump_to_am_command() -> None:
+    transaction = _transaction("1", "it's")
+    command = transaction.dump_to_am_command()
+    assert "&money=13.9&" in command
+    # 手机上的 sh 去掉引号后还原出完整链接
+    assert shlex.split(command)[-1] == transaction.dump_to_api()
@@ -0,0 +1,21 @@
+import asyncio
+import threading
+
+from billing.aio import AsyncIO
+
+
+def test_async_io_threads() -> None:
+    async def run():
+        aio = AsyncIO(io_workers=2)
+        try:
+            db_threads = await asyncio.gather(
+                *[aio.db(threading.get_ident) for _ in range(8)]
+            )
+            io_thread = await aio.io(threading.get_ident)
+        finally:
+            aio.shutdown()
+        return set(db_threads), io_thread
+
+    db_threads, io_thread = asyncio.run(run())
+    assert len(db_threads) == 1
+    assert threading.get_ident() not in db_threads | {io_thread}
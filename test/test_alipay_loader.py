@@ -1,3 +1,5 @@
+import io
+
 import pytest
 
 from billing.bill_loader import AlipayBillLoader
@@ -140,3 +142,40 @@ def test_alipay_refund9(alipay_loader: AlipayBillLoader) -> None:
     assert data._cost == 37.9
     assert data._acc_from == "招行信用卡(0638)"
     assert data._type == TransactionType.Expense
+
+
+def test_alipay_stream(alipay_loader: AlipayBillLoader) -> None:
+    test_data = """交易时间,交易分类,交易对方,对方账号,商品说明,收/支,金额,收/付款方式,交易状态,交易订单号,商家订单号,备注,
+2023-08-27 13:00:50,退款,豆浆**0,158******62,退款-汽车改色膜,不计收支,2688.00,招商银行储蓄卡(2508),退款成功,2023082722001189491415108739_1958553660	,T200P1958553660	,,
+2023-08-27 13:00:45,爱车养车,豆浆**0,158******62,汽车改色膜,支出,1188.00,招商银行储蓄卡(2508),交易成功,2023082722001189491414932348	,T200P1959320318	,,
+2023-08-27 12:02:58,爱车养车,豆浆**0,158******62,汽车改色膜,支出,2688.00,招商银行储蓄卡(2508),交易关闭,2023082722001189491415108739	,T200P1958553660	,,
+2023-06-28 14:42:11,退款,阿斯**店,liu***@powev.com,退款-内存条,不计收支,275.40,招商银行信用卡(0638),退款成功,2023062022001189491456142722_1	,T200P1	,,
+2023-06-20 21:48:53,数码电器,阿斯**店,liu***@powev.com,内存条,支出,545.49,招商银行信用卡(0638),交易关闭,2023062022001189491456142722	,T200P1	,,
+"""
+    expected = alipay_loader.parse_file_content(test_data)
+    stream = io.BytesIO(test_data.encode("GBK"))
+    streamed = list(alipay_loader.iter_transactions(stream))
+    assert [t.dump() for t in streamed] == [t.dump() for t in expected]
+    assert [t._cost for t in streamed] == [1188, 270.09]
+    assert not stream.closed
+
+
+def test_alipay_stream_out_of_order(alipay_loader: AlipayBillLoader) -> None:
+    # 按时间正序导出的文件，退款记录在原订单之后
+    test_data = """交易时间,交易分类,交易对方,对方账号,商品说明,收/支,金额,收/付款方式,交易状态,交易订单号,商家订单号,备注,
+2023-06-20 21:48:53,数码电器,阿斯**店,liu***@powev.com,内存条,支出,545.49,招商银行信用卡(0638),交易关闭,2023062022001189491456142722	,T200P1	,,
+2023-06-28 14:42:11,退款,阿斯**店,liu***@powev.com,退款-内存条,不计收支,275.40,招商银行信用卡(0638),退款成功,2023062022001189491456142722_1	,T200P1	,,
+2023-08-27 13:00:45,爱车养车,豆浆**0,158******62,汽车改色膜,支出,1188.00,招商银行储蓄卡(2508),交易成功,2023082722001189491414932348	,T200P1959320318	,,
+"""
+    stream = io.BytesIO(test_data.encode("GBK"))
+    streamed = list(alipay_loader.iter_transactions(stream))
+    assert [t._cost for t in streamed] == [270.09, 1188]
+
+    # 已入库的订单被跳过时，它的退款也不会被误报或套用到其他交易
+    stream = io.BytesIO(test_data.encode("GBK"))
+    streamed = list(
+        alipay_loader.iter_transactions(
+            stream, {"2023062022001189491456142722"}
+        )
+    )
+    assert [t._cost for t in streamed] == [1188]
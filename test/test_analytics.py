@@ -0,0 +1,85 @@
+import pytest
+
+from billing.cli import main
+from billing.const import TransactionType
+from billing.const import TranStatus
+from billing.db import get_db_path
+from billing.db import insert_transactions
+from test.conftest import make_transaction
+
+
+analytics = pytest.importorskip("billing.analytics")
+
+
+@pytest.fixture
+def database(database):
+    expense = TransactionType.Expense
+    insert_transactions(
+        [
+            make_transaction(
+                "1", "2023-06-01 00:00:00", "吃饭", expense, 10.5
+            ),
+            make_transaction("2", "2023-06-30 23:59:59", "买菜", expense, 20),
+            make_transaction(
+                "3", "2023-06-15 12:00:00", "吃饭", expense, 5, "招商银行"
+            ),
+            make_transaction(
+                "4", "2023-08-10 12:00:00", "工资", TransactionType.Income, 100
+            ),
+            make_transaction(
+                "5",
+                "2023-08-11 12:00:00",
+                "报销",
+                TransactionType.Reimbursement,
+                7.5,
+            ),
+            make_transaction("6", "2023-08-12 12:00:00", "吃饭", expense, 30),
+            make_transaction(
+                "7", "2023-08-12 13:00:00", "", TransactionType.Transfer, 50
+            ),
+        ],
+        TranStatus.Raw,
+    )
+
+
+def test_month_pivot(database) -> None:
+    columns = analytics.load_columns()
+    assert len(columns) == 7
+
+    pivot = analytics.month_pivot(columns, "classify")
+    assert pivot.rows == ["2023-06", "2023-07", "2023-08"]
+    assert pivot.columns == ["买菜", "吃饭"]
+    assert pivot.values.tolist() == [[20, 15.5], [0, 0], [0, 30]]
+
+    pivot = analytics.month_pivot(columns, "account")
+    assert pivot.columns == ["微信", "招商银行"]
+    assert pivot.values.tolist() == [[30.5, 5], [0, 0], [30, 0]]
+
+    summary = analytics.month_summary(columns)
+    assert summary.columns == analytics.SUMMARY_COLUMNS
+    assert summary.values.tolist() == [
+        [0, 35.5, 0, -35.5],
+        [0, 0, 0, 0],
+        [100, 30, 7.5, 77.5],
+    ]
+
+
+def test_analytics_cli(database, capsys) -> None:
+    assert (
+        main(
+            [
+                "--db-path",
+                get_db_path(),
+                "analytics",
+                "--by",
+                "account",
+                "--start",
+                "2023-08",
+            ]
+        )
+        == 0
+    )
+    out = capsys.readouterr().out
+    assert "2023-08\t100.00\t30.00\t7.50\t77.50" in out
+    assert "2023-06" not in out
+    assert "2023-08\t30.00\t30.00" in out
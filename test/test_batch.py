@@ -0,0 +1,55 @@
+from billing.const import TransactonFlag
+from billing.const import TranStatus
+from billing.db import insert_transactions
+from billing.db import load_batch
+from billing.db import load_transactions_from_db
+from billing.qianji.batch import TransactionBatch
+from billing.qianji.batch import format_cents
+from billing.qianji.batch import to_cents
+from test.conftest import make_transaction
+
+
+def test_format_cents() -> None:
+    for cost in (0.1, 0.3, 16.6, 19.99, 100.0, 1234.05, 0.0, 130.965, 2.675):
+        assert format_cents(to_cents(cost)) == str(round(cost, 2))
+
+
+def _rows(transactions, status=0):
+    return [t.dump_to_db() + (status,) for t in transactions]
+
+
+def test_dump_lines() -> None:
+    transactions = [
+        make_transaction("1", cost=12.5),
+        make_transaction("2", cost=0.1, flag=TransactonFlag.NC),
+        make_transaction("3", cost=130.965),
+    ]
+    batch = TransactionBatch.from_db_rows(_rows(transactions))
+    assert batch.dump_lines() == [t.dump() for t in transactions]
+
+
+def test_take() -> None:
+    batch = TransactionBatch.from_db_rows(
+        _rows([make_transaction(str(i), cost=10.0 + i) for i in range(3)])
+    )
+    taken = batch.take([2, 0])
+    assert taken.tids == ["2", "0"]
+    assert list(taken.costs) == [1200, 1000]
+    assert len(taken) == 2
+
+
+def test_load_batch(database) -> None:
+    insert_transactions(
+        [
+            make_transaction("1", 1700000000, cost=10.0),
+            make_transaction("2", 1700000100, cost=20.5),
+        ],
+        TranStatus.Classified,
+    )
+    loaded = load_batch()
+    assert loaded.tids == ["2", "1"]
+    assert list(loaded.statuses) == [TranStatus.Classified.value] * 2
+    stored = load_transactions_from_db(TranStatus.Classified)
+    assert loaded.dump_lines() == [stored[tid].dump() for tid in ("2", "1")]
+    assert load_batch(start=1700000050).tids == ["2"]
+    assert load_batch(status=TranStatus.Written).tids == []
@@ -0,0 +1,175 @@
+import itertools
+
+import pytest
+
+from billing.checker import CachedRuleSet
+from billing.checker import CompiledRuleSet
+from billing.checker import check_rules
+from billing.checker import find_shadowed_rules
+
+
+def _data(**kwargs):
+    data = {
+        "type_": "商户消费",
+        "counterparty": "",
+        "merchandise": "",
+        "account_text": "",
+        "status_wechat": "",
+        "loader": "wechat",
+        "is_income": False,
+        "is_expense": True,
+    }
+    data.update(kwargs)
+    return data
+
+
+SAMPLES = [
+    _data(counterparty="小鹏智慧充电", merchandise='"小鹏汽车|充电"'),
+    _data(counterparty="麦当劳", account_text="招商银行(1908)"),
+    _data(counterparty="广州盒马", loader="alipay", type_="日用百货"),
+    _data(counterparty="Luckin Coffee", account_text="零钱"),
+    _data(type_="群收款", is_income=True, is_expense=False),
+    _data(type_="交通出行", counterparty="高德打车", loader="alipay"),
+    _data(account_text=" 账户余额 ", loader="alipay"),
+    _data(
+        account_text="/",
+        status_wechat="已存入零钱",
+        is_income=True,
+        is_expense=False,
+    ),
+    _data(account_text="招商银行储蓄卡(2508)", loader="alipay"),
+    _data(account_text="招商银行(0702)"),
+    _data(),
+]
+
+
+def test_compiled_matches_check_rules(
+    account_rules_list, classify_rules_list
+) -> None:
+    for rules in (account_rules_list, classify_rules_list):
+        rule_set = CompiledRuleSet(rules)
+        for data in SAMPLES:
+            assert rule_set.check(data) == check_rules(data, rules)
+
+
+def test_compiled_overlapping_patterns() -> None:
+    rules = [
+        {
+            "conditions": [
+                {
+                    "operator": "in",
+                    "expect_value": "德打",
+                    "field_to_check": "counterparty",
+                },
+                {
+                    "operator": "not in",
+                    "expect_value": "GAODE",
+                    "field_to_check": "counterparty",
+                },
+            ],
+            "output_id": "a",
+        },
+        {
+            "conditions": [
+                {
+                    "operator": "in",
+                    "expect_value": "ab",
+                    "field_to_check": "counterparty",
+                },
+                {
+                    "operator": "in",
+                    "expect_value": "bc",
+                    "field_to_check": "counterparty",
+                },
+            ],
+            "output_id": "b",
+        },
+        {
+            "conditions": [
+                {
+                    "operator": "in",
+                    "expect_value": "",
+                    "field_to_check": "counterparty",
+                },
+                {
+                    "operator": "is",
+                    "expect_value": True,
+                    "field_to_check": "is_income",
+                },
+            ],
+            "output_id": "c",
+        },
+    ]
+    rule_set = CompiledRuleSet(rules)
+    texts = ["高德打车", "gaode高德打车", "abc", "xabcx", "ab", "c", ""]
+    for text, is_income in itertools.product(texts, (True, False)):
+        data = {"counterparty": text, "is_income": is_income}
+        assert rule_set.check(data) == check_rules(data, rules)
+
+
+def test_compiled_missing_field() -> None:
+    rules = [
+        {
+            "conditions": [
+                {
+                    "operator": "==",
+                    "expect_value": "x",
+                    "field_to_check": "missing",
+                }
+            ],
+            "output_id": "a",
+        }
+    ]
+    with pytest.raises(KeyError):
+        CompiledRuleSet(rules).check({})
+
+
+def test_cached_rule_set(classify_rules_list) -> None:
+    rule_set = CachedRuleSet(classify_rules_list, maxsize=2)
+    for data in SAMPLES[:3]:
+        assert rule_set.check(data) == check_rules(data, classify_rules_list)
+    assert rule_set.check(SAMPLES[2]) == "买菜"
+    info = rule_set.cache_info()
+    assert (info.hits, info.misses, info.evictions) == (1, 3, 1)
+    assert info.currsize == 2
+
+
+def test_profiling_and_explain(classify_rules_list) -> None:
+    rule_set = CompiledRuleSet(classify_rules_list)
+    rule_set.enable_profiling()
+    for data in SAMPLES:
+        assert rule_set.check(data) == check_rules(data, classify_rules_list)
+    profiles = rule_set.profile()
+    assert profiles[0].evaluations == len(SAMPLES)
+    assert sum(p.matches for p in profiles) == sum(
+        1 for data in SAMPLES if check_rules(data, classify_rules_list)
+    )
+    assert profiles[0].condition_passes[0] <= profiles[0].evaluations
+
+    traces = rule_set.explain(SAMPLES[2])
+    assert traces[-1].matched
+    assert traces[-1].output_id == "买菜"
+    assert all(not t.matched for t in traces[:-1])
+    assert "counterparty" in traces[0].reason
+    assert rule_set.explain({})[0].reason == "缺少字段 counterparty"
+
+
+def test_find_shadowed_rules() -> None:
+    def rule(output_id, *conditions):
+        return {
+            "conditions": [
+                {"operator": op, "expect_value": v, "field_to_check": f}
+                for f, op, v in conditions
+            ],
+            "output_id": output_id,
+        }
+
+    rules = [
+        rule("a", ("counterparty", "in", "高德")),
+        rule("b", ("counterparty", "in", "高德打车")),
+        rule("c", ("counterparty", "==", "高德"), ("type_", "in", "x")),
+        rule("d", ("type_", "in", "x"), ("is_income", "is", True)),
+        rule("e", ("type_", "==", "xy"), ("is_income", "is", True)),
+        rule("f", ("type_", "in", "x"), ("is_income", "is", False)),
+    ]
+    assert find_shadowed_rules(rules) == {1: 0, 2: 0, 4: 3}
@@ -0,0 +1,166 @@
+import csv
+
+from functools import partial
+
+import pytest
+
+from billing.confirm import import_confirmed_file
+from billing.confirm import parse_confirmed_row
+from billing.const import HEADER
+from billing.const import TransactonFlag
+from billing.const import TranStatus
+from billing.db import insert_transactions
+from billing.db import load_transactions_from_db
+from billing.db import record_exported
+from billing.db import update_classify
+from billing.outbox import fetch_due
+from billing.outbox import pending_count
+from test.conftest import make_transaction
+
+
+CONFIRMED = f"""﻿{HEADER}
+2023/12/08 20:19:03,打车,支出,16.6,招行信用卡(0638),,alipay--高德--[TID:1],,
+2023/12/08 20:20:00,吃饭,支出,12.5,微信,,"wechat--麦当劳,汉堡--[TID:2]",,
+2023/12/08 20:21:00,吃饭,支出,8.0,微信,,wechat--面包,牛奶--[TID:3],,
+2023/13/08 20:22:00,吃饭,支出,8.0,微信,,wechat--早餐--[TID:4],,
+2023/12/08 20:23:00,吃饭,未知,8.0,微信,,wechat--早餐--[TID:5],,
+2023/12/08 20:24:00,吃饭,支出,8.0,微信,,wechat--早餐,,
+
+2023/12/08 20:25:00,吃饭,支出,abc,微信,,wechat--早餐--[TID:6],,
+2023/12/08 20:26:00,吃饭,支出,9.9,微信,,wechat--早餐--[TID:7],不计收支,
+"""
+
+
+def test_parse_confirmed_row() -> None:
+    row = "2023/12/08 20:21:00,吃饭,支出,8.0,微信,,a,b--[TID:3],,".split(",")
+    t = parse_confirmed_row(row)
+    assert t.id == "3"
+    assert t.remark == "a,b--[TID:3]"
+    # 缺少最后的账单图片列也可以解析
+    row = "2023/12/08 20:21:00,吃饭,支出,8.0,微信,,[TID:4],".split(",")
+    assert parse_confirmed_row(row).id == "4"
+    with pytest.raises(ValueError):
+        parse_confirmed_row(row[:5])
+
+
+def test_import_confirmed_file(tmp_path, database) -> None:
+    path = tmp_path / "unconfirmed.csv"
+    path.write_text(CONFIRMED, encoding="utf-8")
+    reject_path = tmp_path / "rejected.csv"
+    chunks = []
+    result = import_confirmed_file(
+        str(path), str(reject_path), chunks.append, chunk_size=2
+    )
+    assert result == (4, 0, 0, 0, 4)
+    assert [[t.id for t in chunk] for chunk in chunks] == [
+        ["1", "2"],
+        ["3", "7"],
+    ]
+
+    stored = load_transactions_from_db(TranStatus.Classified)
+    assert sorted(stored) == ["1", "2", "3", "7"]
+    assert stored["2"].remark == "wechat--麦当劳,汉堡--[TID:2]"
+    assert stored["3"].remark == "wechat--面包,牛奶--[TID:3]"
+    assert stored["7"].dump().endswith(",不计收支,")
+    assert pending_count() == 4
+
+    with open(reject_path, encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0][:2] == ["行号", "错误"]
+    assert [row[0] for row in rows[1:]] == ["5", "6", "7", "9"]
+    assert "invalid time" in rows[1][1]
+    assert "missing TID" in rows[3][1]
+
+
+def test_import_without_rejects(tmp_path, database) -> None:
+    path = tmp_path / "unconfirmed.csv"
+    path.write_text("\n".join(CONFIRMED.splitlines()[:2]), encoding="utf-8")
+    reject_path = tmp_path / "rejected.csv"
+    assert import_confirmed_file(str(path), str(reject_path)) == (
+        1,
+        0,
+        0,
+        0,
+        0,
+    )
+    assert not reject_path.exists()
+
+
+# 待确认的交易，分类与确认时修改成的"吃饭"不同
+_raw = partial(make_transaction, classify="其它", remark="wechat--商品")
+
+
+def test_import_diff(tmp_path, database) -> None:
+    raw = [_raw(tid) for tid in ("1", "2", "3", "4")]
+    insert_transactions(raw, TranStatus.Raw)
+    record_exported(t.id for t in raw)
+
+    rows = [t.dump_fields() for t in raw]
+    # 修改第 2 条的分类，删掉第 4 条，再新增一条
+    rows[1][1] = "吃饭"
+    rows = rows[:3] + [_raw("5").dump_fields()]
+    path = tmp_path / "unconfirmed.csv"
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER.split(","))
+        writer.writerows(rows)
+
+    chunks = []
+    result = import_confirmed_file(
+        str(path), str(tmp_path / "rejected.csv"), chunks.extend
+    )
+    assert result == (1, 1, 2, 1, 0)
+    assert result.missing == 1
+    assert sorted(t.id for t in chunks) == ["2", "5"]
+
+    confirmed = load_transactions_from_db(TranStatus.Classified)
+    assert sorted(confirmed) == ["1", "2", "3", "5"]
+    assert confirmed["2"].classify == "吃饭"
+    assert confirmed["1"].classify == "其它"
+    assert sorted(load_transactions_from_db(TranStatus.Raw)) == ["4"]
+    assert pending_count() == 4
+
+
+def test_import_compares_current_rows(tmp_path, database) -> None:
+    raw = [_raw(tid) for tid in ("1", "2", "3")]
+    insert_transactions(raw, TranStatus.Raw)
+    record_exported([t.id for t in raw], now=100)
+    rows = [t.dump_fields() for t in raw[:2]]
+    # 导出后重新分类改了库中的第 1 条，文件中仍是导出时的内容
+    update_classify([("吃饭", raw[0].remark, "1")])
+    # 之后的导出才包含的交易不算作本文件缺少的交易
+    later = _raw("4")
+    insert_transactions([later], TranStatus.Raw)
+    record_exported([later.id], now=200)
+
+    path = tmp_path / "unconfirmed.csv"
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER.split(","))
+        writer.writerows(rows)
+    result = import_confirmed_file(str(path), str(tmp_path / "rejected.csv"))
+    assert result == (0, 1, 1, 1, 0)
+    stored = load_transactions_from_db(TranStatus.Classified)
+    assert stored["1"].classify == "其它"
+
+
+def test_confirm_edited_account(tmp_path, database) -> None:
+    raw = _raw("1")
+    raw._acc_from = ""
+    insert_transactions([raw], TranStatus.Raw)
+    # 确认时补上账户，并改了时间和账单标记
+    row = raw.dump_fields()
+    row[0] = "2023/12/08 20:19:03"
+    row[4] = "招商银行"
+    row[7] = TransactonFlag.NC.value
+    path = tmp_path / "unconfirmed.csv"
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER.split(","))
+        writer.writerow(row)
+    result = import_confirmed_file(str(path), str(tmp_path / "rejected.csv"))
+    assert result.changed == 1
+
+    (item,) = fetch_due()
+    assert item.transaction.dump_fields() == row
+    assert "&accountname=招商银行&" in item.transaction.dump_to_api()
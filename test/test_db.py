@@ -0,0 +1,92 @@
+import sqlite3
+
+from billing.const import TranStatus
+from billing.db import disable_transaction_cache
+from billing.db import enable_transaction_cache
+from billing.db import existing_ids
+from billing.db import get_connection
+from billing.db import get_db_path
+from billing.db import insert_transactions
+from billing.db import load_transactions_from_db
+from billing.db import update_classify
+from test.conftest import make_transaction
+
+
+def test_insert_transactions(database, tmp_path) -> None:
+    assert get_connection() is get_connection()
+    mode = get_connection().execute("PRAGMA journal_mode").fetchone()
+    assert mode[0] == "wal"
+
+    insert_transactions(
+        [
+            make_transaction("1", remark='say "hi"'),
+            make_transaction("2", remark="it's"),
+        ],
+        TranStatus.Raw,
+    )
+    insert_transactions(
+        [make_transaction("1", remark="x", cost=5.0)], TranStatus.Written
+    )
+    stored = load_transactions_from_db()
+    assert stored["1"].remark == "x--[TID:1]"
+    assert stored["1"].status == TranStatus.Written.value
+    assert stored["2"].remark == "it's--[TID:2]"
+    assert list(load_transactions_from_db(TranStatus.Raw)) == ["2"]
+
+    conn = sqlite3.connect(tmp_path / "billing.db")
+    assert conn.execute("SELECT COUNT(*) FROM transactions").fetchone() == (2,)
+    conn.close()
+
+
+def test_existing_ids(database, monkeypatch) -> None:
+    monkeypatch.setattr("billing.db.ID_BATCH_SIZE", 2)
+    insert_transactions(
+        [make_transaction(str(i), remark="r") for i in range(5)],
+        TranStatus.Raw,
+    )
+    assert existing_ids(["0", "3", "4", "9", "x"]) == {"0", "3", "4"}
+    assert existing_ids([]) == set()
+
+    plan = get_connection().execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM transactions WHERE status = 0"
+    )
+    assert "idx_transactions_status" in str(plan.fetchall())
+
+
+def test_transaction_cache(database) -> None:
+    insert_transactions([make_transaction("1", remark="r")], TranStatus.Raw)
+    cache = enable_transaction_cache()
+    assert list(load_transactions_from_db()) == ["1"]
+
+    later = make_transaction("2", remark="r")
+    later._time += 10
+    insert_transactions([later], TranStatus.Raw)
+    insert_transactions(
+        [make_transaction("1", remark="r")], TranStatus.Classified
+    )
+    update_classify([("买菜", "changed--[TID:2]", "2")])
+    assert "2" in cache
+    assert existing_ids(["1", "2", "3"]) == {"1", "2"}
+
+    cached = load_transactions_from_db()
+    disable_transaction_cache()
+    stored = load_transactions_from_db()
+    assert list(cached) == list(stored) == ["2", "1"]
+    for tid in stored:
+        assert cached[tid].dump_to_db() == stored[tid].dump_to_db()
+        assert cached[tid].status == stored[tid].status
+    assert list(load_transactions_from_db(TranStatus.Raw)) == ["2"]
+
+
+def test_transaction_cache_other_connection(database) -> None:
+    insert_transactions([make_transaction("1", remark="r")], TranStatus.Raw)
+    enable_transaction_cache()
+    assert load_transactions_from_db()["1"]._cost == 10.0
+
+    # 其他进程（例如 reclassify）的写入也要让缓存失效
+    conn = sqlite3.connect(get_db_path())
+    with conn:
+        conn.execute("UPDATE transactions SET cost = 12.5 WHERE id = '1'")
+    conn.close()
+    assert load_transactions_from_db()["1"]._cost == 12.5
+    assert existing_ids(["1"]) == {"1"}
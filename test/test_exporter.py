@@ -0,0 +1,83 @@
+import codecs
+import os
+
+import pytest
+
+from billing.const import HEADER
+from billing.const import TranStatus
+from billing.db import insert_transactions
+from billing.exporter import OutputExporter
+from test.conftest import make_transaction
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _read_lines(path):
+    with open(path, "rb") as f:
+        content = f.read()
+    assert content.startswith(codecs.BOM_UTF8)
+    return content[len(codecs.BOM_UTF8) :].decode("utf-8").split("\r\n")
+
+
+def test_export_months(tmp_path, database) -> None:
+    output_dir = str(tmp_path / "output")
+    transactions = [
+        make_transaction("1", "2023-06-30 23:59:59"),
+        make_transaction("2", "2023-07-01 00:00:00"),
+        make_transaction("3", "2023-07-15 12:00:00"),
+    ]
+    insert_transactions(transactions, TranStatus.Raw)
+    clock = FakeClock()
+    exporter = OutputExporter(output_dir, clock=clock)
+    exporter.mark_all_dirty()
+    assert exporter.flush(force=True) == 2
+    assert sorted(os.listdir(output_dir)) == [
+        "2023-06.csv",
+        "2023-07.csv",
+        "output.csv",
+    ]
+    june = os.path.join(output_dir, "2023-06.csv")
+    assert _read_lines(june) == [HEADER, transactions[0].dump()]
+    assert _read_lines(os.path.join(output_dir, "output.csv")) == [
+        HEADER,
+        transactions[2].dump(),
+        transactions[1].dump(),
+        transactions[0].dump(),
+    ]
+
+    # 连续的写入在 debounce 时间内只会合并成一次导出，且只重写变化的月份
+    june_mtime = os.stat(june).st_mtime_ns
+    for classify in ["买菜", "打车"]:
+        changed = make_transaction("3", "2023-07-15 12:00:00", classify)
+        insert_transactions([changed], TranStatus.Written)
+        exporter.mark_dirty([changed])
+        clock.now += 0.5
+        assert exporter.flush() == 0
+    clock.now += 1.0
+    assert exporter.flush() == 1
+    assert exporter.flush() == 0
+    assert os.stat(june).st_mtime_ns == june_mtime
+    july = _read_lines(os.path.join(output_dir, "2023-07.csv"))
+    assert july[1] == changed.dump()
+
+
+def test_export_max_delay(tmp_path, database) -> None:
+    clock = FakeClock()
+    exporter = OutputExporter(
+        str(tmp_path / "output"), combined=False, clock=clock
+    )
+    transaction = make_transaction("1", "2023-06-01 08:00:00")
+    insert_transactions([transaction], TranStatus.Raw)
+    for _ in range(20):
+        exporter.mark_dirty([transaction])
+        clock.now += 0.6
+        if exporter.flush():
+            break
+    assert clock.now == pytest.approx(10.2)
+    assert os.listdir(tmp_path / "output") == ["2023-06.csv"]
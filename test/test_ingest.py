@@ -0,0 +1,141 @@
+import os
+
+import pytest
+
+from billing.bill_loader import AlipayBillLoader
+from billing.bill_loader import LoaderDispatcher
+from billing.bill_loader import WeChatBillLoader
+from billing.bill_loader import registered_loaders
+from billing.bill_loader.base import stored_rule_data
+from billing.const import TranStatus
+from billing.db import get_connection
+from billing.db import insert_transactions
+from billing.db import is_bill_file_ingested
+from billing.db import record_bill_file
+from billing.file_utils import file_digest
+from billing.ingest import parse_bill_file
+from billing.ingest import parse_bill_files
+
+
+ALIPAY_BILL = """交易时间,交易分类,交易对方,对方账号,商品说明,收/支,金额,收/付款方式,交易状态,交易订单号,商家订单号,备注,
+2023-12-11 10:00:23,交通出行,高德打车,aut***@autonavi.com,退款-高德地图打车订单,不计收支,38.75,招商银行信用卡(0638),退款成功,2023121122001489491410688387_20231211100023_3026554	,0001N202312110000000004996629381	,,
+2023-12-11 10:00:21,交通出行,高德打车,aut***@autonavi.com,高德地图打车订单,支出,38.75,招商银行信用卡(0638),交易关闭,2023121122001489491410688387	,0001N202312110000000004996629381	,,
+2023-12-08 20:19:03,交通出行,高德打车,aut***@autonavi.com,高德地图打车订单,支出,16.60,招商银行信用卡(0638),交易成功,2023120822001489491457440137	,0003N202312080000000004969205443	,,
+"""
+
+ALIPAY_BILL2 = """交易时间,交易分类,交易对方,对方账号,商品说明,收/支,金额,收/付款方式,交易状态,交易订单号,商家订单号,备注,
+2023-12-08 20:19:03,交通出行,高德打车,aut***@autonavi.com,高德地图打车订单,支出,16.60,招商银行信用卡(0638),交易成功,2023120822001489491457440137	,0003N202312080000000004969205443	,,
+2023-10-05 19:04:08,日用百货,广州盒马,shh***@163.com,青岛啤酒,支出,45.50,招商银行信用卡(0638),交易成功,2023100522001189491415233828	,T200P1984800036541368984	,,
+"""
+
+WECHAT_BILL = """交易时间,交易类型,交易对方,商品,收/支,金额(元),支付方式,当前状态,交易单号,商户单号,备注
+2023-03-08 21:34:36,商户消费,麦当劳,"麦当劳",支出,¥13.90,招商银行(1908),支付成功,4200001754202303085118818875	,12553692042802585600	,"/"
+"""
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_parse_bill_files(
+    tmp_path, account_rules_list, classify_rules_list, workers
+) -> None:
+    alipay = AlipayBillLoader(account_rules_list, classify_rules_list)
+    wechat = WeChatBillLoader(account_rules_list, classify_rules_list)
+    jobs = []
+    for name, content, loader in [
+        ("alipay_record_20231212_000000.csv", ALIPAY_BILL, alipay),
+        ("alipay_record_20231213_000000.csv", ALIPAY_BILL2, alipay),
+        ("微信支付账单(20230101-20231231).csv", WECHAT_BILL, wechat),
+    ]:
+        path = tmp_path / name
+        path.write_bytes(content.encode(loader.encoding))
+        jobs.append((loader, str(path)))
+
+    ret = parse_bill_files(
+        jobs, {"2023100522001189491415233828"}, workers=workers
+    )
+    assert sorted(ret) == [
+        "2023120822001489491457440137",
+        "4200001754202303085118818875",
+    ]
+    assert ret["2023120822001489491457440137"].classify == "打车"
+    assert ret["4200001754202303085118818875"].classify == "吃饭"
+
+
+def test_loader_dispatcher(tmp_path, account_rules_list, classify_rules_list):
+    loaders = [
+        cls(account_rules_list, classify_rules_list)
+        for cls in registered_loaders()
+    ]
+    dispatcher = LoaderDispatcher(loaders)
+    for name in [
+        "alipay_record_20231212_000000.csv",
+        "微信支付账单(20230101-20231231).csv",
+        "unknown.csv",
+    ]:
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "alipay_record_20231213_000000.csv").mkdir()
+
+    found = {
+        os.path.basename(path): loader.name
+        for loader, path in dispatcher.scan(str(tmp_path))
+    }
+    assert found == {
+        "alipay_record_20231212_000000.csv": "alipay",
+        "微信支付账单(20230101-20231231).csv": "wechat",
+    }
+
+
+def test_known_ids_skip_rules(
+    tmp_path, account_rules_list, classify_rules_list
+) -> None:
+    loader = AlipayBillLoader(account_rules_list, classify_rules_list)
+    path = tmp_path / "alipay_record_20231213_000000.csv"
+    path.write_bytes(ALIPAY_BILL2.encode(loader.encoding))
+
+    classified = []
+    parse_classify = loader._parse_classify
+
+    def spy(line_data, type_):
+        classified.append(line_data[9])
+        return parse_classify(line_data, type_)
+
+    loader._parse_classify = spy  # type: ignore
+    ret = parse_bill_file(loader, str(path), {"2023120822001489491457440137"})
+    assert [t.id for t in ret] == ["2023100522001189491415233828"]
+    assert classified == ["2023100522001189491415233828"]
+
+
+def test_record_bill_file(database, tmp_path) -> None:
+    path = tmp_path / "alipay_record_20231213_000000.csv"
+    path.write_bytes(ALIPAY_BILL2.encode("gbk"))
+    digest = file_digest(str(path))
+    assert not is_bill_file_ingested(digest)
+
+    loader = AlipayBillLoader([], [])
+    transactions = parse_bill_file(loader, str(path))
+    record_bill_file(digest, str(path), loader.name, transactions)
+    assert is_bill_file_ingested(digest)
+    assert not is_bill_file_ingested(file_digest(__file__))
+
+
+def test_rule_data_stored(
+    database, tmp_path, account_rules_list, classify_rules_list
+) -> None:
+    path = tmp_path / "alipay_record_20231213_000000.csv"
+    path.write_bytes(ALIPAY_BILL2.encode("gbk"))
+    loader = AlipayBillLoader(account_rules_list, classify_rules_list)
+    transactions = parse_bill_file(loader, str(path))
+    insert_transactions(transactions, TranStatus.Raw)
+
+    rows = get_connection().execute(
+        "SELECT id, rule_data FROM transactions ORDER BY id"
+    )
+    stored = {tid: stored_rule_data([loader], data) for tid, data in rows}
+    assert stored["2023120822001489491457440137"] == (
+        loader,
+        {
+            "loader": "alipay",
+            "type_": "交通出行",
+            "counterparty": "高德打车",
+            "merchandise": "高德地图打车订单",
+        },
+    )
@@ -0,0 +1,101 @@
+import sqlite3
+
+import pytest
+
+from billing.migrations import MIGRATIONS
+from billing.migrations import Migration
+from billing.migrations import add_column
+from billing.migrations import migrate
+from billing.migrations import schema_version
+
+
+LEGACY_SCHEMA = """
+CREATE TABLE transactions (
+    id TEXT PRIMARY KEY,
+    time INTEGER NOT NULL,
+    classify TEXT NOT NULL,
+    type TEXT NOT NULL,
+    cost REAL NOT NULL,
+    acc_from TEXT NOT NULL,
+    acc_to TEXT,
+    remark TEXT,
+    flag TEXT,
+    pic TEXT,
+    status INTEGER
+);
+"""
+
+
+def _indexes(conn):
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' "
+        "AND tbl_name = 'transactions' AND name NOT LIKE 'sqlite_%'"
+    )
+    return sorted(row[0] for row in rows)
+
+
+def test_migrate_legacy_database(tmp_path) -> None:
+    conn = sqlite3.connect(tmp_path / "legacy.db")
+    conn.execute(LEGACY_SCHEMA)
+    conn.execute(
+        "INSERT INTO transactions VALUES "
+        "('1', 1700000000, '', '支出', 1.0, '微信', '', '', '', '', 0)"
+    )
+    conn.execute(
+        "CREATE INDEX idx_transactions_status ON transactions (status)"
+    )
+    conn.commit()
+
+    assert migrate(conn) == MIGRATIONS[-1].version
+    assert schema_version(conn) == MIGRATIONS[-1].version
+    assert _indexes(conn) == [
+        "idx_transactions_status_time",
+        "idx_transactions_time",
+    ]
+    assert conn.execute("SELECT COUNT(*) FROM transactions").fetchone() == (1,)
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM transactions "
+        "WHERE status = 0 ORDER BY time DESC"
+    ).fetchall()
+    assert "idx_transactions_status_time" in str(plan)
+    assert "TEMP B-TREE" not in str(plan)
+    # 已有的交易会补写进全文索引
+    assert conn.execute(
+        "SELECT d.id FROM transactions_fts "
+        "JOIN transactions_fts_docs AS d ON d.docid = transactions_fts.rowid "
+        "WHERE transactions_fts MATCH ?",
+        ('"微 信"',),
+    ).fetchall() == [("1",)]
+
+    # 再次执行不会重复迁移
+    assert migrate(conn) == MIGRATIONS[-1].version
+
+
+def test_migration_failure_rolls_back(tmp_path) -> None:
+    conn = sqlite3.connect(tmp_path / "billing.db")
+    migrate(conn)
+    version = schema_version(conn)
+
+    def add_hash(conn):
+        add_column(conn, "transactions", "row_hash", "TEXT")
+        add_column(conn, "transactions", "row_hash", "TEXT")
+
+    def broken(conn):
+        add_column(conn, "transactions", "broken", "TEXT")
+        conn.execute("SELECT * FROM missing_table")
+
+    migrations = MIGRATIONS + [
+        Migration(version + 1, "add row hash", add_hash),
+        Migration(version + 2, "broken", broken),
+    ]
+    with pytest.raises(sqlite3.OperationalError):
+        migrate(conn, migrations)
+    assert schema_version(conn) == version + 1
+    columns = [
+        row[1] for row in conn.execute("PRAGMA table_info(transactions)")
+    ]
+    assert "row_hash" in columns
+    assert "broken" not in columns
+
+    with pytest.raises(RuntimeError):
+        migrate(conn, MIGRATIONS)
@@ -0,0 +1,102 @@
+import pytest
+
+from billing.const import TranStatus
+from billing.db import enable_transaction_cache
+from billing.db import get_connection
+from billing.db import insert_transactions
+from billing.db import load_transactions_from_db
+from billing.outbox import BASE_BACKOFF
+from billing.outbox import CLAIM_LEASE
+from billing.outbox import MAX_BACKOFF
+from billing.outbox import fetch_due
+from billing.outbox import mark_failed
+from billing.outbox import mark_sent
+from billing.outbox import mark_unknown
+from billing.outbox import pending_count
+from test.conftest import make_transaction
+
+
+@pytest.fixture
+def database(database):
+    # 发件箱按开启交易缓存的方式运行
+    enable_transaction_cache()
+
+
+def _next_retry(tid):
+    return (
+        get_connection()
+        .execute("SELECT next_retry FROM adb_outbox WHERE id = ?", (tid,))
+        .fetchone()[0]
+    )
+
+
+def test_outbox(database) -> None:
+    insert_transactions([make_transaction("0")], TranStatus.Raw)
+    insert_transactions(
+        [make_transaction("1"), make_transaction("2")],
+        TranStatus.Classified,
+        outbox=True,
+    )
+    assert pending_count() == 2
+    now = 2000000000
+    items = fetch_due(now=now)
+    assert [(i.transaction.id, i.attempts) for i in items] == [
+        ("1", 0),
+        ("2", 0),
+    ]
+    assert items[0].transaction.status == TranStatus.Classified.value
+
+    mark_failed("1", "error: device offline", now=now)
+    assert _next_retry("1") == now + BASE_BACKOFF
+    mark_failed("1", "error: device offline", now=now)
+    assert _next_retry("1") == now + BASE_BACKOFF * 2
+    # "2" 已经取出，还没有发送结果
+    assert fetch_due(now=now) == []
+
+    mark_sent(["2"])
+    stored = load_transactions_from_db()
+    assert stored["2"].status == TranStatus.Written.value
+    assert stored["1"].status == TranStatus.Classified.value
+    assert fetch_due(now=now) == []
+
+    items = fetch_due(now=now + BASE_BACKOFF * 2)
+    assert [(i.transaction.id, i.attempts) for i in items] == [("1", 2)]
+    for _ in range(20):
+        mark_failed("1", "error", now=now)
+    assert _next_retry("1") == now + MAX_BACKOFF
+
+    # 重新确认的交易会重置重试状态
+    insert_transactions(
+        [make_transaction("1")], TranStatus.Classified, outbox=True
+    )
+    assert [i.attempts for i in fetch_due()] == [0]
+    assert pending_count() == 1
+
+
+def test_outbox_claim(database) -> None:
+    insert_transactions(
+        [make_transaction("1")], TranStatus.Classified, outbox=True
+    )
+    now = 2000000000
+    assert [i.transaction.id for i in fetch_due(now=now)] == ["1"]
+    # 前一轮还在发送时，下一轮取不到同一笔交易
+    assert fetch_due(now=now + 1) == []
+    # 发送中途退出时，租约过期后重新发送
+    items = fetch_due(now=now + CLAIM_LEASE)
+    assert [i.transaction.id for i in items] == ["1"]
+
+
+def test_outbox_unknown(database) -> None:
+    insert_transactions(
+        [make_transaction("1")], TranStatus.Classified, outbox=True
+    )
+    now = 2000000000
+    assert len(fetch_due(now=now)) == 1
+    mark_unknown("1", "timeout")
+    # 结果未知的交易不再自动重试，重新确认后回到发件箱
+    assert fetch_due(now=now + MAX_BACKOFF * 100) == []
+    assert pending_count() == 1
+    insert_transactions(
+        [make_transaction("1")], TranStatus.Classified, outbox=True
+    )
+    assert [i.transaction.id for i in fetch_due()] == ["1"]
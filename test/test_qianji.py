@@ -0,0 +1,32 @@
+from billing.const import TransactionType
+from billing.const import TransactonFlag
+from billing.qianji.qianji import QianjiTransaction
+
+
+def _transaction(classify, account, **kwargs):
+    return QianjiTransaction(
+        1700000000,
+        classify,
+        TransactionType.Expense,
+        10.0,
+        account,
+        "",
+        TransactonFlag.Empty,
+        "wechat--麦当劳--商品--[TID:4200001754202303085118818875]",
+        **kwargs,
+    )
+
+
+def test_compact_transaction() -> None:
+    first = _transaction("吃饭".encode().decode(), "微信".encode().decode())
+    second = _transaction("吃饭".encode().decode(), "微信".encode().decode())
+    assert not hasattr(first, "__dict__")
+    assert first.id == "4200001754202303085118818875"
+    assert first.classify is second.classify
+    assert first.dump_to_db()[5] is second.dump_to_db()[5]
+
+    assert first.extra_info == {}
+    first.extra_info["merchant_order_number"] = "1"
+    assert first.extra_info == {"merchant_order_number": "1"}
+    third = _transaction("吃饭", "微信", extra_info={"a": 1}, tid="x")
+    assert (third.id, third.extra_info) == ("x", {"a": 1})
@@ -0,0 +1,149 @@
+import os
+
+from itertools import chain
+
+import pytest
+
+from billing.bill_loader import WeChatBillLoader
+from billing.cli import main
+from billing.const import TransactionType
+from billing.const import TransactonFlag
+from billing.const import TranStatus
+from billing.db import get_db_path
+from billing.db import insert_transactions
+from billing.db import iter_transaction_chunks
+from billing.db import load_transactions_from_db
+from billing.db import set_db_path
+from billing.qianji.qianji import QianjiTransaction
+from billing.reclassify import reclassify
+from billing.rule_report import merge_profiles
+from billing.rule_report import profile_transactions
+from test.conftest import create_legacy_database
+
+
+def _transaction(
+    tid,
+    counterparty,
+    classify="",
+    type_=TransactionType.Expense,
+    bill_type="商户消费",
+    auto=True,
+):
+    remark = f"wechat--{counterparty}--商品--[TID:{tid}]"
+    if classify and auto:
+        remark += "[auto]"
+    rule_data = {
+        "loader": "wechat",
+        "type_": bill_type,
+        "counterparty": counterparty,
+        "merchandise": "商品",
+    }
+    return QianjiTransaction(
+        1700000000,
+        classify,
+        type_,
+        10.0,
+        "微信",
+        "",
+        TransactonFlag.Empty,
+        remark,
+        extra_info={"rule_data": rule_data} if bill_type else None,
+    )
+
+
+@pytest.fixture
+def database(database):
+    insert_transactions(
+        [
+            _transaction("1", "麦当劳"),
+            _transaction("2", "广州盒马"),
+            _transaction("3", "未知商户"),
+            _transaction("4", "旧分类", "吃饭"),
+            # 依赖原始交易类型的规则，重新分类时仍然命中
+            _transaction("7", "高德打车", "打车", bill_type="交通出行"),
+            # 旧版本入库、没有保存规则输入的交易保持不变
+            _transaction("8", "麦当劳", "买菜", bill_type=""),
+            # 手动填了与规则相同的分类，只补上 [auto] 标记
+            _transaction("9", "麦当劳", "吃饭", auto=False),
+        ],
+        TranStatus.Raw,
+    )
+    insert_transactions(
+        [
+            _transaction("5", "麦当劳", "买菜"),
+            QianjiTransaction(
+                1700000000,
+                "买菜",
+                TransactionType.Expense,
+                1.0,
+                "微信",
+                "",
+                TransactonFlag.Empty,
+                "wechat--麦当劳--商品--[TID:6]",
+            ),
+        ],
+        TranStatus.Classified,
+    )
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_reclassify(database, classify_rules_list, workers) -> None:
+    result = reclassify(classify_rules_list, chunk_size=2, workers=workers)
+    assert (
+        result.scanned,
+        result.checked,
+        result.skipped,
+        result.changed,
+        result.remarked,
+    ) == (7, 6, 1, 3, 1)
+    stored = load_transactions_from_db()
+    assert stored["1"].classify == "吃饭"
+    assert stored["1"].remark.endswith("[auto]")
+    assert stored["2"].classify == "买菜"
+    assert stored["3"].classify == ""
+    assert stored["4"].classify == ""
+    assert stored["4"].remark == "wechat--旧分类--商品--[TID:4]"
+    assert stored["5"].classify == "买菜"
+    assert stored["7"].classify == "打车"
+    assert stored["8"].classify == "买菜"
+    assert stored["9"].remark.endswith("[auto]")
+
+    result = reclassify(
+        classify_rules_list, include_auto=True, workers=workers
+    )
+    assert result.changed == 1
+    stored = load_transactions_from_db()
+    assert stored["5"].classify == "吃饭"
+    assert stored["6"].classify == "买菜"
+
+
+def test_profile_transactions(database, classify_rules_list) -> None:
+    loaders = [WeChatBillLoader([], classify_rules_list)]
+    loaders[0].enable_rule_profiling()
+    rows = chain.from_iterable(iter_transaction_chunks(list(TranStatus)))
+    assert profile_transactions(loaders, rows) == (7, 2)
+    rule_set = loaders[0].rule_sets()["classify"]
+    merged = merge_profiles([rule_set])
+    # 依赖原始交易类型的打车规则仍然能统计到命中
+    index = next(
+        i
+        for i, rule in enumerate(rule_set.rule_list)
+        if rule["output_id"] == "打车"
+    )
+    assert merged[index][1] == 1
+
+
+def test_reclassify_cli_old_database(tmp_path, capsys) -> None:
+    # 没有 rule_data 列的旧数据库，cli 会先执行迁移
+    path = tmp_path / "old.db"
+    create_legacy_database(str(path), "wechat--麦当劳--商品")
+    rules = os.path.join(
+        os.path.dirname(__file__), "test_config", "category_rules.json"
+    )
+    argv = ["--db-path", str(path), "reclassify", "--classify-rules", rules]
+    old_path = get_db_path()
+    try:
+        assert main(argv + ["--workers", "1"]) == 0
+    finally:
+        set_db_path(old_path)
+    assert "[skipped=1][changed=0]" in capsys.readouterr().out
@@ -0,0 +1,102 @@
+import json
+import os
+
+import pytest
+
+from billing.bill_loader import WeChatBillLoader
+from billing.rules import RuleFile
+from billing.rules import RuleSetManager
+
+
+RULES = [
+    {
+        "conditions": [
+            {
+                "operator": "in",
+                "expect_value": "麦当劳",
+                "field_to_check": "counterparty",
+            }
+        ],
+        "output_id": "吃饭",
+    }
+]
+
+
+def _write(path, content: str, mtime_ns: int) -> None:
+    with open(path, "w", encoding="utf-8") as fp:
+        fp.write(content)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_rule_file_reload(tmp_path) -> None:
+    path = tmp_path / "rules.json"
+    _write(path, json.dumps(RULES), 1_000_000_000)
+    rule_file = RuleFile(str(path))
+    assert rule_file.refresh()
+    assert rule_file.rules == RULES
+    assert not rule_file.refresh()
+
+    # 只改了修改时间，内容哈希不变
+    _write(path, json.dumps(RULES), 2_000_000_000)
+    assert not rule_file.refresh()
+
+    # 写了一半的文件不会覆盖已有规则
+    _write(path, json.dumps(RULES)[:-5], 3_000_000_000)
+    assert not rule_file.refresh()
+    assert rule_file.rules == RULES
+
+    _write(
+        path, json.dumps(RULES * 2 + [dict(RULES[0], order=1)]), 4_000_000_000
+    )
+    assert rule_file.refresh()
+    assert len(rule_file.rules) == 2
+
+
+def test_rule_set_manager_keeps_loaders(tmp_path) -> None:
+    account_path = tmp_path / "account.json"
+    classify_path = tmp_path / "classify.json"
+    _write(account_path, "[]", 1_000_000_000)
+    _write(classify_path, "[]", 1_000_000_000)
+    manager = RuleSetManager(
+        str(account_path), str(classify_path), [WeChatBillLoader]
+    )
+    loader = manager.loaders[0]
+    assert not manager.refresh()
+
+    _write(classify_path, json.dumps(RULES), 2_000_000_000)
+    assert manager.refresh()
+    assert manager.loaders[0] is loader
+    line = '2023-03-08 21:34:36,商户消费,麦当劳,"麦当劳",支出,¥13.90,零钱,支付成功,42000017	,12553692	,"/"'
+    assert loader._parse_line(line).classify == "吃饭"
+
+
+def test_rule_file_missing(tmp_path) -> None:
+    path = tmp_path / "account.json"
+    with pytest.raises(FileNotFoundError):
+        RuleSetManager(str(path), str(path), [WeChatBillLoader])
+
+    rule_file = RuleFile(str(path))
+    assert not rule_file.refresh()
+    assert rule_file._missing
+    _write(path, json.dumps(RULES), 1_000_000_000)
+    assert rule_file.refresh()
+    assert not rule_file._missing
+
+
+def test_rule_file_unreadable(tmp_path) -> None:
+    path = tmp_path / "rules.json"
+    _write(path, json.dumps(RULES), 1_000_000_000)
+    rule_file = RuleFile(str(path))
+    assert rule_file.refresh()
+
+    # stat 成功但 open 失败：路径被换成了目录
+    os.remove(path)
+    os.mkdir(path)
+    assert not rule_file.refresh()
+    assert rule_file._missing
+    assert rule_file.rules == RULES
+
+    os.rmdir(path)
+    _write(path, json.dumps(RULES * 2), 2_000_000_000)
+    assert rule_file.refresh()
+    assert not rule_file._missing
@@ -0,0 +1,105 @@
+import sqlite3
+
+from datetime import datetime
+
+import pytest
+
+from billing.cli import main
+from billing.const import TranStatus
+from billing.db import get_connection
+from billing.db import get_db_path
+from billing.db import insert_transactions
+from billing.db import set_db_path
+from billing.db import update_classify
+from billing.fts import build_match
+from billing.search import search_transactions
+from test.conftest import create_legacy_database
+from test.conftest import make_transaction
+
+
+def _transaction(tid, when, counterparty, merchandise, account="微信"):
+    remark = f"alipay--{counterparty}--{merchandise}"
+    return make_transaction(tid, when, "", account=account, remark=remark)
+
+
+@pytest.fixture
+def database(database):
+    insert_transactions(
+        [
+            _transaction("1", "2023-10-05 19:04:08", "广州盒马", "青岛啤酒"),
+            _transaction("2", "2023-12-08 20:19:03", "高德打车", "打车订单"),
+            _transaction(
+                "3", "2023-12-11 10:00:21", "高德打车", "高德地图打车订单"
+            ),
+            _transaction(
+                "4", "2023-12-12 08:00:00", "盒马鲜生", "牛奶", "招商银行"
+            ),
+        ],
+        TranStatus.Raw,
+    )
+
+
+def _ids(hits):
+    return [hit.id for hit in hits]
+
+
+def test_build_match() -> None:
+    assert build_match('盒马 "青岛 啤酒" wech*') == (
+        '"盒 马" AND "青 岛 啤 酒" AND "wech" *'
+    )
+    assert build_match('  "" * ') == ""
+
+
+def test_search(database) -> None:
+    assert sorted(_ids(search_transactions("盒马"))) == ["1", "4"]
+    assert _ids(search_transactions('"青岛啤酒"')) == ["1"]
+    assert _ids(search_transactions("盒马 牛奶")) == ["4"]
+    assert _ids(search_transactions("alip*", limit=1)) == ["4"]
+    # 商户名命中的权重高于只在商品说明中出现
+    assert _ids(search_transactions("高德"))[0] == "3"
+
+    start = int(datetime(2023, 12, 10).timestamp())
+    assert _ids(search_transactions("高德", start=start)) == ["3"]
+    assert _ids(search_transactions("盒马", account="招商银行")) == ["4"]
+    assert search_transactions("盒马", status=TranStatus.Written) == []
+
+
+def test_search_index_follows_updates(database) -> None:
+    update_classify([("买菜", "manual--山姆会员店--[TID:1]", "1")])
+    assert _ids(search_transactions("盒马")) == ["4"]
+    assert _ids(search_transactions("山姆")) == ["1"]
+    assert _ids(search_transactions("买菜")) == ["1"]
+    get_connection().execute("DELETE FROM transactions WHERE id = '4'")
+    assert search_transactions("盒马") == []
+
+
+def test_search_index_other_connection(database) -> None:
+    # 其他连接没有注册任何函数，写入 transactions 也不能失败
+    conn = sqlite3.connect(get_db_path())
+    with conn:
+        conn.execute("UPDATE transactions SET cost = 1.0 WHERE id = '2'")
+        conn.execute("DELETE FROM transactions WHERE id = '1'")
+    conn.execute("VACUUM")
+    conn.close()
+    assert _ids(search_transactions("盒马")) == ["4"]
+    assert sorted(_ids(search_transactions("高德"))) == ["2", "3"]
+
+
+def test_search_cli(database, capsys) -> None:
+    argv = ["--db-path", get_db_path(), "search", "高德", "--end", "2023-12"]
+    assert main(argv + ["--status", "Raw"]) == 0
+    out = capsys.readouterr().out
+    assert "[search][count=2]" in out
+    assert "2023/12/11 10:00:21\tRaw\t10.00" in out
+
+
+def test_search_cli_migrates(tmp_path, capsys) -> None:
+    # 守护进程还没有升级过的数据库，cli 会先执行迁移
+    path = tmp_path / "old.db"
+    create_legacy_database(str(path), "alipay--广州盒马--牛奶")
+    old_path = get_db_path()
+    try:
+        assert main(["--db-path", str(path), "search", "盒马"]) == 0
+    finally:
+        set_db_path(old_path)
+    assert "[search][count=1]" in capsys.readouterr().out
@@ -0,0 +1,91 @@
+import asyncio
+import csv
+import os
+
+from billing.adb import AdbSession
+from billing.aio import AsyncIO
+from billing.const import HEADER
+from billing.const import TransactionType
+from billing.const import TransactonFlag
+from billing.qianji.qianji import QianjiTransaction
+from billing.sinks import AdbIntentSink
+from billing.sinks import QianjiCsvSink
+
+
+FAKE_ADB = os.path.join(os.path.dirname(__file__), "fake_adb", "adb")
+
+
+def _transaction(tid, remark="麦当劳"):
+    return QianjiTransaction(
+        1700000000,
+        "吃饭",
+        TransactionType.Expense,
+        13.9,
+        "微信",
+        "",
+        TransactonFlag.Empty,
+        f"wechat--{remark}--[TID:{tid}]",
+    )
+
+
+def test_dump_to_api_book_name() -> None:
+    t = _transaction("1")
+    assert t.dump_to_api().endswith("&bookname=日常账本")
+    assert t.dump_to_api("旅行").endswith("&bookname=旅行")
+
+
+def test_adb_intent_sink(tmp_path, monkeypatch) -> None:
+    log = tmp_path / "am.log"
+    monkeypatch.setenv("FAKE_AM_LOG", str(log))
+    monkeypatch.setenv("FAKE_AM_FAIL", "TID:2")
+    transactions = [_transaction(str(i)) for i in range(1, 4)]
+
+    async def run():
+        sink = AdbIntentSink(AdbSession([FAKE_ADB, "shell"], pace=0), "旅行")
+        try:
+            return await sink.send(transactions)
+        finally:
+            await sink.close()
+
+    result = asyncio.run(run())
+    assert [t.id for t in result.sent] == ["1", "3"]
+    assert [(t.id, "Error" in e) for t, e in result.failed] == [("2", True)]
+    urls = log.read_text(encoding="utf-8").splitlines()
+    assert all(url.endswith("&bookname=旅行") for url in urls)
+
+
+def test_adb_intent_sink_disconnected() -> None:
+    async def run():
+        session = AdbSession([FAKE_ADB, "shell", "exit", "1"])
+        sink = AdbIntentSink(session)
+        return await sink.send([_transaction("1"), _transaction("2")])
+
+    result = asyncio.run(run())
+    assert result.sent == []
+    # 已经写入会话的第一条结果未知，不能当作失败重发
+    assert [t.id for t, _ in result.unknown] == ["1"]
+    assert [t.id for t, _ in result.failed] == ["2"]
+
+
+def test_qianji_csv_sink(tmp_path) -> None:
+    transactions = [_transaction("1", "a,b"), _transaction("2")]
+
+    async def run():
+        aio = AsyncIO(io_workers=1)
+        try:
+            sink = QianjiCsvSink(aio, str(tmp_path / "import"), "旅行")
+            return await sink.send(transactions)
+        finally:
+            aio.shutdown()
+
+    result = asyncio.run(run())
+    assert result.sent == transactions
+    assert result.failed == result.unknown == []
+    (name,) = os.listdir(tmp_path / "import")
+    assert name.startswith("旅行-") and name.endswith("-001.csv")
+    with open(
+        tmp_path / "import" / name, encoding="utf-8-sig", newline=""
+    ) as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == HEADER.split(",")
+    assert rows[1:] == [t.dump_fields() for t in transactions]
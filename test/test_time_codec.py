@@ -0,0 +1,59 @@
+import os
+import random
+import time
+
+from datetime import datetime
+
+import pytest
+
+from billing.time_codec import TimestampCodec
+
+
+@pytest.fixture(params=["Asia/Shanghai", "America/New_York", "UTC"])
+def local_tz(request):
+    old = os.environ.get("TZ")
+    os.environ["TZ"] = request.param
+    time.tzset()
+    yield request.param
+    if old is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = old
+    time.tzset()
+
+
+def test_codec_matches_datetime(local_tz) -> None:
+    codec = TimestampCodec("/")
+    dash = TimestampCodec("-")
+    rng = random.Random(0)
+    timestamps = [rng.randrange(946684800, 1893456000) for _ in range(5000)]
+    # 覆盖美国东部时间 2023 年的两次夏令时切换
+    timestamps += list(range(1678604400, 1678611600, 599))
+    timestamps += list(range(1699160400, 1699171200, 599))
+    for ts in timestamps:
+        text = datetime.fromtimestamp(ts).strftime("%Y/%m/%d %H:%M:%S")
+        assert codec.format(ts) == text
+        assert dash.format(ts) == text.replace("/", "-")
+        expected = int(
+            datetime.strptime(text, "%Y/%m/%d %H:%M:%S").timestamp()
+        )
+        assert codec.parse(text) == expected
+        assert codec.parse(text.replace("/", "-")) == expected
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "交易时间",
+        "2023-12-08 20:19:3",
+        "2023-12-08T20:19:03",
+        "2023-12/08 20:19:03",
+        "2023-13-08 20:19:03",
+        "2023-02-30 20:19:03",
+        "2023-12-08 24:00:00",
+        "２０２３-12-08 20:19:03",
+    ],
+)
+def test_codec_invalid(text) -> None:
+    assert TimestampCodec().parse(text) == 0
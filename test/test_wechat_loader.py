@@ -30,6 +30,12 @@ def test_wechat_expense2(wechat_loader: WeChatBillLoader) -> None:
     assert wechat_loader._parse_classify(line_data, type_) == "充电费"
 
 
+def test_wechat_cost_fullwidth_yen(wechat_loader: WeChatBillLoader) -> None:
+    for text in ("¥13.90", "￥13.90", " ￥13.90 "):
+        line_data = ["", "", "", "", "支出", text]
+        assert wechat_loader._parse_cost(line_data) == 13.9
+
+
 def test_wechat_income(wechat_loader: WeChatBillLoader) -> None:
     test_data = '2023-09-05 14:10:57,群收款,xxx,"/",收入,¥17.75,/,已存入零钱,1000049501230905024203390023801596874984	,/	,"/"'
     line_data = test_data.split(",")
@@ -74,3 +80,21 @@ def test_wechat_transfer(wechat_loader: WeChatBillLoader) -> None:
     data = wechat_loader._parse_line(test_data)
 
     assert data.dump() == "2023/04/06 12:20:44,,转账,242.72,微信,招行工资卡(0702),wechat--招商银行(2508)--/--[TID:207230406100381248159221389],,"
+
+
+def test_wechat_header_plan(wechat_loader: WeChatBillLoader) -> None:
+    test_data = """微信支付账单明细,,,,,,,,,,
+交易类型,交易时间,交易对方,商品,收/支,金额(元),支付方式,当前状态,备注,交易单号,商户单号
+商户消费,2023-03-08 21:34:36,麦当劳,"麦辣鸡腿堡,中薯条",支出,¥13.90,招商银行(1908),支付成功,"/",4200001754202303085118818875	,12553692042802585600	
+"""
+    ret = wechat_loader.parse_file_content(test_data)
+    assert len(ret) == 1
+    data = ret[0]
+    assert data.id == "4200001754202303085118818875"
+    assert data.classify == "吃饭"
+    assert data._cost == 13.9
+    assert data._acc_from == "招行信用卡(0638)"
+    assert data.remark == (
+        "wechat--麦当劳--麦辣鸡腿堡，中薯条"
+        "--[TID:4200001754202303085118818875][auto]"
+    )